@@ -7,13 +7,16 @@ Or download the Legacy Format Stream that includes both video and audio at a low
 @author: Sahand
 """
 
+from ytdl import startup
+startup.begin()  # Before any other import so --startup-report can time them
+
 import os
 import threading
 import re
 import subprocess
 import sys
-from pytubefix import YouTube
 import customtkinter as ctk
+from ytdl.policy import StreamIndex
 
 # Constants for configuration
 DEFAULT_FONT = ("Comfortaa", 16)
@@ -134,14 +137,13 @@ def fetch_details(url):
         return None
 
     try:
+        from pytubefix import YouTube  # Loaded lazily (and prewarmed) so the window appears first
         yt = YouTube(url)  # Create a YouTube object
         toggle_info_section(True)  # Show video info section
 
         # Get various streams
-        full_stream = yt.streams.get_highest_resolution(progressive=True)  # Full video stream
-        video_stream = yt.streams.get_highest_resolution(progressive=False)  # Video stream without audio
-        audio_streams = yt.streams.filter(only_audio=True)  # Audio-only streams
-        highest_bitrate_stream = max(audio_streams, key=lambda stream: int(stream.abr.replace('kbps', '')))  # Highest bitrate audio stream
+        # Full video stream, video stream without audio and highest bitrate audio stream
+        full_stream, video_stream, highest_bitrate_stream = StreamIndex(yt.streams).select()
         
         # Update the labels with video details
         title_label.configure(text=f"{yt.title}")
@@ -273,5 +275,9 @@ frame.columnconfigure(0, weight=1)
 frame.columnconfigure(1, weight=1)
 frame.columnconfigure(2, weight=1)
 
+# Record time-to-first-frame, then load pytubefix in the background for the first lookup
+startup.mark("window built")
+startup.first_frame(app, prewarm_modules=["pytubefix"])
+
 # Start the main event loop to run the application
 app.mainloop()
\ No newline at end of file
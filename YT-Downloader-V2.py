@@ -6,32 +6,89 @@ Or download the Legacy Format Stream that includes both video and audio at a low
 @author: Sahand
 """
 
+from ytdl import startup
+startup.begin()  # Before any other import so --startup-report can time them
+
+import multiprocessing
 import os
-import threading
-import re
 import subprocess
 import sys
-from pytubefix import YouTube
+import threading
+from tkinter import filedialog
 import customtkinter as ctk
+from ytdl.bandwidth import BULK, URGENT, BandwidthScheduler, RateWindow, parse_rate
+from ytdl.buffers import BufferPool
+from ytdl.cache import DEFAULT_CACHE_PATH, ManifestCache, video_id_from_url
+from ytdl.extras import ExtrasFetcher
+from ytdl.history import DEFAULT_HISTORY_PATH, DownloadHistory
+from ytdl.manager import DownloadManager, QUEUED, DOWNLOADING, DONE, FAILED
+from ytdl.metadata import DOWNLOAD_TYPES, MetadataResolver, is_valid_youtube_url
+from ytdl.naming import OutputNaming
+from ytdl.playlist import is_collection_url
+from ytdl.policy import StreamPolicy, parse_size
+from ytdl.progress import describe, format_bytes
+from ytdl.segmented import SegmentedDownloader
+from ytdl.session import HttpSession, route_pytubefix
+from ytdl.transcode import Transcoder
 
 # Constants for configuration
 DEFAULT_FONT = ("Comfortaa", 16)
 VIDEO_ID_LENGTH = 11
-URL_PATTERNS = [
-    r'^https?://(?:www\.)?youtube\.com/watch\?v=[\w-]{11}$',
-    r'^https?://(?:www\.)?youtube\.com/shorts/[\w-]{11}$'
-]
-DOWNLOAD_TYPES = {
-    "legacy": "legacy.mp4",
-    "mp4": "video.mp4",
-    "mp3": "audio.mp3"
-}
+MANIFEST_CACHE_PATH = DEFAULT_CACHE_PATH
+HISTORY_PATH = DEFAULT_HISTORY_PATH  # Index of completed downloads, set to None to always download again
+OUTPUT_DIR = os.getcwd()
+OUTPUT_TEMPLATE = "{title}-{id}-{itag}.{ext}"  # Fields: title, id, itag, ext, type, resolution, abr
+MAX_PARALLEL_DOWNLOADS = 3
+MAX_RETRIES = 3
+SEGMENTED_CONNECTIONS = 4  # Parallel range requests per stream, set to 0 to use pytubefix's single connection
+SEGMENT_SIZE = 8 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024  # Bytes per network read
+BUFFER_MEMORY = None  # e.g. "256M" of read buffers shared by all downloads, at least two segments; None for no cap
+MAX_CONNECTIONS_PER_HOST = 16  # Keep-alive connections shared by metadata lookups and downloads
+USE_HTTP2 = False  # Needs httpx with h2 installed
+AUDIO_FORMAT = "mp3"  # mp3, opus or aac
+AUDIO_BITRATE = "192k"
+STREAM_POLICY = ""  # e.g. "<=1080p, prefer av1, cap 2GB", empty for the highest quality available
+BANDWIDTH_LIMIT = None  # e.g. "5M" bytes per second shared by all downloads, None for no cap
+BANDWIDTH_WINDOWS = []  # e.g. ["09:00-18:00=1M", "18:00-09:00=none"]
+EXTRAS = []  # Also saved next to each download: "thumbnail", "captions", "metadata"
+PROGRESS_REFRESH_MS = 200  # Progress bars are redrawn at most this often, however many chunks arrive
 
 class YouTubeDownloader:
     def __init__(self, app):
         self.app = app
-        self.downloading = False
+        self.details = None
+        self.resolving_url = None
+        self.current_job = None
+        self.job_rows = {}
+        self.progress_lock = threading.Lock()
+        self.progress_pending = {}
+        self.progress_scheduled = False
+        self.session = HttpSession(MAX_CONNECTIONS_PER_HOST, http2=USE_HTTP2)
+        route_pytubefix(self.session)  # Metadata lookups reuse the same connections as downloads
+        self.resolver = MetadataResolver(cache=ManifestCache(path=MANIFEST_CACHE_PATH))
+        buffers = BufferPool.for_budget(parse_size(BUFFER_MEMORY) if BUFFER_MEMORY else None, CHUNK_SIZE)
+        segmented = SegmentedDownloader(SEGMENTED_CONNECTIONS, SEGMENT_SIZE, session=self.session,
+                                        chunk_size=CHUNK_SIZE, buffers=buffers) if SEGMENTED_CONNECTIONS else None
+        self.transcoder = Transcoder(AUDIO_FORMAT, AUDIO_BITRATE)
+        self.manager = DownloadManager(
+            max_workers=MAX_PARALLEL_DOWNLOADS,
+            max_retries=MAX_RETRIES,
+            cache=self.resolver.cache,
+            output_dir=OUTPUT_DIR,
+            naming=OutputNaming(OUTPUT_TEMPLATE),
+            history=DownloadHistory(HISTORY_PATH) if HISTORY_PATH else None,
+            policy=StreamPolicy.parse(STREAM_POLICY) if STREAM_POLICY else None,
+            bandwidth=BandwidthScheduler(parse_rate(BANDWIDTH_LIMIT), [RateWindow.parse(window) for window in BANDWIDTH_WINDOWS]),
+            segmented=segmented,
+            transcoder=self.transcoder,
+            on_update=lambda job: self.app.after(0, self.on_job_update, job),
+            on_collection=lambda url, count, error: self.app.after(0, self.on_collection_done, url, count, error),
+            on_progress=self.queue_progress,
+            extras=ExtrasFetcher(EXTRAS, session=self.session) if EXTRAS else None,
+        )
         self.setup_ui()
+        self.app.protocol("WM_DELETE_WINDOW", self.on_close)
 
     def setup_ui(self):
         # Set the appearance mode and color theme for the UI
@@ -40,7 +97,7 @@ class YouTubeDownloader:
 
         # Create the main application window
         self.app.title("YouTube Downloader")
-        self.app.geometry("600x450")
+        self.app.geometry("600x700")
         self.app.resizable(False, False)
 
         # Create a frame to hold UI elements
@@ -49,11 +106,11 @@ class YouTubeDownloader:
 
         # Add an entry field for users to paste YouTube URL
         self.entry = ctk.CTkEntry(self.frame, placeholder_text="Paste YouTube URL & Press Enter", font=DEFAULT_FONT, text_color="lightblue")
-        self.entry.grid(row=0, column=0, columnspan=3, pady=10, padx=20, sticky="ew")
+        self.entry.grid(row=0, column=0, columnspan=4, pady=10, padx=20, sticky="ew")
 
         # Create a frame for displaying video information
         self.info_frame = ctk.CTkFrame(self.frame)
-        self.info_frame.grid(row=1, column=0, columnspan=3, pady=10, padx=20, sticky="nsew")
+        self.info_frame.grid(row=1, column=0, columnspan=4, pady=10, padx=20, sticky="nsew")
 
         # Initialize labels for displaying video information
         self.title_label = self.create_wrapped_label(self.info_frame, "Title:")
@@ -77,13 +134,34 @@ class YouTubeDownloader:
         self.button3.grid(row=4, column=2, padx=5, pady=5, sticky="ew")
         self.button3.configure(state=ctk.DISABLED)
 
+        self.button4 = self.create_button("Best (merged)", lambda: self.download("best"))
+        self.button4.grid(row=4, column=3, padx=5, pady=5, sticky="ew")
+        self.button4.configure(state=ctk.DISABLED)
+
+        # Import a list of URLs into the download queue, saved with the chosen type
+        self.import_button = self.create_button("Import URLs…", self.import_urls)
+        self.import_button.grid(row=5, column=0, padx=5, pady=5, sticky="ew")
+        self.batch_type = ctk.CTkOptionMenu(self.frame, values=list(DOWNLOAD_TYPES), font=("Comfortaa", 13))
+        self.batch_type.set("mp4")
+        self.batch_type.grid(row=5, column=1, padx=5, pady=5, sticky="ew")
+
+        # Choose where downloads are saved
+        self.output_button = self.create_button("Output Folder…", self.choose_output_dir)
+        self.output_button.grid(row=5, column=2, columnspan=2, padx=5, pady=5, sticky="ew")
+
+        # Create a list view of queued, running and finished downloads
+        self.jobs_frame = ctk.CTkScrollableFrame(self.frame, label_text="Downloads", height=160)
+        self.jobs_frame.grid(row=6, column=0, columnspan=4, pady=10, padx=5, sticky="nsew")
+
         # Configure the grid layout to adjust row and column weights
         self.frame.grid_rowconfigure(1, weight=1)
         self.frame.grid_rowconfigure(2, weight=0)
         self.frame.grid_rowconfigure(4, weight=0)
+        self.frame.grid_rowconfigure(6, weight=1)
         self.frame.columnconfigure(0, weight=1)
         self.frame.columnconfigure(1, weight=1)
         self.frame.columnconfigure(2, weight=1)
+        self.frame.columnconfigure(3, weight=1)
 
         # Create a label for displaying feedback messages
         self.feedback_label = ctk.CTkLabel(self.frame, text="", text_color="gold")
@@ -92,6 +170,8 @@ class YouTubeDownloader:
 
         # Bind Enter key to the on_return_entry function
         self.entry.bind("<Return>", self.on_return_entry)
+        # Cancel stale lookups as soon as the URL in the entry field changes
+        self.entry.bind("<KeyRelease>", self.on_entry_changed)
 
     def create_wrapped_label(self, parent, text, **kwargs):
         """
@@ -110,49 +190,102 @@ class YouTubeDownloader:
         """
         Check if a given URL is a valid YouTube video URL based on predefined patterns.
         """
-        return any(re.match(pattern, url) for pattern in URL_PATTERNS)
+        return is_valid_youtube_url(url)
 
-    def fetch_details(self, url):
+    def fetch_details(self, url, then=None):
         """
-        Fetches video details from a YouTube URL and updates UI elements accordingly.
+        Resolves video details in the background and updates UI elements once they arrive.
+        `then` is called with the resolved details on the Tk thread.
         """
         if not self.is_valid_youtube_url(url):
             self.update_feedback("Enter a Valid YouTube URL")
-            return None
+            return
 
-        try:
-            yt = YouTube(url)
-            self.toggle_info_section(True)
+        # Already resolved for this URL and the signed stream URLs are still valid
+        if self.details is not None and self.details.url == url and self.details.is_fresh():
+            if then:
+                then(self.details)
+            return
 
-            full_stream = yt.streams.get_highest_resolution(progressive=True)
-            video_stream = yt.streams.get_highest_resolution(progressive=False)
-            audio_streams = yt.streams.filter(only_audio=True)
-            highest_bitrate_stream = max(audio_streams, key=lambda stream: int(stream.abr.replace('kbps', '')))
+        self.resolving_url = url
+        self.set_buttons_state(ctk.DISABLED)
+        self.update_feedback("Resolving…")
+        self.resolver.resolve(
+            url,
+            on_done=lambda details: self.app.after(0, self.on_details_ready, details, then),
+            on_error=lambda url, e: self.app.after(0, self.on_details_error, url, e),
+        )
 
-            self.update_feedback(f"{yt.title}")
-            self.update_ui_labels(video_stream, highest_bitrate_stream, full_stream)
+    def on_details_ready(self, details, then=None):
+        """
+        Runs on the Tk thread once a background lookup finished.
+        """
+        if details.url != self.resolving_url:
+            return  # URL changed while the lookup was in flight
+        self.resolving_url = None
+        if self.manager.policy is not None:
+            details = details.with_policy(self.manager.policy)  # Show the streams that will be downloaded
+        self.details = details
+
+        self.toggle_info_section(True)
+        self.update_feedback(f"{details.title}")
+        self.update_ui_labels(details)
+        self.set_buttons_state(ctk.NORMAL, details)
+
+        if then:
+            then(details)
+        elif self.current_job is None or not self.current_job.is_active():
+            downloaded = self.downloaded_types(details.url)
+            self.update_feedback(f"Choose Download Type (already downloaded: {downloaded})" if downloaded else "Choose Download Type")
+
+    def downloaded_types(self, url):
+        """
+        Comma-separated download types of this video found in the history, or an empty string.
+        """
+        video_id = video_id_from_url(url)
+        if self.manager.history is None or not video_id:
+            return ""
+        types = {entry.type_key for entry in self.manager.history.entries_for(video_id) if entry.is_on_disk()}
+        return ", ".join(DOWNLOAD_TYPES[type_key] for type_key in DOWNLOAD_TYPES if type_key in types)
+
+    def on_details_error(self, url, error):
+        if url != self.resolving_url:
+            return
+        self.resolving_url = None
+        self.update_feedback(f"Error: {error}")
 
-            # Enable buttons for download options
-            for button in [self.button1, self.button2, self.button3]:
-                button.configure(state=ctk.NORMAL)
+    def set_buttons_state(self, state, details=None):
+        """
+        With details, buttons of download types that no stream matches stay disabled.
+        """
+        buttons = {"mp4": self.button1, "legacy": self.button2, "mp3": self.button3, "best": self.button4}
+        for type_key, button in buttons.items():
+            available = details is None or self.stream_missing(details, type_key) is None
+            button.configure(state=state if available else ctk.DISABLED)
 
-            return full_stream, video_stream, highest_bitrate_stream
-        except Exception as e:
-            self.update_feedback(f"Error: {e}")
-            return None
+    @staticmethod
+    def stream_missing(details, type_key):
+        """
+        None when the stream policy left a stream to download as type_key, otherwise the reason.
+        """
+        if details.stream_for(type_key) is None or type_key == "best" and details.audio_stream is None:
+            return f"no {DOWNLOAD_TYPES[type_key]} stream matches the policy"
+        return None
 
-    def update_ui_labels(self, video_stream, highest_bitrate_stream, full_stream):
+    def update_ui_labels(self, details):
         """
         Updates UI labels with video details.
         """
-        self.title_label.configure(text=f"Title: {video_stream.title}")
-        self.video_resolution_label.configure(text=f"Highest MP4 Resolution: {video_stream.resolution}")
-        self.audio_resolution_label.configure(text=f"Highest MP3 Bitrate: {highest_bitrate_stream.abr}")
-        self.full_stream_label.configure(text=f"Legacy Format (Video & Audio): {full_stream.resolution}")
+        missing = "no stream matches the policy"
+        video_stream, highest_bitrate_stream, full_stream = details.video_stream, details.audio_stream, details.full_stream
+        self.title_label.configure(text=f"Title: {details.title}")
+        self.video_resolution_label.configure(text=f"Highest MP4 Resolution: {video_stream.resolution if video_stream else missing}")
+        self.audio_resolution_label.configure(text=f"Highest MP3 Bitrate: {highest_bitrate_stream.abr if highest_bitrate_stream else missing}")
+        self.full_stream_label.configure(text=f"Legacy Format (Video & Audio): {full_stream.resolution if full_stream else missing}")
 
     def toggle_info_section(self, show):
         if show:
-            self.info_frame.grid(row=1, column=0, columnspan=3, pady=10, padx=20, sticky="nsew")
+            self.info_frame.grid(row=1, column=0, columnspan=4, pady=10, padx=20, sticky="nsew")
         else:
             self.info_frame.grid_forget()
 
@@ -188,53 +321,188 @@ class YouTubeDownloader:
         except Exception as e:
             self.update_feedback(f"Error opening directory: {e}")
 
-    def download_handler(self, stream, filename, message):
-        """
-        Handles the download process in a separate thread.
-        """
-        def run():
-            try:
-                file_path = os.path.join(os.getcwd(), filename)
-                stream.download(filename=filename)
-                self.update_feedback_safe(f"{file_path}", file_path)
-            except Exception as e:
-                self.update_feedback_safe(f"Error: {e}")
-            finally:
-                self.downloading = False
-
-        threading.Thread(target=run).start()
-
     def download(self, type_key):
         url = self.entry.get().strip()
         if not self.is_valid_youtube_url(url):
             self.update_feedback("Enter a Valid YouTube URL")
             return
 
-        self.downloading = True
-        fetch_data = self.fetch_details(url)
+        self.fetch_details(url, then=lambda details: self.start_download(type_key, details))
+
+    def start_download(self, type_key, details):
+        missing = self.stream_missing(details, type_key)
+        if missing is not None:
+            self.update_feedback(f"Error: {missing}")
+            return
+        stream = details.stream_for(type_key)
+        self.update_feedback(f"Downloading {type_key.upper()} @ {stream.resolution if type_key != 'mp3' else stream.abr}...")
+        # A video picked by hand goes ahead of batches and playlists in the bandwidth scheduler
+        self.current_job = self.manager.submit(details.url, type_key, details=details, priority=URGENT)
+
+    def queue_urls(self, urls, type_key):
+        """
+        Queue several URLs at once.
+        """
+        valid = [url for url in urls if self.is_valid_youtube_url(url) or is_collection_url(url)]
+        for url in valid:
+            if is_collection_url(url):
+                self.queue_collection(url, type_key)
+            else:
+                self.manager.submit(url, type_key, priority=BULK)
+        skipped = len(urls) - len(valid)
+        self.update_feedback(f"Queued {len(valid)} URLs" + (f", skipped {skipped} invalid" if skipped else ""))
+
+    def queue_collection(self, url, type_key):
+        """
+        Expand a playlist or channel in the background; its videos appear in the list as they are found.
+        """
+        self.update_feedback("Reading playlist…")
+        self.manager.submit_collection(url, type_key, priority=BULK)
+
+    def on_collection_done(self, url, count, error):
+        if error is not None:
+            self.update_feedback(f"Error: {error}")
+        else:
+            self.update_feedback(f"Queued {count} videos")
+
+    def import_urls(self):
+        path = filedialog.askopenfilename(title="Import URLs", filetypes=[("Text files", "*.txt"), ("All files", "*")])
+        if not path:
+            return
+        try:
+            with open(path, "r", encoding="utf-8") as fh:
+                urls = [line.strip() for line in fh if line.strip() and not line.startswith("#")]
+        except OSError as e:
+            self.update_feedback(f"Error: {e}")
+            return
+        self.queue_urls(urls, self.batch_type.get())
+
+    def choose_output_dir(self):
+        directory = filedialog.askdirectory(title="Output Folder", initialdir=self.manager.output_dir)
+        if directory:
+            self.manager.output_dir = directory
+            self.update_feedback(f"Saving to {directory}")
+
+    def on_job_update(self, job):
+        """
+        Runs on the Tk thread whenever a queued job changes state.
+        """
+        label, bar = self.job_row(job)
+        label.configure(text=self.job_text(job))
+        if job.state == DONE:
+            bar.set(1)
 
-        if fetch_data:
-            if type_key == "legacy":
-                stream, filename = fetch_data[0], DOWNLOAD_TYPES[type_key]
-            elif type_key == "mp4":
-                stream, filename = fetch_data[1], DOWNLOAD_TYPES[type_key]
-            elif type_key == "mp3":
-                stream, filename = fetch_data[2], DOWNLOAD_TYPES[type_key]
+        if job is not self.current_job:
+            return
+        if job.state == DONE:
+            self.update_feedback(f"{'Already downloaded: ' if job.skipped else ''}{job.file_path}", job.file_path)
+        elif job.state == FAILED:
+            self.update_feedback(f"Error: {job.error}")
 
-            self.update_feedback(f"Downloading {type_key.upper()} @ {stream.resolution if type_key != 'mp3' else stream.abr}...")
-            self.download_handler(stream, filename, f"Downloading {type_key.upper()}...")
+    def job_row(self, job):
+        """
+        Return the (label, progress bar) pair of a job in the list view, creating it on first use.
+        """
+        row = self.job_rows.get(job.id)
+        if row is None:
+            row_frame = ctk.CTkFrame(self.jobs_frame, fg_color="transparent")
+            row_frame.pack(anchor="w", fill="x", padx=5, pady=2)
+            label = ctk.CTkLabel(row_frame, text="", anchor="w", justify="left", wraplength=520)
+            label.pack(anchor="w", fill="x")
+            bar = ctk.CTkProgressBar(row_frame, height=6)
+            bar.set(0)
+            bar.pack(anchor="w", fill="x")
+            row = self.job_rows[job.id] = (label, bar)
+        return row
+
+    def job_text(self, job):
+        text = f"[{job.state}] {job.type_key.upper()} · {job.title}"
+        if job.state == QUEUED and job.attempts:
+            text += f" (retry {job.attempts}/{MAX_RETRIES})"
+        elif job.state == FAILED:
+            text += f" · {job.error}"
+        elif job.state == DOWNLOADING and job.metrics is not None:
+            text += f" · {describe(job.metrics)}"
+        elif job.state == DONE and job.metrics is not None and job.metrics.peak_rss:
+            text += f" · peak RSS {format_bytes(job.metrics.peak_rss)}"
+        return text
+
+    def queue_progress(self, job):
+        """
+        Called from transfer threads. Coalesces progress events so at most one redraw is
+        scheduled on the Tk loop per PROGRESS_REFRESH_MS.
+        """
+        with self.progress_lock:
+            self.progress_pending[job.id] = job
+            if self.progress_scheduled:
+                return
+            self.progress_scheduled = True
+        self.app.after(PROGRESS_REFRESH_MS, self.flush_progress)
+
+    def flush_progress(self):
+        with self.progress_lock:
+            jobs, self.progress_pending = list(self.progress_pending.values()), {}
+            self.progress_scheduled = False
+        for job in jobs:
+            if job.state != DOWNLOADING:
+                continue
+            label, bar = self.job_row(job)
+            label.configure(text=self.job_text(job))
+            if job.metrics.fraction is not None:
+                bar.set(job.metrics.fraction)
 
     def on_return_entry(self, event):
+        urls = self.entry.get().split()
+        if len(urls) > 1:
+            self.queue_urls(urls, self.batch_type.get())
+            return
         url = self.entry.get().strip()
-        if len(url) >= VIDEO_ID_LENGTH:
+        if is_collection_url(url):
+            self.queue_collection(url, self.batch_type.get())
+        elif len(url) >= VIDEO_ID_LENGTH:
             self.fetch_details(url)
-            if not self.downloading:
-                self.update_feedback("Choose Download Type")
         else:
             self.update_feedback("Enter a Valid YouTube URL")
 
+    def on_entry_changed(self, event):
+        """
+        Drop the resolved details and any in-flight lookup once the URL no longer matches them.
+        """
+        url = self.entry.get().strip()
+        if self.resolving_url is not None and url != self.resolving_url:
+            self.resolver.cancel()
+            self.resolving_url = None
+            self.update_feedback("Enter a Valid YouTube URL" if url else "")
+        if self.details is not None and url != self.details.url:
+            self.details = None
+            self.set_buttons_state(ctk.DISABLED)
+
+    def resume_interrupted(self):
+        """
+        Pick up downloads left as .part files by a previous session.
+        """
+        if self.manager.segmented is None:
+            return
+        jobs = self.manager.resume_pending()
+        if jobs:
+            self.update_feedback(f"Resuming {len(jobs)} interrupted downloads")
+
+    def on_close(self):
+        self.resolver.shutdown()
+        self.manager.shutdown()
+        self.transcoder.shutdown()
+        if self.manager.extras is not None:
+            self.manager.extras.shutdown()
+        self.session.close()
+        self.app.destroy()
+
 # Create the main application window and start the app
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # Transcoder workers in a pyinstaller build
     app = ctk.CTk()
     downloader = YouTubeDownloader(app)
-    app.mainloop()
\ No newline at end of file
+    startup.mark("window built")
+    # pytubefix is only needed for the first lookup, load it once the window is on screen; the same
+    # goes for scanning the output folder for interrupted downloads
+    startup.first_frame(app, prewarm_modules=["pytubefix"], then=downloader.resume_interrupted)
+    app.mainloop()
@@ -0,0 +1,4 @@
+"""
+Benchmark harness: runs the downloader's stages against a local stand-in for YouTube.
+See `python -m bench --help`.
+"""
@@ -0,0 +1,141 @@
+"""
+Run the benchmark scenarios and record the results as JSON.
+
+    python -m bench [--scenario batch] [--latency 0.05] [--throttle 20M] [--output results.json]
+    python -m bench --output new.json --compare old.json
+
+With --compare the run exits with status 1 when a throughput dropped, or a p95 latency rose,
+by more than --tolerance against the baseline file.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+from bench.scenarios import SCENARIOS, Skipped
+from bench.server import FakeYouTube
+from ytdl.bandwidth import parse_rate
+from ytdl.buffers import DEFAULT_CHUNK_SIZE
+from ytdl.policy import parse_size
+from ytdl.segmented import DEFAULT_CONNECTIONS, DEFAULT_SEGMENT_SIZE
+from ytdl.session import DEFAULT_MAX_PER_HOST
+
+HIGHER_IS_BETTER = ("throughput", "files_per_second")
+LOWER_IS_BETTER = ("p95",)
+
+
+def git_revision():
+    try:
+        result = subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        return result.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(options):
+    results = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "options": {key: value for key, value in vars(options).items() if key not in ("output", "compare")},
+        "scenarios": {},
+    }
+    for name in options.scenario or list(SCENARIOS):
+        print(f"[bench] {name}", file=sys.stderr, flush=True)
+        with FakeYouTube(options.latency, options.throttle) as server, tempfile.TemporaryDirectory(prefix="ytdl-bench-") as workdir:
+            try:
+                result = {"status": "ok", **SCENARIOS[name](server, options, workdir)}
+            except Skipped as e:
+                result = {"status": "skipped", "reason": str(e)}
+            except Exception as e:
+                traceback.print_exc()
+                result = {"status": "failed", "reason": f"{type(e).__name__}: {e}"}
+            result["server"] = server.stats.snapshot()
+        results["scenarios"][name] = result
+    return results
+
+
+def flatten(result, prefix=""):
+    for key, value in result.items():
+        if isinstance(value, dict):
+            yield from flatten(value, f"{prefix}{key}.")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield f"{prefix}{key}", value
+
+
+def compare(results, baseline, tolerance):
+    """
+    Print the tracked metrics next to the baseline. Returns the names of the regressed metrics.
+    """
+    regressions = []
+    for name, result in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if result["status"] != "ok" or not previous or previous.get("status") != "ok":
+            continue
+        old_values = dict(flatten(previous))
+        for key, value in flatten(result):
+            old = old_values.get(key)
+            metric = key.rsplit(".", 1)[-1]
+            if not old or metric not in HIGHER_IS_BETTER + LOWER_IS_BETTER:
+                continue
+            change = value / old - 1
+            regressed = change < -tolerance if metric in HIGHER_IS_BETTER else change > tolerance
+            print(f"{'REGRESSED' if regressed else 'ok':>9}  {name}.{key}: {old:.4g} -> {value:.4g} ({change:+.1%})")
+            if regressed:
+                regressions.append(f"{name}.{key}")
+    return regressions
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m bench", description="Benchmark the downloader against a local fake YouTube")
+    parser.add_argument("--scenario", "-s", action="append", choices=list(SCENARIOS),
+                        help="scenario to run, repeatable (default: all)")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds added to every response (default: 0.02)")
+    parser.add_argument("--throttle", type=parse_rate, default=None, help="bytes per second per connection, e.g. 10M")
+    parser.add_argument("--media-size", type=parse_size, default=parse_size("256M"),
+                        help="size of the large video stream, batches split it across their videos (default: 256M)")
+    parser.add_argument("--media-seconds", type=int, default=30, help="length of the media rendered for merge_transcode")
+    parser.add_argument("--videos", type=int, default=16, help="videos per metadata, batch and transcode run (default: 16)")
+    parser.add_argument("--jobs", type=int, default=4, help="parallel downloads or resolutions (default: 4)")
+    parser.add_argument("--connections", type=int, default=DEFAULT_CONNECTIONS, help="range requests per stream")
+    parser.add_argument("--segment-size", type=parse_size, default=DEFAULT_SEGMENT_SIZE, help="bytes per range request")
+    parser.add_argument("--chunk-size", type=parse_size, default=DEFAULT_CHUNK_SIZE, help="bytes per read and pooled buffer")
+    parser.add_argument("--buffer-memory", type=parse_size, default=None,
+                        help="budget of the buffer pool, at least two segments (default: no limit)")
+    parser.add_argument("--max-per-host", type=int, default=DEFAULT_MAX_PER_HOST, help="session connections per host")
+    parser.add_argument("--no-session", dest="session", action="store_false",
+                        help="let pytubefix open its own connections (urlopen) to compare against the shared session")
+    parser.add_argument("--output", "-o", help="write the JSON results to this file instead of stdout")
+    parser.add_argument("--compare", help="earlier results file to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative change (default: 0.10)")
+    return parser
+
+
+def main(argv=None):
+    options = build_parser().parse_args(argv)
+    results = run(options)
+    text = json.dumps(results, indent=2)
+    if options.output:
+        with open(options.output, "w", encoding="utf-8") as fh:
+            fh.write(text + "\n")
+    else:
+        print(text)
+
+    if options.compare:
+        with open(options.compare, "r", encoding="utf-8") as fh:
+            regressions = compare(results, json.load(fh), options.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regressions: {', '.join(regressions)}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,285 @@
+"""
+Benchmark scenarios.
+Each scenario runs one stage of the downloader against the fake server and returns a dict of
+results: wall time, bytes, throughput and latency percentiles where they apply.
+"""
+
+import math
+import os
+import shutil
+import statistics
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from bench.server import FileMedia, routed_to
+from ytdl.buffers import BufferPool
+from ytdl.cache import ManifestCache
+from ytdl.extras import ExtrasFetcher
+from ytdl.manager import DONE, DownloadManager
+from ytdl.metadata import fetch_details
+from ytdl.mux import MuxError, StreamMuxer, find_ffmpeg
+from ytdl.progress import TransferMetrics
+from ytdl.segmented import SegmentedDownloader
+from ytdl.session import HttpSession, route_pytubefix
+from ytdl.transcode import Transcoder
+
+
+class Skipped(Exception):
+    """
+    The scenario cannot run here, e.g. because pytubefix or ffmpeg is missing.
+    """
+
+
+def percentile(values, fraction):
+    """
+    Nearest-rank percentile of values, e.g. percentile(latencies, 0.95).
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+
+def latency_summary(values):
+    return {
+        "count": len(values),
+        "mean": statistics.fmean(values) if values else None,
+        "p50": percentile(values, 0.5),
+        "p95": percentile(values, 0.95),
+        "max": max(values) if values else None,
+    }
+
+
+def transfer_summary(nbytes, elapsed):
+    return {"bytes": nbytes, "seconds": elapsed, "throughput": nbytes / elapsed if elapsed else None}
+
+
+def session_for(options):
+    """
+    A fresh shared session for the scenario, also used by pytubefix unless --no-session was given.
+    """
+    session = HttpSession(options.max_per_host)
+    if options.session:
+        route_pytubefix(session)
+    return session
+
+
+def downloader_for(options, session):
+    return SegmentedDownloader(options.connections, options.segment_size, session=session,
+                               buffers=BufferPool.for_budget(options.buffer_memory, options.chunk_size))
+
+
+def metadata(server, options, workdir):
+    """
+    Resolve fresh videos through pytubefix (cold), then the same videos again from the manifest cache (warm).
+    """
+    try:
+        import pytubefix  # noqa: F401
+    except ImportError as e:
+        raise Skipped(f"pytubefix is not installed ({e})")
+
+    urls = [server.watch_url(server.add_video(options.media_size)) for _ in range(options.videos)]
+    session = session_for(options)
+    cache = ManifestCache(path=None)
+    cold, warm = [], []
+    with routed_to(server.base_url):
+        for url in urls:
+            started = time.perf_counter()
+            fetch_details(url, cache)
+            cold.append(time.perf_counter() - started)
+        for url in urls:
+            started = time.perf_counter()
+            fetch_details(url, cache)
+            warm.append(time.perf_counter() - started)
+    return {"cold": latency_summary(cold), "warm": latency_summary(warm), "session": session.stats.snapshot()}
+
+
+def single_download(server, options, workdir):
+    """
+    One large stream through the segmented engine.
+    """
+    video_id = server.add_video(options.media_size)
+    stream = server.video_details(video_id).video_stream
+    metrics = TransferMetrics()
+    downloader = downloader_for(options, session_for(options))
+    started = time.perf_counter()
+    downloader.download(stream.url, os.path.join(workdir, "single.mp4"), stream.filesize, progress=metrics)
+    elapsed = time.perf_counter() - started
+    metrics.finish()
+    result = transfer_summary(stream.filesize, elapsed)
+    result["ttfb"] = metrics.ttfb
+    result["peak_rss"] = metrics.peak_rss
+    result["buffers"] = downloader.buffers.snapshot()
+    result["session"] = downloader.session.stats.snapshot()
+    return result
+
+
+def batch(server, options, workdir):
+    """
+    Many downloads queued at once on the download manager, as a playlist would be.
+    """
+    size = max(options.media_size // options.videos, 1)
+    details = [server.video_details(server.add_video(size)) for _ in range(options.videos)]
+    session = session_for(options)
+    manager = DownloadManager(
+        max_workers=options.jobs,
+        max_retries=0,
+        output_dir=workdir,
+        segmented=downloader_for(options, session),
+    )
+    started = time.perf_counter()
+    try:
+        jobs = [manager.submit(item.url, "mp4", details=item) for item in details]
+        manager.wait_idle()
+    finally:
+        manager.shutdown(wait=True)
+    elapsed = time.perf_counter() - started
+
+    failed = [job for job in jobs if job.state != DONE]
+    if failed:
+        raise RuntimeError(f"{len(failed)} of {len(jobs)} batch jobs failed: {failed[0].error}")
+    durations = [job.metrics.finished_at - job.metrics.started_at for job in jobs]
+    result = transfer_summary(sum(item.video_stream.filesize for item in details), elapsed)
+    result["jobs"] = latency_summary(durations)
+    result["ttfb"] = latency_summary([job.metrics.ttfb for job in jobs if job.metrics.ttfb is not None])
+    result["peak_rss"] = max((job.metrics.peak_rss or 0 for job in jobs), default=None)
+    result["buffers"] = manager.segmented.buffers.snapshot()
+    result["session"] = session.stats.snapshot()
+    return result
+
+
+def extras(server, options, workdir):
+    """
+    The batch again with thumbnails, captions and metadata sidecars fetched alongside. The media
+    time should match the plain batch; `after_media` is how long the extras ran on past it.
+    """
+    try:
+        import pytubefix  # noqa: F401
+    except ImportError as e:
+        raise Skipped(f"pytubefix is not installed ({e})")
+
+    size = max(options.media_size // options.videos, 1)
+    details = [server.video_details(server.add_video(size)) for _ in range(options.videos)]
+    session = session_for(options)
+    saved, failed = [], []
+    fetcher = ExtrasFetcher(session=session, on_done=lambda path, error: (failed if error else saved).append(path))
+    manager = DownloadManager(
+        max_workers=options.jobs,
+        max_retries=0,
+        output_dir=workdir,
+        segmented=downloader_for(options, session),
+        extras=fetcher,
+    )
+    with routed_to(server.base_url):
+        started = time.perf_counter()
+        try:
+            jobs = [manager.submit(item.url, "mp4", details=item) for item in details]
+            manager.wait_idle()
+            media_elapsed = time.perf_counter() - started
+            fetcher.wait_idle()
+            extras_elapsed = time.perf_counter() - started
+        finally:
+            manager.shutdown(wait=True)
+            fetcher.shutdown(wait=True)
+
+    if any(job.state != DONE for job in jobs) or failed:
+        raise RuntimeError(f"{len(failed)} extras and {sum(job.state != DONE for job in jobs)} jobs failed")
+    result = transfer_summary(sum(item.video_stream.filesize for item in details), media_elapsed)
+    result["extras"] = {"files": len(saved), "seconds": extras_elapsed, "after_media": extras_elapsed - media_elapsed}
+    result["session"] = session.stats.snapshot()
+    return result
+
+
+def render_media(ffmpeg, workdir, seconds):
+    """
+    Render a real H.264 video and AAC audio file with ffmpeg, with the moov atom first so ffmpeg
+    can read them back from a pipe.
+    """
+    video_path = os.path.join(workdir, "source-video.mp4")
+    audio_path = os.path.join(workdir, "source-audio.m4a")
+    for command in (
+        ["-f", "lavfi", "-i", f"testsrc=size=1920x1080:rate=30:duration={seconds}",
+         "-c:v", "libx264", "-preset", "ultrafast", "-movflags", "+faststart", video_path],
+        ["-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+         "-c:a", "aac", "-movflags", "+faststart", audio_path],
+    ):
+        subprocess.run([ffmpeg, "-y", "-loglevel", "error", *command], check=True)
+    return FileMedia(video_path), FileMedia(audio_path)
+
+
+def merge_transcode(server, options, workdir):
+    """
+    Merge video and audio through the piped muxer, then transcode audio on the process pool.
+    """
+    try:
+        ffmpeg = find_ffmpeg()
+    except MuxError as e:
+        raise Skipped(str(e))
+    video_media, audio_media = render_media(ffmpeg, workdir, options.media_seconds)
+    details = server.video_details(server.add_video(options.media_size, media={137: video_media, 140: audio_media}))
+    video, audio = details.stream_for("best"), details.audio_stream
+
+    downloader = downloader_for(options, session_for(options))
+    started = time.perf_counter()
+    metrics = TransferMetrics()
+    StreamMuxer(downloader, ffmpeg).merge(video, audio, os.path.join(workdir, "merged.mp4"), progress=metrics)
+    merge_elapsed = time.perf_counter() - started
+    metrics.finish()
+
+    sources = []
+    for index in range(options.videos):
+        path = os.path.join(workdir, f"audio-{index}.m4a")
+        shutil.copyfile(audio_media.path, path)
+        sources.append(path)
+    transcoder = Transcoder("mp3")
+    started = time.perf_counter()
+    try:
+        futures = [transcoder.submit(path, os.path.splitext(path)[0] + ".mp3") for path in sources]
+        for future in futures:
+            future.result()
+    finally:
+        transcoder.shutdown()
+    transcode_elapsed = time.perf_counter() - started
+
+    return {
+        "merge": {**transfer_summary(video.filesize + audio.filesize, merge_elapsed), "peak_rss": metrics.peak_rss,
+                  "buffers": downloader.buffers.snapshot()},
+        "transcode": {"files": len(sources), "seconds": transcode_elapsed,
+                      "files_per_second": len(sources) / transcode_elapsed if transcode_elapsed else None},
+    }
+
+
+def concurrent_metadata(server, options, workdir):
+    """
+    Cold resolutions of a batch of videos on the resolver pool size the manager uses.
+    """
+    try:
+        import pytubefix  # noqa: F401
+    except ImportError as e:
+        raise Skipped(f"pytubefix is not installed ({e})")
+
+    urls = [server.watch_url(server.add_video(options.media_size)) for _ in range(options.videos)]
+    session = session_for(options)
+
+    def timed(url):
+        started = time.perf_counter()
+        fetch_details(url)
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with routed_to(server.base_url), ThreadPoolExecutor(max_workers=options.jobs) as executor:
+        latencies = list(executor.map(timed, urls))
+    result = latency_summary(latencies)
+    result["seconds"] = time.perf_counter() - started
+    result["session"] = session.stats.snapshot()
+    return result
+
+
+SCENARIOS = {
+    "metadata": metadata,
+    "concurrent_metadata": concurrent_metadata,
+    "single_download": single_download,
+    "batch": batch,
+    "extras": extras,
+    "merge_transcode": merge_transcode,
+}
@@ -0,0 +1,347 @@
+"""
+Local stand-in for YouTube.
+Serves canned watch pages and innertube player responses for a catalog of fake videos, their media
+from /videoplayback with Range support, and their thumbnails and captions, so the whole download
+path can be measured offline.
+Every response can be delayed (`latency`) and every connection throttled (`throttle` bytes/s).
+"""
+
+import contextlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from ytdl.cache import CachedStream
+from ytdl.metadata import VideoDetails
+from ytdl.policy import StreamIndex
+from ytdl.session import patch_pytubefix
+
+WRITE_SIZE = 64 * 1024
+BLOCK_SIZE = 1024 * 1024
+URL_LIFETIME = 6 * 3600
+
+# itag -> (mime type, resolution, fps, fraction of the video's media size, progressive)
+FORMATS = {
+    18: ('video/mp4; codecs="avc1.42001E, mp4a.40.2"', "360p", 30, 0.125, True),
+    137: ('video/mp4; codecs="avc1.640028"', "1080p", 30, 1.0, False),
+    248: ('video/webm; codecs="vp9"', "1080p", 30, 0.8, False),
+    140: ('audio/mp4; codecs="mp4a.40.2"', None, None, 0.0625, False),
+    251: ('audio/webm; codecs="opus"', None, None, 0.05, False),
+}
+AUDIO_BITRATES = {140: 130000, 251: 150000}
+# vssId -> name of the caption tracks every video has
+CAPTION_TRACKS = {".en": "English", "a.en": "English (auto-generated)", ".de": "German"}
+THUMBNAIL_SIZE = 64 * 1024
+# The player script pytubefix reads the signature timestamp of WEB client requests (captions) from
+PLAYER_JS_PATH = "/s/player/bench0000/player_ias.vflset/en_US/base.js"
+
+
+class SyntheticMedia:
+    """
+    `size` bytes of incompressible data generated from a repeated random block, never held in memory.
+    """
+    def __init__(self, size, seed=0):
+        self.size = size
+        self.block = random.Random(seed).randbytes(BLOCK_SIZE)
+
+    def read(self, start, end):
+        """
+        Yield bytes start..end (inclusive) in WRITE_SIZE pieces.
+        """
+        offset = start
+        while offset <= end:
+            block_offset = offset % BLOCK_SIZE
+            piece = self.block[block_offset:block_offset + min(WRITE_SIZE, end - offset + 1)]
+            yield piece
+            offset += len(piece)
+
+
+class FileMedia:
+    """
+    A real media file, e.g. one rendered by ffmpeg for the merge and transcode scenarios.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.size = os.path.getsize(path)
+
+    def read(self, start, end):
+        with open(self.path, "rb") as fh:
+            fh.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                piece = fh.read(min(WRITE_SIZE, remaining))
+                if not piece:
+                    return
+                yield piece
+                remaining -= len(piece)
+
+
+class FakeVideo:
+    def __init__(self, video_id, title, media):
+        self.video_id = video_id
+        self.title = title
+        self.media = media  # itag -> SyntheticMedia or FileMedia
+
+
+class ServerStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+        self.bytes_sent = 0
+
+    def count(self, requests=0, connections=0, bytes_sent=0):
+        with self.lock:
+            self.requests += requests
+            self.connections += connections
+            self.bytes_sent += bytes_sent
+
+    def snapshot(self):
+        with self.lock:
+            return {"requests": self.requests, "connections": self.connections, "bytes_sent": self.bytes_sent}
+
+
+class FakeYouTube:
+    """
+    The server and its video catalog. Use as a context manager, or call start() and stop().
+    """
+    def __init__(self, latency=0.0, throttle=None, host="127.0.0.1"):
+        self.latency = latency
+        self.throttle = throttle
+        self.videos = {}
+        self.stats = ServerStats()
+        self.httpd = ThreadingHTTPServer((host, 0), self.handler_class())
+        self.httpd.daemon_threads = True
+        self.base_url = f"http://{host}:{self.httpd.server_address[1]}"
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, name="fake-youtube", daemon=True).start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def add_video(self, media_size, title=None, media=None):
+        """
+        Add a video with every itag of FORMATS, sized relative to media_size. `media` overrides
+        individual itags, e.g. {137: FileMedia(...)}. Returns the video ID.
+        """
+        video_id = f"bench{len(self.videos):06d}"
+        catalog = {itag: SyntheticMedia(max(int(media_size * spec[3]), 1), seed=itag)
+                   for itag, spec in FORMATS.items()}
+        catalog.update(media or {})
+        self.videos[video_id] = FakeVideo(video_id, title or f"Benchmark video {len(self.videos)}", catalog)
+        return video_id
+
+    @staticmethod
+    def watch_url(video_id):
+        return f"https://www.youtube.com/watch?v={video_id}"
+
+    def media_url(self, video_id, itag):
+        return f"{self.base_url}/videoplayback?id={video_id}&itag={itag}&expire={int(time.time()) + URL_LIFETIME}"
+
+    def formats(self, video_id):
+        video = self.videos[video_id]
+        formats = []
+        for itag, media in video.media.items():
+            mime_type, resolution, fps, _, progressive = FORMATS[itag]
+            entry = {
+                "itag": itag,
+                "url": self.media_url(video_id, itag),
+                "mimeType": mime_type,
+                "bitrate": AUDIO_BITRATES.get(itag, 4000000),
+                "contentLength": str(media.size),
+                "approxDurationMs": "600000",
+                "lastModified": "1700000000000000",
+                "progressive": progressive,
+            }
+            if resolution:
+                entry.update({"qualityLabel": resolution, "height": int(resolution[:-1]), "fps": fps})
+            formats.append(entry)
+        return formats
+
+    def player_response(self, video_id):
+        video = self.videos.get(video_id)
+        if video is None:
+            return {"playabilityStatus": {"status": "ERROR", "reason": "Video unavailable"}}
+        streaming_data = {"expiresInSeconds": str(URL_LIFETIME), "formats": [], "adaptiveFormats": []}
+        for entry in self.formats(video_id):
+            streaming_data["formats" if entry.pop("progressive") else "adaptiveFormats"].append(entry)
+        return {
+            "responseContext": {"visitorData": "CgtCZW5jaG1hcmsxMg%3D%3D"},
+            "playabilityStatus": {"status": "OK"},
+            "videoDetails": {
+                "videoId": video_id, "title": video.title, "lengthSeconds": "600", "author": "ytdl bench",
+                "thumbnail": {"thumbnails": [{"url": f"{self.base_url}/vi/{video_id}/maxresdefault.jpg"}]},
+            },
+            "streamingData": streaming_data,
+            "captions": {"playerCaptionsTracklistRenderer": {"captionTracks": [
+                {"baseUrl": f"{self.base_url}/api/timedtext?v={video_id}&lang={code.split('.')[-1]}",
+                 "name": {"simpleText": name}, "vssId": code, "languageCode": code.split(".")[-1]}
+                for code, name in CAPTION_TRACKS.items()
+            ]}},
+            "playerConfig": {"mediaCommonConfig": {"mediaUstreamerRequestConfig": {"videoPlaybackUstreamerConfig": ""}}},
+        }
+
+    @staticmethod
+    def timed_text(video_id):
+        lines = "".join(f'<text start="{second * 2}" dur="1.5">{video_id} line {second}</text>' for second in range(100))
+        return f'<?xml version="1.0" encoding="utf-8" ?><transcript>{lines}</transcript>'
+
+    def watch_page(self, video_id):
+        player = json.dumps(self.player_response(video_id))
+        return (f'<html><head><title>{video_id}</title><script src="{PLAYER_JS_PATH}"></script></head>'
+                f"<body><script>var ytInitialPlayerResponse = {player};</script></body></html>")
+
+    def video_details(self, video_id):
+        """
+        Resolved details of a fake video built straight from the catalog, for scenarios that measure
+        downloads without going through pytubefix.
+        """
+        streams = []
+        for entry in self.formats(video_id):
+            mime_type = entry["mimeType"].split(";")[0]
+            codecs = re.findall(r'"(.*)"', entry["mimeType"])[0].split(", ")
+            progressive = entry["progressive"]
+            streams.append(CachedStream(
+                itag=entry["itag"], url=entry["url"], mime_type=mime_type, resolution=entry.get("qualityLabel"),
+                abr=f"{AUDIO_BITRATES[entry['itag']] // 1000}kbps" if entry["itag"] in AUDIO_BITRATES else None,
+                fps=entry.get("fps"), video_codec=codecs[0] if mime_type.startswith("video") else None,
+                audio_codec=codecs[-1] if mime_type.startswith("audio") or progressive else None,
+                bitrate=entry["bitrate"], is_progressive=progressive, title=self.videos[video_id].title,
+                filesize=int(entry["contentLength"]),
+            ))
+        return VideoDetails(self.watch_url(video_id), self.videos[video_id].title, *StreamIndex(streams).select(),
+                            streams=streams)
+
+    def handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes; without this, delayed ACKs stall kept-alive connections
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                server.stats.count(connections=1)
+
+            def handle(self):
+                try:
+                    super().handle()
+                except ConnectionError:
+                    pass  # The client reset the connection, e.g. closing a response it did not read to the end
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                server.stats.count(requests=1)
+                time.sleep(server.latency)
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)) or 0)
+                if not urlsplit(self.path).path.startswith("/youtubei/v1/player"):
+                    return self.reply(404, b"{}", "application/json")
+                video_id = json.loads(body or b"{}").get("videoId", "")
+                self.reply(200, json.dumps(server.player_response(video_id)).encode(), "application/json")
+
+            def do_GET(self):
+                server.stats.count(requests=1)
+                time.sleep(server.latency)
+                parts = urlsplit(self.path)
+                query = {key: values[0] for key, values in parse_qs(parts.query).items()}
+                if parts.path == "/watch":
+                    self.reply(200, server.watch_page(query.get("v", "")).encode(), "text/html; charset=utf-8")
+                elif parts.path == "/videoplayback":
+                    self.send_media(query)
+                elif parts.path == "/api/timedtext":
+                    self.reply(200, server.timed_text(query.get("v", "")).encode(), "text/xml; charset=utf-8")
+                elif parts.path == PLAYER_JS_PATH:
+                    self.reply(200, b"var ytcfg={signatureTimestamp:20000};", "text/javascript")
+                elif parts.path.startswith("/vi/"):
+                    self.reply(200, bytes(THUMBNAIL_SIZE), "image/jpeg")
+                else:
+                    self.reply(404, b"", "text/plain")
+
+            def reply(self, status, body, content_type):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                server.stats.count(bytes_sent=len(body))
+
+            def send_media(self, query):
+                video = server.videos.get(query.get("id"))
+                media = video.media.get(int(query.get("itag", 0))) if video else None
+                if media is None:
+                    return self.reply(404, b"", "text/plain")
+                if int(query.get("expire", 0)) <= time.time():
+                    return self.reply(403, b"", "text/plain")
+
+                start, end, status = 0, media.size - 1, 200
+                match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+                if match:
+                    start, status = int(match.group(1)), 206
+                    end = min(int(match.group(2)), end) if match.group(2) else end
+                    if start > end:
+                        return self.reply(416, b"", "text/plain")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(end - start + 1))
+                if status == 206:
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{media.size}")
+                self.end_headers()
+
+                started = time.monotonic()
+                sent = 0
+                try:
+                    for piece in media.read(start, end):
+                        self.wfile.write(piece)
+                        sent += len(piece)
+                        if server.throttle:
+                            # Sleep until this connection is back under its rate
+                            delay = sent / server.throttle - (time.monotonic() - started)
+                            if delay > 0:
+                                time.sleep(delay)
+                except ConnectionError:
+                    self.close_connection = True  # The client hung up mid-range, e.g. a cancelled download
+                server.stats.count(bytes_sent=sent)
+
+        return Handler
+
+
+@contextlib.contextmanager
+def routed_to(base_url):
+    """
+    Send pytubefix's requests for youtube.com to the fake server instead, on top of the routing to
+    the HTTP session if there is one.
+    """
+    from pytubefix import request
+
+    patch_pytubefix()
+    original = request._execute_request
+
+    def execute_request(url, *args, **kwargs):
+        parts = urlsplit(url)
+        if parts.netloc.endswith("youtube.com"):
+            url = f"{base_url}{parts.path}" + (f"?{parts.query}" if parts.query else "")
+        return original(url, *args, **kwargs)
+
+    # Carry the session tag so patch_pytubefix() keeps this wrapper in place
+    execute_request.session = getattr(original, "session", None)
+    request._execute_request = execute_request
+    try:
+        yield
+    finally:
+        request._execute_request = original
@@ -0,0 +1,81 @@
+"""
+Shared fixtures: the benchmark's fake YouTube serves media with Range support, and FlakySession
+injects the connection failures a real network produces.
+"""
+
+import threading
+import pytest
+from bench.server import FakeYouTube, SyntheticMedia
+from ytdl.session import HttpSession
+
+MEDIA_SIZE = 1024 * 1024 + 12345  # Not a multiple of any segment size used in the tests
+SEGMENT_SIZE = 256 * 1024
+
+
+@pytest.fixture(scope="session")
+def server():
+    with FakeYouTube() as fake:
+        yield fake
+
+
+@pytest.fixture
+def media(server):
+    """
+    (url, expected bytes) of a fresh video-only stream.
+    """
+    video_id = server.add_video(0, media={137: SyntheticMedia(MEDIA_SIZE, seed=len(server.videos))})
+    media = server.videos[video_id].media[137]
+    return server.media_url(video_id, 137), b"".join(media.read(0, media.size - 1))
+
+
+class CutResponse:
+    """
+    A response whose body ends after `limit` bytes, like a connection dropped mid-transfer.
+    """
+    def __init__(self, response, limit):
+        self.response = response
+        self.status = response.status
+        self.remaining = limit
+
+    def getheader(self, name, default=None):
+        return self.response.getheader(name, default)
+
+    def read(self, amt=None):
+        data = self.response.read(min(amt, self.remaining) if amt is not None else self.remaining)
+        self.remaining -= len(data)
+        return data
+
+    def readinto(self, buffer):
+        if not self.remaining:
+            return 0
+        count = self.response.readinto(memoryview(buffer)[:self.remaining])
+        self.remaining -= count
+        return count
+
+    def close(self):
+        self.response.close()
+
+
+class FlakySession:
+    """
+    An HttpSession whose n-th request (counting from 0) fails as `failure(n)` says: None passes it
+    through, an exception is raised, and an int cuts the body off after that many bytes.
+    Every Range header asked for is kept in `ranges`.
+    """
+    def __init__(self, failure=lambda n: None):
+        self.session = HttpSession()
+        self.failure = failure
+        self.lock = threading.Lock()
+        self.ranges = []
+
+    def request(self, method, url, headers=None, body=None, timeout=None):
+        with self.lock:
+            failure = self.failure(len(self.ranges))
+            self.ranges.append((headers or {}).get("Range"))
+        if isinstance(failure, Exception):
+            raise failure
+        response = self.session.request(method, url, headers, body, timeout)
+        return response if failure is None else CutResponse(response, failure)
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,50 @@
+import threading
+import time
+from ytdl.bandwidth import BULK, NORMAL, URGENT, BandwidthScheduler, parse_rate
+
+
+def test_parse_rate():
+    assert parse_rate("5M") == 5 * 1024 * 1024
+    assert parse_rate("500KB/s") == 500 * 1024
+    assert parse_rate("none") is None
+    assert parse_rate("0") == 0
+
+
+def test_without_a_cap_grants_are_immediate():
+    scheduler = BandwidthScheduler()
+    started = time.monotonic()
+    for _ in range(1000):
+        scheduler.acquire(1024 * 1024, BULK)
+    assert time.monotonic() - started < 0.5
+
+
+def test_waiting_transfers_are_served_by_priority_then_arrival():
+    scheduler = BandwidthScheduler(rate=100000)
+    scheduler.acquire(30000)  # Overdraws the bucket so everyone below has to wait
+    served = []
+    lock = threading.Lock()
+
+    def transfer(name, priority):
+        scheduler.acquire(1000, priority)
+        with lock:
+            served.append(name)
+
+    threads = []
+    for name, priority in [("bulk", BULK), ("normal 1", NORMAL), ("urgent", URGENT), ("normal 2", NORMAL)]:
+        threads.append(threading.Thread(target=transfer, args=(name, priority)))
+        threads[-1].start()
+        time.sleep(0.02)  # Arrive in this order while the bucket is still empty
+    for thread in threads:
+        thread.join(5)
+    assert served == ["urgent", "normal 1", "normal 2", "bulk"]
+
+
+def test_the_cap_holds_over_time():
+    rate = 200000
+    scheduler = BandwidthScheduler(rate=rate)
+    throttle = scheduler.throttle(NORMAL)
+    started = time.monotonic()
+    for _ in range(11):
+        throttle(20000)
+    # The bucket starts empty and the last grant may overdraw it, so 200000 bytes take about a second
+    assert time.monotonic() - started >= 200000 / rate * 0.95
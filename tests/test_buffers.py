@@ -0,0 +1,145 @@
+import stat
+import sys
+import threading
+import time
+import pytest
+from bench.server import SyntheticMedia
+from ytdl.buffers import BufferPool
+from ytdl.mux import StreamMuxer, can_pipe_inputs
+from ytdl.segmented import SegmentedDownloader
+from tests.conftest import MEDIA_SIZE, SEGMENT_SIZE
+
+CHUNK_SIZE = 64 * 1024
+SEGMENT_BUFFERS = SEGMENT_SIZE // CHUNK_SIZE
+
+# Stands in for ffmpeg: probes input 0, then input 1, then reads both in turn like a remux does
+FAKE_FFMPEG = """#!{python}
+import sys
+args = sys.argv[1:]
+specs = [args[index + 1] for index, arg in enumerate(args) if arg == "-i"]
+pipes = [open(0 if spec == "pipe:0" else int(spec.split(":")[1]), "rb", closefd=False) for spec in specs]
+received = [bytearray() for _ in pipes]
+open_inputs = list(range(len(pipes)))
+while open_inputs:
+    for index in list(open_inputs):
+        data = pipes[index].read1(1 << 16)
+        if data:
+            received[index] += data
+        else:
+            open_inputs.remove(index)
+with open(args[-1], "wb") as output:
+    for data in received:
+        output.write(data)
+"""
+
+
+class Stream:
+    def __init__(self, url, filesize):
+        self.url = url
+        self.filesize = filesize
+
+
+def test_acquire_waits_for_a_release_once_the_budget_is_used_up():
+    pool = BufferPool(1024, 2)
+    held = pool.acquire(2)
+    acquired = []
+    waiter = threading.Thread(target=lambda: acquired.extend(pool.acquire()))
+    waiter.start()
+    time.sleep(0.1)
+    assert not acquired
+    pool.release(held[:1])
+    waiter.join(5)
+    assert len(acquired) == 1 and acquired[0] is held[0]  # Reused, not allocated again
+    assert pool.snapshot()["waits"] >= 1
+    assert pool.snapshot()["allocated_bytes"] == 2 * 1024
+
+
+def test_acquire_without_blocking_and_over_the_budget():
+    pool = BufferPool(1024, 2)
+    pool.acquire(2)
+    assert pool.acquire(block=False) is None
+    with pytest.raises(ValueError):
+        pool.acquire(3)
+
+
+def test_reserved_buffers_are_only_lent_to_their_owner():
+    pool = BufferPool(1024, 4)
+    pool.reserve(2)
+    assert pool.acquire(3, block=False) is None
+    others = pool.acquire(2)
+    owned = pool.acquire(2, reserved=True)
+    with pytest.raises(ValueError):
+        pool.acquire(1, reserved=True)
+    pool.release(owned, reserved=True)
+    pool.release(others)
+    pool.unreserve(2)
+    assert pool.acquire(4, block=False) is not None
+
+
+def test_the_budget_must_hold_a_segment_per_merge_input():
+    with pytest.raises(ValueError):
+        SegmentedDownloader(4, SEGMENT_SIZE, buffers=BufferPool(CHUNK_SIZE, 2 * SEGMENT_BUFFERS - 1))
+
+
+def test_streams_sharing_a_small_pool_arrive_intact(server):
+    pool = BufferPool(CHUNK_SIZE, 2 * SEGMENT_BUFFERS)
+    downloader = SegmentedDownloader(4, SEGMENT_SIZE, buffers=pool)
+    video_ids = [server.add_video(0, media={137: SyntheticMedia(MEDIA_SIZE, seed=seed)}) for seed in range(4)]
+    results = {}
+
+    def stream(video_id):
+        chunks = downloader.iter_chunks(server.media_url(video_id, 137), MEDIA_SIZE)
+        results[video_id] = b"".join(bytes(chunk) for chunk in chunks)
+
+    threads = [threading.Thread(target=stream, args=(video_id,), daemon=True) for video_id in video_ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+    for seed, video_id in enumerate(video_ids):
+        assert results[video_id] == b"".join(SyntheticMedia(MEDIA_SIZE, seed=seed).read(0, MEDIA_SIZE - 1))
+    assert pool.snapshot()["peak_bytes"] <= pool.budget
+    assert pool.in_use == 0 and pool.reserved == 0
+
+
+def test_an_abandoned_stream_gives_its_buffers_back(media):
+    url, _ = media
+    pool = BufferPool(CHUNK_SIZE)
+    chunks = SegmentedDownloader(4, SEGMENT_SIZE, buffers=pool).iter_chunks(url, MEDIA_SIZE)
+    next(chunks)
+    chunks.close()
+    assert pool.in_use == 0 and pool.reserved == 0
+
+
+@pytest.mark.skipif(not can_pipe_inputs(), reason="piped merges need POSIX")
+def test_concurrent_piped_merges_on_the_smallest_budget_finish(server, tmp_path):
+    ffmpeg = tmp_path / "ffmpeg"
+    ffmpeg.write_text(FAKE_FFMPEG.format(python=sys.executable))
+    ffmpeg.chmod(ffmpeg.stat().st_mode | stat.S_IEXEC)
+    video, audio = SyntheticMedia(5 * SEGMENT_SIZE + 1, seed=1), SyntheticMedia(3 * SEGMENT_SIZE + 7, seed=2)
+    video_id = server.add_video(0, media={137: video, 140: audio})
+    expected = b"".join(video.read(0, video.size - 1)) + b"".join(audio.read(0, audio.size - 1))
+
+    pool = BufferPool(CHUNK_SIZE, 2 * SEGMENT_BUFFERS)
+    muxer = StreamMuxer(SegmentedDownloader(4, SEGMENT_SIZE, buffers=pool), ffmpeg=str(ffmpeg))
+    paths = [str(tmp_path / f"merged{index}.mp4") for index in range(3)]
+    errors = []
+
+    def merge(path):
+        try:
+            muxer.merge(Stream(server.media_url(video_id, 137), video.size),
+                        Stream(server.media_url(video_id, 140), audio.size), path)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=merge, args=(path,), daemon=True) for path in paths]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(60)
+    assert not any(thread.is_alive() for thread in threads), "merges deadlocked on the buffer pool"
+    assert not errors
+    for path in paths:
+        with open(path, "rb") as fh:
+            assert fh.read() == expected
+    assert pool.in_use == 0 and pool.reserved == 0
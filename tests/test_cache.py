@@ -0,0 +1,86 @@
+import os
+import threading
+import time
+from ytdl.cache import CachedStream, ManifestCache, video_id_from_url
+from ytdl.metadata import VideoDetails
+
+
+def details_for(video_id, expire):
+    stream = CachedStream(itag=18, url=f"https://example.invalid/videoplayback?expire={int(expire)}",
+                          mime_type="video/mp4", resolution="360p", is_progressive=True, filesize=1000)
+    return VideoDetails(f"https://www.youtube.com/watch?v={video_id}", f"Video {video_id}", stream, None, None)
+
+
+def test_video_ids_are_found_in_every_url_form():
+    for url in ("https://www.youtube.com/watch?v=abcdefghijk", "https://youtube.com/shorts/abcdefghijk",
+                "https://youtu.be/abcdefghijk", "https://m.youtube.com/watch?v=abcdefghijk&list=PL1"):
+        assert video_id_from_url(url) == "abcdefghijk"
+    assert video_id_from_url("https://www.youtube.com/") is None
+
+
+def test_entries_expire_before_their_signed_urls():
+    cache = ManifestCache()
+    cache.put(details_for("aaaaaaaaaaa", time.time() + 3600))
+    cache.put(details_for("bbbbbbbbbbb", time.time() + 60))  # Inside the safety margin already
+    assert cache.get("aaaaaaaaaaa").title == "Video aaaaaaaaaaa"
+    assert cache.get("bbbbbbbbbbb") is None
+
+
+def test_the_least_recently_used_entry_is_evicted():
+    cache = ManifestCache(max_entries=2)
+    expire = time.time() + 3600
+    cache.put(details_for("aaaaaaaaaaa", expire))
+    cache.put(details_for("bbbbbbbbbbb", expire))
+    cache.get("aaaaaaaaaaa")
+    cache.put(details_for("ccccccccccc", expire))
+    assert cache.get("bbbbbbbbbbb") is None
+    assert cache.get("aaaaaaaaaaa") is not None and cache.get("ccccccccccc") is not None
+
+
+def test_invalidate_drops_an_entry():
+    cache = ManifestCache()
+    cache.put(details_for("aaaaaaaaaaa", time.time() + 3600))
+    cache.invalidate("aaaaaaaaaaa")
+    assert cache.get("aaaaaaaaaaa") is None
+
+
+def test_entries_survive_a_restart_as_cached_streams(tmp_path):
+    path = str(tmp_path / "manifests.json")
+    ManifestCache(path=path).put(details_for("aaaaaaaaaaa", time.time() + 3600))
+    details = ManifestCache(path=path).get("aaaaaaaaaaa")
+    assert isinstance(details.full_stream, CachedStream)
+    assert details.full_stream.itag == 18 and details.full_stream.filesize == 1000
+
+
+def test_concurrent_first_use_keeps_every_entry(tmp_path):
+    path = str(tmp_path / "manifests.json")
+    expire = time.time() + 3600
+    ManifestCache(path=path).put(details_for("aaaaaaaaaaa", expire))
+    cache = ManifestCache(path=path)
+    barrier = threading.Barrier(8)
+    errors = []
+
+    def put(index):
+        barrier.wait()
+        try:
+            cache.put(details_for(f"video{index:06d}", expire))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=put, args=(index,)) for index in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    reloaded = ManifestCache(path=path)
+    assert all(reloaded.get(video_id) is not None for video_id in ["aaaaaaaaaaa"] + [f"video{i:06d}" for i in range(8)])
+    assert os.listdir(tmp_path) == ["manifests.json"]
+
+
+def test_a_disk_error_leaves_the_memory_cache_working(tmp_path):
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    cache = ManifestCache(path=str(blocker / "manifests.json"))  # Its directory cannot be created
+    cache.put(details_for("aaaaaaaaaaa", time.time() + 3600))
+    assert cache.get("aaaaaaaaaaa") is not None
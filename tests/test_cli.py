@@ -0,0 +1,39 @@
+import pytest
+from ytdl.cli import build_parser, main
+from ytdl.extras import EXTRA_KINDS
+
+
+def parse(*argv):
+    return build_parser().parse_args(["get", *argv, "https://youtu.be/abcdefghijk"])
+
+
+def test_sizes_take_units():
+    args = parse("--segment-size", "2M", "--chunk-size", "128K", "--buffer-memory", "64M")
+    assert args.segment_size == 2 * 1024 * 1024
+    assert args.chunk_size == 128 * 1024
+    assert args.buffer_memory == 64 * 1024 * 1024
+
+
+def test_invalid_values_are_usage_errors():
+    for argv in (["--segment-size", "lots"], ["--extras", "lyrics"], ["--policy", "<=720p60"], ["--format", "flac"]):
+        with pytest.raises(SystemExit) as exited:
+            parse(*argv)
+        assert exited.value.code == 2
+
+
+def test_extras_and_policy_are_parsed_up_front():
+    args = parse("--extras", "all", "--policy", "<=720p, mp4")
+    assert args.extras == EXTRA_KINDS
+    assert args.policy.max_height == 720
+
+
+def test_buffer_memory_must_hold_two_segments():
+    with pytest.raises(SystemExit) as exited:
+        main(["get", "--segment-size", "1M", "--buffer-memory", "1M", "https://youtu.be/abcdefghijk"])
+    assert exited.value.code == 2
+
+
+def test_get_without_a_youtube_url_queues_nothing(tmp_path):
+    args = build_parser().parse_args(["get", "--output", str(tmp_path), "--cache", "", "--history", "",
+                                      "https://example.com/video"])
+    assert args.handler(args) == 2
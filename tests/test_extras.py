@@ -0,0 +1,98 @@
+import datetime
+import json
+import os
+import threading
+import pytest
+from bench.server import THUMBNAIL_SIZE
+from ytdl.extras import CAPTIONS, EXTRA_KINDS, METADATA, ExtrasFetcher, parse_extras
+
+
+class Caption:
+    def __init__(self, code, srt=None):
+        self.code = code
+        self.srt = srt
+
+    def generate_srt_captions(self):
+        if self.srt is None:
+            raise KeyError("no events")
+        return self.srt
+
+
+class YouTube:
+    """
+    The parts of pytubefix's YouTube object the extras read.
+    """
+    def __init__(self, thumbnail_url, caption_tracks):
+        self.thumbnail_url = thumbnail_url
+        self.caption_tracks = caption_tracks
+        self.author = "Someone"
+        self.publish_date = datetime.datetime(2024, 5, 1)
+
+    @property
+    def views(self):
+        raise KeyError("viewCount")  # Like a property pytubefix cannot extract
+
+
+class Done:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.saved, self.failed = [], []
+
+    def __call__(self, path, error):
+        with self.lock:
+            (self.saved if error is None else self.failed).append((os.path.basename(path), error))
+
+
+@pytest.fixture
+def details(server):
+    video_id = server.add_video(1024)
+    details = server.video_details(video_id)
+    details.yt = YouTube(f"{server.base_url}/vi/{video_id}/maxresdefault.jpg",
+                         [Caption("en", "1\n00:00:00,000 --> 00:00:01,000\nHello\n"), Caption("de", "")])
+    return details
+
+
+def test_parse_extras():
+    assert parse_extras("all") == EXTRA_KINDS
+    assert parse_extras(" Captions , metadata") == (CAPTIONS, METADATA)
+    with pytest.raises(ValueError):
+        parse_extras("thumbnail,lyrics")
+
+
+def test_every_extra_is_saved_next_to_the_media(details, tmp_path):
+    done = Done()
+    fetcher = ExtrasFetcher(on_done=done)
+    fetcher.submit(details, str(tmp_path / "video.mp4"))
+    assert fetcher.wait_idle(10)
+    fetcher.shutdown()
+    assert sorted(name for name, _ in done.saved) == ["video.de.srt", "video.en.srt", "video.info.json", "video.jpg"]
+    assert os.path.getsize(tmp_path / "video.jpg") == THUMBNAIL_SIZE
+    assert (tmp_path / "video.en.srt").read_text().endswith("Hello\n")
+    info = json.loads((tmp_path / "video.info.json").read_text())
+    assert info["id"] == details.video_id and info["author"] == "Someone"
+    assert info["publish_date"] == "2024-05-01T00:00:00" and info["views"] is None
+    assert info["streams"]["video"] == details.video_stream.itag
+    assert not any(name.endswith(".part") for name in os.listdir(tmp_path))
+
+
+def test_a_failed_extra_does_not_stop_the_others(details, tmp_path):
+    details.yt.caption_tracks.append(Caption("fr"))
+    done = Done()
+    fetcher = ExtrasFetcher([CAPTIONS], on_done=done)
+    fetcher.submit(details, str(tmp_path / "video.mp4"))
+    assert fetcher.wait_idle(10)
+    fetcher.shutdown()
+    assert sorted(name for name, _ in done.saved) == ["video.de.srt", "video.en.srt"]
+    assert [name for name, _ in done.failed] == ["video.fr.srt"]
+
+
+def test_extras_are_fetched_once_and_never_overwritten(details, tmp_path):
+    (tmp_path / "video.info.json").write_text("{}")
+    done = Done()
+    fetcher = ExtrasFetcher([METADATA, CAPTIONS], on_done=done)
+    fetcher.submit(details, str(tmp_path / "video.mp4"))
+    fetcher.submit(details, str(tmp_path / "video.mp4"))  # A retried job
+    assert fetcher.wait_idle(10)
+    fetcher.shutdown()
+    assert sorted(name for name, _ in done.saved) == ["video.de.srt", "video.en.srt"]
+    assert (tmp_path / "video.info.json").read_text() == "{}"
@@ -0,0 +1,54 @@
+import os
+from ytdl.history import DownloadHistory, infer_type, template_pattern
+from ytdl.integrity import checksum_file, write_sidecar
+
+
+def test_entries_are_found_by_itag_type_and_extension(tmp_path):
+    history = DownloadHistory(str(tmp_path / "history.sqlite3"))
+    mp3, opus = tmp_path / "song-abcdefghijk-140.mp3", tmp_path / "song-abcdefghijk-140.opus"
+    mp3.write_bytes(b"mp3")
+    opus.write_bytes(b"opus")
+    history.record("abcdefghijk", 140, "mp3", str(mp3), title="Song")
+    history.record("abcdefghijk", 140, "mp3", str(opus), title="Song")
+    # Both files of the same audio stream are kept, one per produced extension
+    assert history.find("abcdefghijk", itag=140, ext="mp3").path == str(mp3)
+    assert history.find("abcdefghijk", type_key="mp3", ext="opus").path == str(opus)
+    assert history.find("abcdefghijk", type_key="mp3").path == str(opus)  # The newest one
+    assert history.find("abcdefghijk", type_key="mp4") is None
+    assert len(history.entries_for("abcdefghijk")) == 2
+
+
+def test_entries_of_missing_or_changed_files_are_dropped(tmp_path):
+    history = DownloadHistory(str(tmp_path / "history.sqlite3"))
+    path = tmp_path / "video-abcdefghijk-137.mp4"
+    path.write_bytes(b"video")
+    history.record("abcdefghijk", 137, "mp4", str(path))
+    path.write_bytes(b"truncated or replaced")
+    assert history.find("abcdefghijk", itag=137) is None
+    assert history.entries_for("abcdefghijk") == []
+
+
+def test_a_folder_is_imported_with_its_checksums(tmp_path):
+    names = ["Clip-abcdefghijk-18.mp4", "Clip-abcdefghijk-137+140.mp4", "Song-bcdefghijkl-140.mp3",
+             "notes.txt", "Half-cdefghijklm-137.mp4.part"]
+    for name in names:
+        (tmp_path / name).write_bytes(name.encode())
+    checksum = checksum_file(str(tmp_path / names[0]))
+    write_sidecar(str(tmp_path / names[0]), checksum)
+    history = DownloadHistory(str(tmp_path / "db" / "history.sqlite3"))
+    assert history.import_folder(str(tmp_path)) == 3
+    assert {entry.type_key for entry in history.entries_for("abcdefghijk")} == {"legacy", "best"}
+    assert history.find("abcdefghijk", itag=18).checksum == checksum
+    assert history.find("bcdefghijkl", type_key="mp3", ext="mp3").title == "Song"
+    assert [os.path.basename(entry.path) for entry in history.checksummed(str(tmp_path))] == [names[0]]
+    assert history.import_folder(str(tmp_path)) == 3  # Replaced, not duplicated
+    assert len(history.entries_for("abcdefghijk")) == 2
+
+
+def test_types_are_inferred_from_itags():
+    assert infer_type("18") == "legacy"
+    assert infer_type("137") == "mp4"
+    assert infer_type("137+140") == "best"
+    assert infer_type("251", "webm") == "mp3"
+    assert infer_type("140", "m4a") == "mp3"
+    assert template_pattern("{id}_{itag}.{ext}").match("abcdefghijk_22.mp4").group("itag") == "22"
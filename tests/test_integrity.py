@@ -0,0 +1,57 @@
+import pytest
+from ytdl.integrity import Checksum, IntegrityError, checksum_file, read_sidecar, verify_files, write_sidecar
+from ytdl.segmented import SegmentedDownloader
+from tests.conftest import MEDIA_SIZE, SEGMENT_SIZE
+
+
+def test_the_checksum_of_a_download_matches_the_file(media, tmp_path):
+    url, _ = media
+    path = str(tmp_path / "video.mp4")
+    downloader = SegmentedDownloader(4, SEGMENT_SIZE)
+    checksum = downloader.new_checksum(MEDIA_SIZE)
+    downloader.download(url, path, MEDIA_SIZE, checksum=checksum)
+    assert checksum.finish() == checksum_file(path, SEGMENT_SIZE, checksum.algorithm)
+
+
+def test_blocks_may_arrive_in_any_order():
+    data = bytes(range(256)) * 100
+    in_order, shuffled = Checksum(len(data), 1000), Checksum(len(data), 1000)
+    in_order.update(data)
+    for block in reversed(range(0, len(data), 1000)):
+        shuffled.update_at(data[block:block + 500], block)
+        shuffled.update_at(data[block + 500:block + 1000], block + 500)
+    assert in_order.finish() == shuffled.finish()
+
+
+def test_a_short_transfer_fails_the_size_check():
+    checksum = Checksum(3000, 1000)
+    checksum.update(bytes(2500))
+    with pytest.raises(IntegrityError, match="Size mismatch"):
+        checksum.finish()
+
+
+def test_a_block_written_twice_is_rejected():
+    checksum = Checksum(2000, 1000)
+    checksum.update_at(bytes(1000), 0)
+    with pytest.raises(IntegrityError, match="twice"):
+        checksum.update_at(bytes(1000), 0)
+
+
+def test_verify_reports_corrupted_and_resized_files(tmp_path):
+    paths = []
+    for name in ("good.mp4", "flipped.mp4", "grown.mp4"):
+        path = str(tmp_path / name)
+        with open(path, "wb") as fh:
+            fh.write(bytes(range(256)) * 4096)
+        write_sidecar(path, checksum_file(path, 64 * 1024))
+        paths.append(path)
+    with open(paths[1], "r+b") as fh:
+        fh.seek(5000)
+        fh.write(b"\xff")
+    with open(paths[2], "ab") as fh:
+        fh.write(b"more")
+
+    results = dict(verify_files([(path, *read_sidecar(path)) for path in paths], max_workers=2))
+    assert results[paths[0]] is None
+    assert results[paths[1]] is not None
+    assert "expected" in results[paths[2]]
@@ -0,0 +1,170 @@
+import os
+import threading
+from concurrent.futures import Future
+import pytest
+from ytdl.cache import ManifestCache
+from ytdl.manager import DONE, DOWNLOADING, FAILED, PROCESSING, QUEUED, RESOLVING, DownloadManager, DownloadJob
+from ytdl.segmented import SegmentedDownloader
+from tests.conftest import SEGMENT_SIZE, FlakySession
+
+
+@pytest.fixture
+def video(server):
+    """
+    Resolved details of a fresh fake video, and a cache that resolves its URL without pytubefix.
+    """
+    details = server.video_details(server.add_video(2 * 1024 * 1024))
+    cache = ManifestCache()
+    cache.put(details)
+    return details, cache
+
+
+class StateLog:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.states = {}
+
+    def __call__(self, job):
+        with self.lock:
+            self.states.setdefault(job.id, []).append(job.state)
+
+
+def manager_for(tmp_path, cache, session=None, **options):
+    log = StateLog()
+    segmented = SegmentedDownloader(2, SEGMENT_SIZE, max_retries=0, backoff=0, session=session)
+    manager = DownloadManager(max_workers=2, backoff=0.01, cache=cache, output_dir=str(tmp_path), on_update=log,
+                              segmented=segmented, **options)
+    return manager, log
+
+
+def test_a_job_moves_through_its_states_to_done(video, tmp_path):
+    details, cache = video
+    manager, log = manager_for(tmp_path, cache)
+    job = manager.submit(details.url, "mp4", details=details)
+    assert manager.wait_idle(30)
+    manager.shutdown()
+    assert job.state == DONE and not job.skipped
+    assert log.states[job.id] == [QUEUED, RESOLVING, DOWNLOADING, DONE]
+    with open(job.file_path, "rb") as fh:
+        assert len(fh.read()) == details.video_stream.filesize
+
+
+def test_a_failed_attempt_is_retried(video, tmp_path):
+    details, cache = video
+    session = FlakySession(lambda n: ConnectionResetError("reset") if n == 0 else None)
+    manager, log = manager_for(tmp_path, cache, session)
+    job = manager.submit(details.url, "mp4", details=details)
+    assert manager.wait_idle(30)
+    manager.shutdown()
+    assert job.state == DONE and job.attempts == 1
+    assert log.states[job.id][:4] == [QUEUED, RESOLVING, DOWNLOADING, QUEUED]
+
+
+def test_a_job_fails_once_its_retries_are_used_up(video, tmp_path):
+    details, cache = video
+    session = FlakySession(lambda n: ConnectionResetError("reset"))
+    manager, log = manager_for(tmp_path, cache, session, max_retries=2)
+    job = manager.submit(details.url, "mp4", details=details)
+    assert manager.wait_idle(30)
+    manager.shutdown()
+    assert job.state == FAILED and job.attempts == 3
+    assert log.states[job.id].count(QUEUED) == 3
+    assert "reset" in str(job.error)
+
+
+def test_a_second_submit_of_a_running_job_returns_it(video, tmp_path):
+    details, cache = video
+    manager, _ = manager_for(tmp_path, cache)
+    first = manager.submit(details.url, "mp4", details=details)
+    assert manager.submit(details.url, "mp4", details=details) is first
+    assert manager.wait_idle(30)
+    manager.shutdown()
+
+
+def test_an_existing_file_finishes_the_job_without_a_transfer(video, tmp_path):
+    details, cache = video
+    manager, _ = manager_for(tmp_path, cache)
+    first = manager.submit(details.url, "mp4", details=details)
+    assert manager.wait_idle(30)
+    again = manager.submit(details.url, "mp4", details=details)
+    assert manager.wait_idle(30)
+    manager.shutdown()
+    assert again is not first and again.state == DONE and again.skipped
+    assert again.file_path == first.file_path
+
+
+def test_invalid_transitions_are_rejected(video, tmp_path):
+    details, cache = video
+    manager, _ = manager_for(tmp_path, cache)
+    job = DownloadJob(details.url, "mp4")
+    with pytest.raises(ValueError):
+        manager.set_state(job, DONE)
+    manager.shutdown()
+
+
+class FakeTranscoder:
+    audio_format = "mp3"
+
+    def __init__(self, error=None):
+        self.error = error
+
+    def available(self):
+        return True
+
+    def submit(self, source_path, output_path):
+        if self.error is not None:
+            raise self.error
+        os.replace(source_path, output_path)
+        future = Future()
+        future.set_result(output_path)  # Done before the manager attaches its callback
+        return future
+
+
+def test_an_audio_job_is_processing_until_the_transcoder_finishes(video, tmp_path):
+    details, cache = video
+    manager, log = manager_for(tmp_path, cache, transcoder=FakeTranscoder())
+    job = manager.submit(details.url, "mp3", details=details)
+    assert manager.wait_idle(30)
+    manager.shutdown()
+    assert job.state == DONE and job.file_path.endswith(".mp3")
+    assert log.states[job.id] == [QUEUED, RESOLVING, DOWNLOADING, PROCESSING, DONE]
+
+
+def test_a_rejected_transcode_fails_the_job_and_removes_its_source(video, tmp_path):
+    details, cache = video
+    manager, log = manager_for(tmp_path, cache, transcoder=FakeTranscoder(RuntimeError("pool is shut down")),
+                               max_retries=0)
+    job = manager.submit(details.url, "mp3", details=details)
+    assert manager.wait_idle(30)
+    manager.shutdown()
+    assert job.state == FAILED and "shut down" in str(job.error)
+    assert PROCESSING not in log.states[job.id]
+    assert os.listdir(tmp_path) == []
+
+
+def test_finished_jobs_are_only_kept_as_totals(video, tmp_path):
+    details, cache = video
+    session = FlakySession(lambda n: ConnectionResetError("reset") if n == 0 else None)
+    manager, _ = manager_for(tmp_path, cache, session, max_retries=0)
+    failed = manager.submit(details.url, "mp4", details=details)
+    assert manager.wait_idle(30)
+    done = manager.submit(details.url, "mp4", details=details)
+    assert manager.wait_idle(30)
+    manager.shutdown()
+    assert failed.state == FAILED and done.state == DONE
+    assert manager.active_jobs() == []
+    totals = manager.snapshot()
+    assert totals["done"] == 1 and totals["failed"] == 1 and totals["active"] == 0
+    assert totals["bytes_done"] >= details.video_stream.filesize
+    assert done.details is None and done.title == details.title  # pytubefix's objects are not kept alive
+
+
+def test_links_to_the_same_video_are_one_job(video, tmp_path):
+    details, cache = video
+    manager, _ = manager_for(tmp_path, cache)
+    first = manager.submit(details.url, "mp4", details=details)
+    assert manager.submit(f"https://youtu.be/{details.video_id}", "mp4") is first
+    assert manager.submit(f"https://www.youtube.com/shorts/{details.video_id}", "mp4") is first
+    assert manager.submit(details.url, "legacy", details=details) is not first
+    assert manager.wait_idle(30)
+    manager.shutdown()
@@ -0,0 +1,34 @@
+import os
+import pytest
+from bench.server import SyntheticMedia
+from ytdl.mux import StreamMuxer, can_pipe_inputs
+from ytdl.segmented import SegmentError, SegmentedDownloader
+from tests.conftest import MEDIA_SIZE, SEGMENT_SIZE, FlakySession
+from tests.test_buffers import Stream
+
+
+def open_fds():
+    return set(os.listdir("/proc/self/fd"))
+
+
+@pytest.mark.skipif(not can_pipe_inputs() or not os.path.isdir("/proc/self/fd"), reason="needs POSIX and /proc")
+def test_a_failed_ffmpeg_start_closes_both_pipe_ends(tmp_path):
+    muxer = StreamMuxer(SegmentedDownloader(2, SEGMENT_SIZE), ffmpeg=str(tmp_path / "missing-ffmpeg"))
+    before = open_fds()
+    with pytest.raises(OSError):
+        muxer.merge(Stream("http://127.0.0.1:1/video", 1), Stream("http://127.0.0.1:1/audio", 1),
+                    str(tmp_path / "merged.mp4"))
+    assert open_fds() <= before
+    assert os.listdir(tmp_path) == []
+
+
+def test_a_failed_fetch_leaves_no_temp_inputs_behind(server, tmp_path):
+    video_id = server.add_video(0, media={137: SyntheticMedia(MEDIA_SIZE), 140: SyntheticMedia(SEGMENT_SIZE)})
+    session = FlakySession(lambda n: ConnectionResetError("reset") if n > 0 else None)
+    muxer = StreamMuxer(SegmentedDownloader(1, SEGMENT_SIZE, max_retries=0, backoff=0, session=session),
+                        ffmpeg="ffmpeg")
+    output_path = str(tmp_path / "merged.mp4")
+    with pytest.raises(SegmentError):
+        muxer.merge_from_files("ffmpeg", Stream(server.media_url(video_id, 137), MEDIA_SIZE),
+                               Stream(server.media_url(video_id, 140), SEGMENT_SIZE), output_path, None, None)
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,50 @@
+from ytdl.cache import CachedStream
+from ytdl.metadata import VideoDetails
+from ytdl.naming import OutputNaming, sanitize
+from ytdl.resume import state_path_for
+
+
+def details_for(title, filesize=1000):
+    video = CachedStream(itag=137, url="https://example.invalid/137", mime_type="video/mp4", resolution="1080p",
+                         filesize=filesize)
+    audio = CachedStream(itag=140, url="https://example.invalid/140", mime_type="audio/mp4", abr="128kbps",
+                         filesize=filesize)
+    return VideoDetails("https://www.youtube.com/watch?v=abcdefghijk", title, video, video, audio)
+
+
+def test_sanitize_makes_names_safe_everywhere():
+    assert sanitize('a/b\\c:d*e?"f"<g>|h') == "a_b_c_d_e__f__g__h"
+    assert sanitize("  trailing dots. ") == "trailing dots"
+    assert sanitize("CON.mp4") == "_CON.mp4"
+    assert sanitize("...") == "_"
+
+
+def test_filenames_follow_the_template():
+    details = details_for("My: Video")
+    assert OutputNaming().filename(details, "mp4") == "My_ Video-abcdefghijk-137.mp4"
+    assert OutputNaming().filename(details, "best") == "My_ Video-abcdefghijk-137+140.mp4"
+    assert OutputNaming().filename(details, "mp3") == "My_ Video-abcdefghijk-140.m4a"
+    assert OutputNaming().filename(details, "mp3", "opus") == "My_ Video-abcdefghijk-140.opus"
+    assert OutputNaming("{id}_{resolution}").filename(details, "mp4") == "abcdefghijk_1080p.mp4"
+
+
+def test_long_titles_keep_the_id_and_itag():
+    name = OutputNaming().filename(details_for("x" * 500), "mp4")
+    assert name.endswith("-abcdefghijk-137.mp4") and len(name) <= 200 + len(".mp4")
+
+
+def test_an_earlier_download_is_found_under_its_old_title(tmp_path):
+    (tmp_path / "Old title-abcdefghijk-137.mp4").write_bytes(b"x" * 1000)
+    path = OutputNaming().find_existing(str(tmp_path), details_for("New title"), "mp4")
+    assert path == str(tmp_path / "Old title-abcdefghijk-137.mp4")
+
+
+def test_partial_or_wrong_sized_files_are_not_reused(tmp_path):
+    naming = OutputNaming()
+    details = details_for("Title")
+    path = tmp_path / naming.filename(details, "mp4")
+    path.write_bytes(b"x" * 999)
+    assert naming.find_existing(str(tmp_path), details, "mp4") is None
+    path.write_bytes(b"x" * 1000)
+    open(state_path_for(str(path)), "w").close()  # Still being downloaded
+    assert naming.find_existing(str(tmp_path), details, "mp4") is None
@@ -0,0 +1,63 @@
+import pytest
+from ytdl.cache import CachedStream
+from ytdl.policy import StreamIndex, StreamPolicy, parse_size
+
+MB = 1024 * 1024
+
+
+def stream(itag, mime_type, resolution=None, fps=None, codec=None, bitrate=None, filesize=MB, progressive=False):
+    audio = mime_type.startswith("audio")
+    return CachedStream(itag=itag, url=f"https://example.invalid/{itag}", mime_type=mime_type, resolution=resolution,
+                        fps=fps, video_codec=None if audio else codec, audio_codec=codec if audio else None,
+                        bitrate=bitrate, is_progressive=progressive, filesize=filesize)
+
+
+STREAMS = [
+    stream(18, "video/mp4", "360p", 30, "avc1.42001E", 500000, 10 * MB, progressive=True),
+    stream(137, "video/mp4", "1080p", 30, "avc1.640028", 4000000, 200 * MB),
+    stream(399, "video/mp4", "1080p", 30, "av01.0.08M.08", 2000000, 120 * MB),
+    stream(303, "video/webm", "1080p", 60, "vp9", 5000000, 250 * MB),
+    stream(136, "video/mp4", "720p", 30, "avc1.4d401f", 2000000, 90 * MB),
+    stream(140, "audio/mp4", codec="mp4a.40.2", bitrate=130000, filesize=5 * MB),
+    stream(251, "audio/webm", codec="opus", bitrate=150000, filesize=6 * MB),
+]
+
+
+def itags(picks):
+    return tuple(pick.itag if pick is not None else None for pick in picks)
+
+
+def test_rules_are_parsed():
+    policy = StreamPolicy.parse("≤1080p, <= 30 fps, prefer av1 vp9, cap 2GB, webm")
+    assert policy.max_height == 1080 and policy.max_fps == 30
+    assert policy.prefer_codecs == ("av1", "vp9")
+    assert policy.max_filesize == 2 * 1024 ** 3
+    assert policy.subtype == "webm"
+    assert StreamPolicy.parse("720p, m4a").subtype == "mp4"
+    assert parse_size("1.5K") == 1536
+
+
+@pytest.mark.parametrize("text", ["720p60", "mkv", "sometimes", "<1080p"])
+def test_unknown_rules_are_rejected(text):
+    with pytest.raises(ValueError):
+        StreamPolicy.parse(text)
+
+
+def test_video_defaults_to_mp4_and_audio_to_the_highest_bitrate():
+    assert itags(StreamIndex(STREAMS).select()) == (18, 137, 251)
+
+
+def test_a_container_rule_applies_to_every_pick():
+    assert itags(StreamIndex(STREAMS).select(StreamPolicy.parse("webm"))) == (None, 303, 251)
+    assert itags(StreamIndex(STREAMS).select(StreamPolicy.parse("mp4"))) == (18, 137, 140)
+
+
+def test_caps_and_codec_preferences():
+    index = StreamIndex(STREAMS)
+    assert itags(index.select(StreamPolicy.parse("<=720p"))) == (18, 136, 251)
+    # A preferred codec wins over bitrate at the same resolution, never over resolution
+    assert itags(index.select(StreamPolicy.parse("prefer av1"))) == (18, 399, 251)
+    assert itags(index.select(StreamPolicy.parse("prefer vp9"))) == (18, 137, 251)
+    # The size cap covers video and audio together
+    assert itags(index.select(StreamPolicy.parse("cap 150MB"))) == (18, 399, 251)
+    assert itags(index.select(StreamPolicy.parse("cap 1MB"))) == (None, None, None)
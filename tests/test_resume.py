@@ -0,0 +1,65 @@
+import pytest
+from ytdl.integrity import checksum_file
+from ytdl.resume import ResumeState, find_pending
+from ytdl.segmented import SegmentError, SegmentedDownloader, split_ranges
+from tests.conftest import MEDIA_SIZE, SEGMENT_SIZE, FlakySession
+
+
+def interrupt(url, path, completed_segments):
+    """
+    Download with one connection that dies for good after `completed_segments` segments.
+    """
+    session = FlakySession(lambda n: ConnectionResetError("reset") if n >= completed_segments else None)
+    downloader = SegmentedDownloader(1, SEGMENT_SIZE, max_retries=0, session=session)
+    with pytest.raises(SegmentError):
+        downloader.download(url, path, MEDIA_SIZE, video_id="abcdefghijk", itag=137, extra={"type_key": "mp4"},
+                            checksum=downloader.new_checksum(MEDIA_SIZE))
+
+
+def test_an_interrupted_download_resumes_only_the_missing_segments(media, tmp_path):
+    url, expected = media
+    path = str(tmp_path / "video.mp4")
+    interrupt(url, path, 2)
+
+    state = ResumeState.load(path)
+    assert state.completed == {0, SEGMENT_SIZE}
+    assert [pending.extra for pending in find_pending(str(tmp_path))] == [{"type_key": "mp4"}]
+
+    session = FlakySession()
+    downloader = SegmentedDownloader(2, SEGMENT_SIZE, session=session)
+    checksum = downloader.new_checksum(MEDIA_SIZE)
+    downloader.download(url, path, MEDIA_SIZE, video_id="abcdefghijk", itag=137, checksum=checksum)
+
+    with open(path, "rb") as fh:
+        assert fh.read() == expected
+    requested = sorted(int(value[6:].split("-")[0]) for value in session.ranges)
+    assert requested == [start for start, _ in split_ranges(MEDIA_SIZE, SEGMENT_SIZE)][2:]
+    # Segments from the first run count towards the checksum through their recorded digests
+    assert checksum.finish() == checksum_file(path, SEGMENT_SIZE, checksum.algorithm)
+    assert ResumeState.load(path) is None
+
+
+def test_a_part_file_of_another_stream_starts_over(media, tmp_path):
+    url, expected = media
+    path = str(tmp_path / "video.mp4")
+    interrupt(url, path, 2)
+
+    session = FlakySession()
+    SegmentedDownloader(2, SEGMENT_SIZE, session=session).download(url, path, MEDIA_SIZE, video_id="abcdefghijk", itag=248)
+    with open(path, "rb") as fh:
+        assert fh.read() == expected
+    assert len(session.ranges) == len(split_ranges(MEDIA_SIZE, SEGMENT_SIZE))
+
+
+def test_a_truncated_part_file_starts_over(media, tmp_path):
+    url, expected = media
+    path = str(tmp_path / "video.mp4")
+    interrupt(url, path, 2)
+    with open(path + ".part", "r+b") as fh:
+        fh.truncate(SEGMENT_SIZE)
+
+    session = FlakySession()
+    SegmentedDownloader(2, SEGMENT_SIZE, session=session).download(url, path, MEDIA_SIZE, video_id="abcdefghijk", itag=137)
+    with open(path, "rb") as fh:
+        assert fh.read() == expected
+    assert len(session.ranges) == len(split_ranges(MEDIA_SIZE, SEGMENT_SIZE))
@@ -0,0 +1,126 @@
+import os
+import re
+import pytest
+from ytdl.segmented import DownloadCancelled, SegmentError, SegmentedDownloader, split_ranges
+from tests.conftest import MEDIA_SIZE, SEGMENT_SIZE, FlakySession
+
+
+def read(path):
+    with open(path, "rb") as fh:
+        return fh.read()
+
+
+def range_starts(session):
+    return [int(re.match(r"bytes=(\d+)-", value).group(1)) for value in session.ranges]
+
+
+def test_split_ranges_cover_the_file_without_gaps():
+    ranges = split_ranges(MEDIA_SIZE, SEGMENT_SIZE)
+    assert ranges[0][0] == 0 and ranges[-1][1] == MEDIA_SIZE - 1
+    assert all(end + 1 == next_start for (_, end), (next_start, _) in zip(ranges, ranges[1:]))
+    assert all(end - start + 1 <= SEGMENT_SIZE for start, end in ranges)
+    assert split_ranges(0, SEGMENT_SIZE) == []
+
+
+def test_download_writes_every_segment_in_place(media, tmp_path):
+    url, expected = media
+    session = FlakySession()
+    path = str(tmp_path / "video.mp4")
+    SegmentedDownloader(4, SEGMENT_SIZE, session=session).download(url, path, MEDIA_SIZE)
+    assert read(path) == expected
+    assert sorted(range_starts(session)) == [start for start, _ in split_ranges(MEDIA_SIZE, SEGMENT_SIZE)]
+    assert not os.path.exists(path + ".part")
+
+
+def test_download_probes_an_unknown_size(media, tmp_path):
+    url, expected = media
+    path = str(tmp_path / "video.mp4")
+    SegmentedDownloader(2, SEGMENT_SIZE).download(url, path)
+    assert read(path) == expected
+
+
+def test_cut_off_segments_resume_from_the_last_byte(media, tmp_path):
+    url, expected = media
+    session = FlakySession(lambda n: 100000 if n < 3 else None)
+    path = str(tmp_path / "video.mp4")
+    SegmentedDownloader(1, SEGMENT_SIZE, backoff=0, session=session).download(url, path, MEDIA_SIZE)
+    assert read(path) == expected
+    # The first segment was cut off three times and asked for again from where each attempt stopped
+    assert range_starts(session)[:4] == [0, 100000, 200000, SEGMENT_SIZE]
+
+
+def test_connection_errors_are_retried(media, tmp_path):
+    url, expected = media
+    session = FlakySession(lambda n: ConnectionResetError("reset") if n % 2 == 0 else None)
+    path = str(tmp_path / "video.mp4")
+    SegmentedDownloader(2, SEGMENT_SIZE, backoff=0, session=session).download(url, path, MEDIA_SIZE)
+    assert read(path) == expected
+
+
+def test_a_segment_gives_up_after_max_retries(media, tmp_path):
+    url, _ = media
+    session = FlakySession(lambda n: ConnectionResetError("reset"))
+    downloader = SegmentedDownloader(1, SEGMENT_SIZE, max_retries=2, backoff=0, session=session)
+    with pytest.raises(SegmentError, match="after 3 attempts"):
+        downloader.download(url, str(tmp_path / "video.mp4"), MEDIA_SIZE)
+
+
+def test_an_expired_url_is_refreshed_once(media, tmp_path):
+    url, expected = media
+    stale_url = re.sub(r"expire=\d+", "expire=1", url)
+    refreshed = []
+
+    def refresh_url():
+        refreshed.append(True)
+        return url
+
+    path = str(tmp_path / "video.mp4")
+    SegmentedDownloader(4, SEGMENT_SIZE).download(stale_url, path, MEDIA_SIZE, refresh_url=refresh_url)
+    assert read(path) == expected
+    assert len(refreshed) == 1
+
+
+def test_cancel_stops_transfers_and_keeps_the_part_file(media, tmp_path):
+    url, _ = media
+    downloader = SegmentedDownloader(2, SEGMENT_SIZE)
+    downloader.cancel()
+    path = str(tmp_path / "video.mp4")
+    with pytest.raises(DownloadCancelled):
+        downloader.download(url, path, MEDIA_SIZE, video_id="abcdefghijk", itag=137)
+    assert os.path.exists(path + ".part") and not os.path.exists(path)
+
+
+class HeaderOnlyResponse:
+    def __init__(self, status, headers):
+        self.status = status
+        self.headers = headers
+        self.body_read = self.closed = False
+
+    def getheader(self, name, default=None):
+        return self.headers.get(name, default)
+
+    def read(self, amt=None):
+        self.body_read = True
+        return b"x"
+
+    def close(self):
+        self.closed = True
+
+
+class StubSession:
+    def __init__(self, response):
+        self.response = response
+
+    def request(self, method, url, headers=None):
+        return self.response
+
+
+def test_probe_size_reads_the_size_from_the_headers(media):
+    url, _ = media
+    assert SegmentedDownloader(session=FlakySession()).probe_size(url) == MEDIA_SIZE
+    # A server ignoring the Range header is not read from
+    response = HeaderOnlyResponse(200, {"Content-Length": str(MEDIA_SIZE)})
+    assert SegmentedDownloader(session=StubSession(response)).probe_size(url) == MEDIA_SIZE
+    assert response.closed and not response.body_read
+    with pytest.raises(SegmentError):
+        SegmentedDownloader(session=StubSession(HeaderOnlyResponse(206, {"Content-Range": "bytes 0-0/*"}))).probe_size(url)
@@ -0,0 +1,68 @@
+import socket
+import threading
+from urllib.parse import urlsplit
+from ytdl.session import HttpSession, SessionStats
+
+
+def fetch(session, url):
+    with session.request("GET", url, {"Range": "bytes=0-1023"}) as response:
+        return response.read()
+
+
+def test_stats_add_up_per_host():
+    stats = SessionStats()
+    stats.count("a", requests=1, opened=1)
+    stats.count("a", requests=3, reused=3)
+    stats.count("b", requests=1, opened=1, stale=1)
+    snapshot = stats.snapshot()
+    assert (snapshot["requests"], snapshot["opened"], snapshot["reused"], snapshot["stale"]) == (5, 2, 3, 1)
+    assert snapshot["reuse_ratio"] == 3 / 5
+    assert snapshot["hosts"]["a"] == {"requests": 4, "opened": 1, "reused": 3, "stale": 0}
+
+
+def test_requests_in_turn_reuse_one_connection(media):
+    url, expected = media
+    session = HttpSession()
+    for _ in range(5):
+        assert fetch(session, url) == expected[:1024]
+    stats = session.stats.snapshot()
+    assert (stats["requests"], stats["opened"], stats["reused"]) == (5, 1, 4)
+    assert stats["reuse_ratio"] == 0.8
+    session.close()
+
+
+def test_concurrent_requests_share_at_most_max_per_host_connections(media):
+    url, expected = media
+    session = HttpSession(max_per_host=2)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(fetch(session, url))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert results == [expected[:1024]] * 8
+    stats = session.stats.snapshot()
+    assert stats["requests"] == 8 and stats["opened"] <= 2 and stats["reused"] == 8 - stats["opened"]
+    session.close()
+
+
+def test_a_response_closed_early_does_not_return_its_connection(media):
+    url, _ = media
+    session = HttpSession()
+    session.request("GET", url).close()  # Most of the body unread
+    fetch(session, url)
+    stats = session.stats.snapshot()
+    assert (stats["opened"], stats["reused"]) == (2, 0)
+    session.close()
+
+
+def test_a_connection_dropped_while_idle_is_replaced(media):
+    url, expected = media
+    session = HttpSession()
+    fetch(session, url)
+    parts = urlsplit(url)
+    session.idle[(parts.scheme, parts.netloc)][0].sock.shutdown(socket.SHUT_RDWR)
+    assert fetch(session, url) == expected[:1024]
+    stats = session.stats.snapshot()
+    assert (stats["requests"], stats["opened"], stats["reused"], stats["stale"]) == (2, 2, 1, 1)
+    session.close()
@@ -0,0 +1,20 @@
+from ytdl import startup
+
+
+class FakeApp:
+    def __init__(self):
+        self.idle = []
+
+    def after_idle(self, callback):
+        self.idle.append(callback)
+
+
+def test_work_waits_for_the_first_frame(monkeypatch):
+    monkeypatch.setattr(startup, "marks", [])
+    monkeypatch.setattr(startup, "started_at", 0.0)
+    app, ran = FakeApp(), []
+    startup.first_frame(app, then=lambda: ran.append([label for label, _ in startup.marks]))
+    assert ran == []
+    for callback in app.idle:
+        callback()
+    assert ran == [["first frame"]]
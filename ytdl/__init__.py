@@ -0,0 +1,4 @@
+"""
+** YouTube Downloader core **
+Background helpers shared by the desktop app. Nothing in this package touches Tk.
+"""
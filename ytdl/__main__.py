@@ -0,0 +1,7 @@
+import multiprocessing
+import sys
+from ytdl.cli import main
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
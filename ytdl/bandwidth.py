@@ -0,0 +1,126 @@
+"""
+Bandwidth scheduler.
+A token bucket shared by every transfer. Workers ask for each chunk before reading it; grants go
+to the highest priority class first, under a global rate cap that can change with the time of day.
+"""
+
+import heapq
+import itertools
+import re
+import threading
+import time
+from ytdl.policy import parse_size
+
+# Priority class -> order in which waiting transfers are served
+PRIORITIES = {"urgent": 0, "normal": 1, "bulk": 2}
+URGENT = "urgent"
+NORMAL = "normal"
+BULK = "bulk"
+PAUSED_POLL_INTERVAL = 1.0  # How often a paused transfer checks whether its window is over
+
+
+def parse_rate(text):
+    """
+    Parse a rate such as "5M" or "500KB" (bytes per second). "0" pauses, "none" lifts the cap.
+    """
+    if text is None or text.strip().lower() in ("", "none", "unlimited"):
+        return None
+    return parse_size(text.lower().replace("/s", ""))
+
+
+def minutes_of(clock_time):
+    hours, minutes = clock_time.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+class RateWindow:
+    """
+    A time-of-day window with its own rate, e.g. RateWindow("09:00", "18:00", 1024 ** 2).
+    A window whose end is before its start runs over midnight.
+    """
+    def __init__(self, start, end, rate):
+        self.start = minutes_of(start)
+        self.end = minutes_of(end)
+        self.rate = rate
+
+    @classmethod
+    def parse(cls, text):
+        """
+        Parse "HH:MM-HH:MM=RATE", e.g. "09:00-18:00=1M" or "22:00-06:00=none".
+        """
+        match = re.fullmatch(r"\s*(\d{1,2}:\d{2})\s*-\s*(\d{1,2}:\d{2})\s*=\s*(\S+)\s*", text)
+        if match is None:
+            raise ValueError(f"Invalid rate window {text!r}, expected HH:MM-HH:MM=RATE")
+        return cls(match.group(1), match.group(2), parse_rate(match.group(3)))
+
+    def contains(self, now):
+        minute = now.tm_hour * 60 + now.tm_min
+        if self.start <= self.end:
+            return self.start <= minute < self.end
+        return minute >= self.start or minute < self.end
+
+
+class BandwidthScheduler:
+    """
+    Token bucket holding up to one second of `rate` bytes (None means unlimited). During a window
+    from `windows` its rate applies instead. Waiting transfers are served strictly by priority
+    class and then in arrival order, so a bulk archive never delays an urgent download.
+    """
+    def __init__(self, rate=None, windows=()):
+        self.rate = rate
+        self.windows = list(windows)
+        self.condition = threading.Condition()
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+        self.waiting = []  # Heap of (priority, arrival) tickets
+        self.arrivals = itertools.count()
+
+    def current_rate(self):
+        if self.windows:
+            now = time.localtime()
+            for window in self.windows:
+                if window.contains(now):
+                    return window.rate
+        return self.rate
+
+    def refill(self, rate):
+        now = time.monotonic()
+        self.tokens = min(self.tokens + (now - self.updated) * rate, max(rate, 1))
+        self.updated = now
+
+    def acquire(self, amount, priority=NORMAL):
+        """
+        Block until `amount` bytes may be transferred. A grant larger than the bucket is allowed and
+        paid back before the next one.
+        """
+        if self.current_rate() is None and not self.waiting:
+            return
+        ticket = (PRIORITIES[priority], next(self.arrivals))
+        with self.condition:
+            heapq.heappush(self.waiting, ticket)
+            try:
+                while True:
+                    rate = self.current_rate()
+                    if rate is None:
+                        if self.waiting[0] == ticket:
+                            return
+                        timeout = None
+                    elif rate == 0:
+                        timeout = PAUSED_POLL_INTERVAL
+                    else:
+                        self.refill(rate)
+                        if self.waiting[0] == ticket and self.tokens > 0:
+                            self.tokens -= amount
+                            return
+                        timeout = max(-self.tokens, 1) / rate if self.waiting[0] == ticket else None
+                    self.condition.wait(timeout)
+            finally:
+                self.waiting.remove(ticket)
+                heapq.heapify(self.waiting)
+                self.condition.notify_all()
+
+    def throttle(self, priority=NORMAL):
+        """
+        Return acquire() bound to a priority class, the form transfers take it in.
+        """
+        return lambda amount: self.acquire(amount, priority)
@@ -0,0 +1,117 @@
+"""
+Bounded buffer pool.
+Every network read of the segmented engine lands in a fixed-size bytearray borrowed from one pool
+shared by all transfers, so memory stays flat however large the files and however many jobs run.
+When the pool's budget is used up, readers wait for buffers to come back from the disk writes and
+pipe consumers instead of allocating more. Readers that cannot drain on their own, like the two
+inputs of a piped merge, reserve a share of the budget up front so they never wait on each other.
+"""
+
+import threading
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+class BufferPool:
+    """
+    Up to `max_buffers` reusable bytearrays of `buffer_size` bytes (None for no limit).
+    Buffers are allocated on first use and kept for reuse once released. `reserve()` sets part of
+    the budget aside; it is lent with `acquire(..., reserved=True)` and never to anyone else.
+    """
+    def __init__(self, buffer_size=DEFAULT_CHUNK_SIZE, max_buffers=None):
+        self.buffer_size = buffer_size
+        self.max_buffers = max_buffers
+        self.condition = threading.Condition()
+        self.free = []
+        self.allocated = 0
+        self.in_use = 0
+        self.reserved = 0  # Buffers set aside by reserve(), lent out or not
+        self.reserved_in_use = 0
+        self.peak_in_use = 0
+        self.waits = 0  # How often a reader was held back by the budget
+
+    @classmethod
+    def for_budget(cls, budget, buffer_size=DEFAULT_CHUNK_SIZE):
+        """
+        A pool whose buffers never take more than `budget` bytes in total (None for no limit).
+        """
+        if budget is None:
+            return cls(buffer_size)
+        return cls(buffer_size, max(budget // buffer_size, 1))
+
+    @property
+    def budget(self):
+        return self.max_buffers * self.buffer_size if self.max_buffers is not None else None
+
+    def acquire(self, count=1, block=True, reserved=False):
+        """
+        Borrow `count` buffers at once, waiting while the budget is used up. Returns a list, or
+        None when `block` is false and the buffers are not available right now. With `reserved`
+        the buffers come out of what the caller reserved before and are available at once.
+        """
+        self.check(count)
+        with self.condition:
+            if reserved:
+                if self.reserved_in_use + count > self.reserved:
+                    raise ValueError(f"{count} buffers were not reserved")
+                self.reserved_in_use += count
+            else:
+                while not self.fits(count):
+                    if not block:
+                        return None
+                    self.waits += 1
+                    self.condition.wait()
+            buffers = [self.free.pop() for _ in range(min(count, len(self.free)))]
+            while len(buffers) < count:
+                buffers.append(bytearray(self.buffer_size))
+                self.allocated += 1
+            self.in_use += count
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+            return buffers
+
+    def release(self, buffers, reserved=False):
+        with self.condition:
+            self.free.extend(buffers)
+            self.in_use -= len(buffers)
+            if reserved:
+                self.reserved_in_use -= len(buffers)
+            self.condition.notify_all()
+
+    def reserve(self, count):
+        """
+        Set `count` buffers of the budget aside for the caller, waiting until they are free.
+        Reserve everything that has to make progress together in one call.
+        """
+        self.check(count)
+        with self.condition:
+            while not self.fits(count):
+                self.waits += 1
+                self.condition.wait()
+            self.reserved += count
+
+    def unreserve(self, count):
+        with self.condition:
+            self.reserved -= count
+            self.condition.notify_all()
+
+    def check(self, count):
+        if self.max_buffers is not None and count > self.max_buffers:
+            raise ValueError(f"{count} buffers of {self.buffer_size} bytes do not fit the budget of {self.budget} bytes")
+
+    def fits(self, count):
+        """
+        Whether `count` more buffers fit next to the unreserved ones lent out and the reservations.
+        """
+        if self.max_buffers is None:
+            return True
+        return self.in_use - self.reserved_in_use + self.reserved + count <= self.max_buffers
+
+    def snapshot(self):
+        with self.condition:
+            return {
+                "buffer_size": self.buffer_size,
+                "budget": self.budget,
+                "allocated_bytes": self.allocated * self.buffer_size,
+                "peak_bytes": self.peak_in_use * self.buffer_size,
+                "waits": self.waits,
+            }
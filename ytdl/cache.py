@@ -0,0 +1,237 @@
+"""
+Stream-manifest cache.
+Keeps resolved video details in memory (LRU, keyed by video ID) until the signed stream URLs
+expire, with an optional JSON file so lookups survive a restart.
+"""
+
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse, parse_qs
+from ytdl.session import patch_pytubefix
+
+VIDEO_ID_PATTERN = r'(?:v=|/)([\w-]{11})'
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".ytdl", "manifests.json")
+DEFAULT_TTL = 5 * 60 * 60  # Used when a URL carries no expiry, signed URLs live ~6h
+EXPIRY_MARGIN = 5 * 60  # Stop handing out URLs this long before YouTube rejects them
+
+
+def video_id_from_url(url):
+    """
+    Extract the 11 character video ID from a watch or shorts URL, or None.
+    """
+    match = re.search(VIDEO_ID_PATTERN, url)
+    return match.group(1) if match else None
+
+
+def url_expiry(url):
+    """
+    Return the `expire` timestamp of a signed stream URL, or None if it has none.
+    """
+    try:
+        return int(parse_qs(urlparse(url).query)["expire"][0])
+    except (KeyError, IndexError, ValueError):
+        return None
+
+
+def known_filesize(stream):
+    """
+    Size of a stream as listed in its manifest, without the HEAD request pytubefix's filesize
+    property may issue. 0 when the manifest did not list it.
+    """
+    if isinstance(stream, CachedStream):
+        return stream.filesize or 0
+    return getattr(stream, "_filesize", 0) or 0
+
+
+class CachedStream:
+    """
+    Lightweight stand-in for a pytubefix Stream, rebuilt from the on-disk cache.
+    Exposes the attributes the app reads and can download itself from the signed URL.
+    """
+    FIELDS = ("itag", "url", "mime_type", "resolution", "abr", "fps",
+              "video_codec", "audio_codec", "bitrate", "is_progressive", "title", "filesize")
+
+    def __init__(self, **fields):
+        for name in self.FIELDS:
+            setattr(self, name, fields.get(name))
+        self.type, self.subtype = (self.mime_type or "/").split("/")
+        self.includes_video_track = self.is_progressive or self.type == "video"
+        self.includes_audio_track = self.is_progressive or self.type == "audio"
+        self.on_progress = None  # Same signature as pytubefix's on_progress_callback
+
+    @classmethod
+    def from_stream(cls, stream):
+        if isinstance(stream, cls):
+            return stream
+        fields = {name: getattr(stream, name, None) for name in cls.FIELDS if name != "filesize"}
+        fields["filesize"] = known_filesize(stream)
+        return cls(**fields)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    @property
+    def expiration(self):
+        return url_expiry(self.url)
+
+    def download(self, output_path=None, filename=None, skip_existing=False):
+        from pytubefix import request
+
+        patch_pytubefix()
+
+        file_path = os.path.join(output_path or os.getcwd(), filename or f"{self.title}.{self.subtype}")
+        bytes_remaining = self.filesize or 0
+        with open(file_path, "wb") as fh:
+            for chunk in request.stream(self.url):
+                fh.write(chunk)
+                bytes_remaining -= len(chunk)
+                if self.on_progress:
+                    self.on_progress(self, chunk, max(bytes_remaining, 0))
+        return file_path
+
+
+class ManifestCache:
+    """
+    Thread-safe LRU cache of resolved VideoDetails keyed by video ID.
+
+    Entries expire with the earliest signed URL among the selected streams. When `path` is
+    given, entries are also written to a JSON file and reloaded as CachedStream objects.
+    """
+    def __init__(self, max_entries=64, path=None):
+        self.max_entries = max_entries
+        self.path = path
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()  # One writer of the JSON file at a time
+        self.entries = OrderedDict()  # video_id -> (expires, details)
+        self.loaded = not self.path  # The JSON file is read on first use, not at startup
+
+    def ensure_loaded(self):
+        if self.loaded:
+            return
+        with self.lock:
+            if not self.loaded:  # Another resolver thread may have loaded it while this one waited
+                self.load()
+                self.loaded = True
+
+    def get(self, video_id):
+        self.ensure_loaded()
+        with self.lock:
+            entry = self.entries.get(video_id)
+            if entry is None:
+                return None
+            expires, details = entry
+            if expires <= time.time():
+                del self.entries[video_id]
+                return None
+            self.entries.move_to_end(video_id)
+            return details
+
+    def put(self, details):
+        self.ensure_loaded()
+        expires = details.expires
+        with self.lock:
+            self.entries[details.video_id] = (expires, details)
+            self.entries.move_to_end(details.video_id)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        self.persist()
+
+    def invalidate(self, video_id):
+        self.ensure_loaded()
+        with self.lock:
+            self.entries.pop(video_id, None)
+        self.persist()
+
+    def persist(self):
+        """
+        Save to the JSON file if there is one. The file only speeds up the next start, so a disk
+        error leaves the in-memory cache working.
+        """
+        if self.path:
+            try:
+                self.save()
+            except OSError:
+                pass
+
+    @staticmethod
+    def expiry_for(details):
+        expiries = [url_expiry(stream.url) for stream in details.as_tuple() if stream is not None]
+        expiries = [expiry for expiry in expiries if expiry is not None]
+        if not expiries:
+            return time.time() + DEFAULT_TTL
+        return min(expiries) - EXPIRY_MARGIN
+
+    def load(self):
+        """
+        Load unexpired entries from the JSON file, with the lock held. A missing or corrupt file
+        starts an empty cache.
+        """
+        from ytdl.metadata import VideoDetails
+
+        try:
+            with open(self.path, "r", encoding="utf-8") as fh:
+                data = json.load(fh)
+        except (OSError, ValueError):
+            return
+
+        now = time.time()
+        for entry in data.get("entries", []):
+            if entry["expires"] <= now:
+                continue
+            streams = {item["itag"]: CachedStream(**item) for item in entry["streams"]}
+            selected = entry["selected"]
+            details = VideoDetails(
+                entry["url"], entry["title"],
+                streams.get(selected["full"]), streams.get(selected["video"]), streams.get(selected["audio"]),
+                streams=list(streams.values()),
+            )
+            self.entries[entry["video_id"]] = (entry["expires"], details)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def save(self):
+        """
+        Write the cache to disk atomically so a crash never leaves a half-written file. Concurrent
+        saves take turns, each through a temp file of its own.
+        """
+        with self.save_lock:
+            self.write(self.serialize())
+
+    def serialize(self):
+        with self.lock:
+            entries = []
+            for video_id, (expires, details) in self.entries.items():
+                streams = [CachedStream.from_stream(stream) for stream in details.streams]
+                entries.append({
+                    "video_id": video_id,
+                    "url": details.url,
+                    "title": details.title,
+                    "expires": expires,
+                    "streams": [stream.to_dict() for stream in streams],
+                    "selected": {
+                        "full": getattr(details.full_stream, "itag", None),
+                        "video": getattr(details.video_stream, "itag", None),
+                        "audio": getattr(details.audio_stream, "itag", None),
+                    },
+                })
+        return {"entries": entries}
+
+    def write(self, data):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        fh = tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=directory or ".",
+                                         prefix=os.path.basename(self.path) + ".", suffix=".tmp", delete=False)
+        try:
+            with fh:
+                json.dump(data, fh)
+            os.replace(fh.name, self.path)
+        except BaseException:
+            if os.path.exists(fh.name):
+                os.remove(fh.name)
+            raise
@@ -0,0 +1,333 @@
+"""
+Headless command line interface, sharing the downloader core with the desktop app.
+
+    python -m ytdl get URL [URL ...] [--format best] [--jobs 8] [--output DIR]
+    python -m ytdl daemon [--input FILE] [--follow]
+    python -m ytdl index DIR [--template T]
+    python -m ytdl verify [DIR ...] [--jobs 8]
+
+`get` downloads the given videos, playlists or channels and exits once they are done.
+`daemon` keeps reading "URL [format] [priority]" lines from a file or stdin and queues them as they arrive.
+`index` rebuilds the download history from the files already in a folder.
+`verify` re-checks finished files against the checksums taken while they were downloaded.
+"""
+
+import argparse
+import os
+import signal
+import sys
+import time
+from ytdl.bandwidth import PRIORITIES, BandwidthScheduler, RateWindow, parse_rate
+from ytdl.buffers import DEFAULT_CHUNK_SIZE, BufferPool
+from ytdl.cache import DEFAULT_CACHE_PATH, ManifestCache
+from ytdl.extras import ExtrasFetcher, parse_extras
+from ytdl.history import DEFAULT_HISTORY_PATH, DownloadHistory
+from ytdl.integrity import find_sidecars, verify_files
+from ytdl.manager import DONE, FAILED, DownloadManager
+from ytdl.metadata import DOWNLOAD_TYPES, is_valid_youtube_url
+from ytdl.naming import DEFAULT_TEMPLATE, OutputNaming
+from ytdl.playlist import is_collection_url
+from ytdl.policy import StreamPolicy, parse_size
+from ytdl.progress import describe, format_bytes
+from ytdl.segmented import DEFAULT_SEGMENT_SIZE, SegmentedDownloader
+from ytdl.session import DEFAULT_MAX_PER_HOST, HttpSession, route_pytubefix
+from ytdl.transcode import AUDIO_FORMATS, DEFAULT_BITRATE, Transcoder
+
+FOLLOW_POLL_INTERVAL = 1.0
+
+
+class Stop(Exception):
+    """
+    Raised by the SIGTERM handler to leave the input loop.
+    """
+
+
+def log(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+def build_session(args):
+    """
+    One HTTP session for metadata, playlists and downloads alike.
+    """
+    session = HttpSession(args.max_per_host, http2=args.http2)
+    route_pytubefix(session)
+    return session
+
+
+def build_manager(args, session):
+    os.makedirs(args.output, exist_ok=True)
+    segmented = None
+    if args.connections:
+        segmented = SegmentedDownloader(args.connections, args.segment_size, session=session,
+                                        buffers=BufferPool.for_budget(args.buffer_memory, args.chunk_size))
+
+    def on_update(job):
+        if job.state == DONE and job.metrics is not None and job.metrics.peak_rss:
+            log(f"[done] {job.file_path} (peak RSS {format_bytes(job.metrics.peak_rss)})")
+        elif job.state == DONE:
+            log(f"[{'exists' if job.skipped else 'done'}] {job.file_path}")
+        elif job.state == FAILED:
+            log(f"[failed] {job.url}: {job.error}")
+        elif args.verbose:
+            log(f"[{job.state}] {job.title}")
+
+    def on_progress(job):
+        if args.progress:
+            log(f"[progress] {job.title}: {describe(job.metrics)}")
+
+    def on_collection(url, count, error):
+        if error is not None:
+            log(f"[failed] {url}: {error}")
+        else:
+            log(f"[queued] {count} videos from {url}")
+
+    def on_extra(path, error):
+        if error is not None:
+            log(f"[failed] extra {path}: {error}")
+        elif args.verbose:
+            log(f"[extra] {path}")
+
+    return DownloadManager(
+        max_workers=args.jobs,
+        max_retries=args.retries,
+        cache=ManifestCache(path=args.cache or None),
+        output_dir=args.output,
+        segmented=segmented,
+        transcoder=Transcoder(args.audio_format, args.audio_bitrate),
+        on_update=on_update,
+        on_progress=on_progress,
+        on_collection=on_collection,
+        naming=OutputNaming(args.template),
+        history=DownloadHistory(args.history) if args.history else None,
+        policy=args.policy,
+        bandwidth=BandwidthScheduler(args.limit, args.limit_window) if args.limit is not None or args.limit_window else None,
+        extras=ExtrasFetcher(args.extras, session=session, on_done=on_extra) if args.extras else None,
+    )
+
+
+def finish_extras(manager, wait):
+    """
+    Let the extras still being fetched finish after the last download, unless interrupted.
+    """
+    if manager.extras is not None:
+        if wait:
+            manager.extras.wait_idle()
+        manager.extras.shutdown(wait=wait)
+
+
+def queue(manager, url, type_key, priority):
+    """
+    Queue a video, playlist or channel URL. Returns False for anything else.
+    """
+    if is_collection_url(url):
+        manager.submit_collection(url, type_key, priority=priority)
+    elif is_valid_youtube_url(url):
+        manager.submit(url, type_key, priority=priority)
+    else:
+        log(f"[skipped] not a YouTube video, playlist or channel URL: {url}")
+        return False
+    return True
+
+
+def summarize(manager, started_at, session):
+    totals = manager.snapshot()
+    total_bytes = totals["bytes_done"]
+    elapsed = time.monotonic() - started_at
+    log(f"{totals['done']} done, {totals['failed']} failed, {format_bytes(total_bytes)} "
+        f"in {elapsed:.1f}s ({format_bytes(total_bytes / elapsed if elapsed else 0)}/s)")
+    stats = session.stats.snapshot()
+    log(f"{stats['requests']} HTTP requests on {stats['opened']} connections ({stats['reuse_ratio']:.0%} reused)")
+    if manager.segmented is not None:
+        buffers = manager.segmented.buffers.snapshot()
+        budget = format_bytes(buffers["budget"]) if buffers["budget"] is not None else "no budget"
+        log(f"Buffers peaked at {format_bytes(buffers['peak_bytes'])} ({budget}, {buffers['waits']} waits), "
+            f"peak RSS {format_bytes(totals['peak_rss']) if totals['peak_rss'] else 'unknown'}")
+    return 1 if totals["failed"] else 0
+
+
+def cmd_get(args):
+    session = build_session(args)
+    manager = build_manager(args, session)
+    started_at = time.monotonic()
+    try:
+        if not [url for url in args.urls if queue(manager, url, args.format, args.priority)]:
+            return 2
+        manager.wait_idle()
+        finish_extras(manager, wait=True)
+    except (KeyboardInterrupt, Stop):
+        log("Interrupted, partial downloads are kept and resume on the next run")
+        return 130
+    finally:
+        manager.shutdown()
+        manager.transcoder.shutdown()
+        finish_extras(manager, wait=False)
+        session.close()
+    return summarize(manager, started_at, session)
+
+
+def read_lines(args):
+    """
+    Yield input lines from stdin or a file. With --follow the file is tailed for new lines forever.
+    """
+    if args.input == "-":
+        yield from sys.stdin
+        return
+    with open(args.input, "r", encoding="utf-8") as fh:
+        while True:
+            line = fh.readline()
+            if line:
+                yield line
+            elif args.follow:
+                time.sleep(FOLLOW_POLL_INTERVAL)
+            else:
+                return
+
+
+def cmd_daemon(args):
+    session = build_session(args)
+    manager = build_manager(args, session)
+    started_at = time.monotonic()
+    resumed = manager.resume_pending()
+    if resumed:
+        log(f"[resumed] {len(resumed)} interrupted downloads")
+    try:
+        for line in read_lines(args):
+            fields = line.split()
+            if not fields or fields[0].startswith("#"):
+                continue
+            type_key = fields[1] if len(fields) > 1 else args.format
+            priority = fields[2] if len(fields) > 2 else args.priority
+            if type_key not in DOWNLOAD_TYPES:
+                log(f"[skipped] unknown format {type_key!r} for {fields[0]}")
+                continue
+            if priority not in PRIORITIES:
+                log(f"[skipped] unknown priority {priority!r} for {fields[0]}")
+                continue
+            queue(manager, fields[0], type_key, priority)
+        manager.wait_idle()
+        finish_extras(manager, wait=True)
+    except (KeyboardInterrupt, Stop):
+        log("Stopping, partial downloads are kept and resume on the next start")
+        return 130
+    finally:
+        manager.shutdown()
+        manager.transcoder.shutdown()
+        finish_extras(manager, wait=False)
+        session.close()
+    return summarize(manager, started_at, session)
+
+
+def cmd_index(args):
+    history = DownloadHistory(args.history or DEFAULT_HISTORY_PATH)
+    try:
+        count = history.import_folder(args.directory, args.template)
+    except (OSError, ValueError) as e:
+        log(f"[failed] {args.directory}: {e}")
+        return 1
+    log(f"[indexed] {count} files from {args.directory}")
+    return 0
+
+
+def cmd_verify(args):
+    """
+    Check the files below each DIR against their .checksum sidecars, or without DIR every file in the history.
+    """
+    if args.directories:
+        files = [found for directory in args.directories for found in find_sidecars(directory)]
+    else:
+        history = DownloadHistory(args.history or DEFAULT_HISTORY_PATH)
+        files = [(entry.path, entry.checksum, entry.size) for entry in history.checksummed()]
+    started_at = time.monotonic()
+    corrupt = 0
+    for path, error in verify_files(files, args.jobs):
+        if error is not None:
+            corrupt += 1
+            log(f"[corrupt] {path}: {error}")
+        elif args.verbose:
+            log(f"[ok] {path}")
+    log(f"{len(files) - corrupt} ok, {corrupt} corrupt in {time.monotonic() - started_at:.1f}s")
+    return 1 if corrupt else 0
+
+
+def build_parser():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--format", "-f", choices=list(DOWNLOAD_TYPES), default="best",
+                        help="what to download for each video (default: best)")
+    common.add_argument("--jobs", "-j", type=int, default=4, help="parallel downloads (default: 4)")
+    common.add_argument("--output", "-o", default=os.getcwd(), help="output directory (default: current directory)")
+    common.add_argument("--template", "-t", default=DEFAULT_TEMPLATE,
+                        help="output file name, fields: {title} {id} {itag} {ext} {type} {resolution} {abr} "
+                             f"(default: {DEFAULT_TEMPLATE})")
+    common.add_argument("--connections", type=int, default=4,
+                        help="parallel range requests per stream, 0 for a single pytubefix connection (default: 4)")
+    common.add_argument("--max-per-host", type=int, default=DEFAULT_MAX_PER_HOST,
+                        help=f"open connections per host, shared by all downloads (default: {DEFAULT_MAX_PER_HOST})")
+    common.add_argument("--http2", action="store_true", help="use HTTP/2 when httpx and h2 are installed")
+    common.add_argument("--segment-size", type=parse_size, default=DEFAULT_SEGMENT_SIZE,
+                        help=f"bytes per range request, e.g. 2M (default: {DEFAULT_SEGMENT_SIZE // (1024 * 1024)}M)")
+    common.add_argument("--chunk-size", type=parse_size, default=DEFAULT_CHUNK_SIZE,
+                        help=f"bytes per read and per pooled buffer (default: {DEFAULT_CHUNK_SIZE // 1024}K)")
+    common.add_argument("--buffer-memory", type=parse_size, default=None,
+                        help="memory all downloads may buffer at once, e.g. 256M, at least two segments "
+                             "(default: no limit)")
+    common.add_argument("--policy", "-p", type=StreamPolicy.parse, default=None,
+                        help='stream limits and preferences, e.g. "<=1080p, <=30fps, prefer av1 vp9, cap 2GB, mp4"')
+    common.add_argument("--limit", type=parse_rate, default=None,
+                        help="global bandwidth cap in bytes per second, e.g. 5M (default: unlimited)")
+    common.add_argument("--limit-window", type=RateWindow.parse, action="append", default=[], metavar="HH:MM-HH:MM=RATE",
+                        help="bandwidth cap during a time of day, e.g. 09:00-18:00=1M (repeatable)")
+    common.add_argument("--priority", choices=list(PRIORITIES), default="normal",
+                        help="bandwidth priority of the queued downloads (default: normal)")
+    common.add_argument("--extras", type=parse_extras, default=(),
+                        help="also save these next to each video: thumbnail, captions, metadata, or all "
+                             "(comma separated, fetched alongside the download)")
+    common.add_argument("--retries", type=int, default=3, help="retries per job (default: 3)")
+    common.add_argument("--audio-format", choices=list(AUDIO_FORMATS), default="mp3", help="target of the mp3 format")
+    common.add_argument("--audio-bitrate", default=DEFAULT_BITRATE, help=f"audio bitrate (default: {DEFAULT_BITRATE})")
+    common.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="manifest cache file, empty to keep it in memory")
+    common.add_argument("--history", default=DEFAULT_HISTORY_PATH,
+                        help="index of completed downloads, empty to download everything again")
+    common.add_argument("--progress", action="store_true", help="print throughput and ETA while downloading")
+    common.add_argument("--verbose", "-v", action="store_true", help="print every job state change")
+
+    parser = argparse.ArgumentParser(prog="ytdl", description="Headless YouTube downloader")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    get = commands.add_parser("get", parents=[common], help="download URLs and exit")
+    get.add_argument("urls", nargs="+", metavar="URL", help="video, playlist or channel URLs")
+    get.set_defaults(handler=cmd_get)
+
+    daemon = commands.add_parser("daemon", parents=[common], help="download URLs read from a file or stdin")
+    daemon.add_argument("--input", "-i", default="-", help="file with one 'URL [format] [priority]' per line (default: stdin)")
+    daemon.add_argument("--follow", action="store_true", help="keep watching the input file for new lines")
+    daemon.set_defaults(handler=cmd_daemon)
+
+    index = commands.add_parser("index", help="rebuild the download history from an output folder")
+    index.add_argument("directory", help="folder with earlier downloads")
+    index.add_argument("--template", "-t", default=DEFAULT_TEMPLATE, help="template the files were named with")
+    index.add_argument("--history", default=DEFAULT_HISTORY_PATH, help="history database to rebuild")
+    index.set_defaults(handler=cmd_index)
+
+    verify = commands.add_parser("verify", help="check finished downloads against their checksums")
+    verify.add_argument("directories", nargs="*", metavar="DIR",
+                        help="folders to check through their .checksum files (default: everything in the history)")
+    verify.add_argument("--jobs", "-j", type=int, default=None, help="parallel readers (default: CPU count)")
+    verify.add_argument("--history", default=DEFAULT_HISTORY_PATH, help="history database to check without DIR")
+    verify.add_argument("--verbose", "-v", action="store_true", help="also list the files that are fine")
+    verify.set_defaults(handler=cmd_verify)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if getattr(args, "buffer_memory", None) is not None and \
+            args.buffer_memory // args.chunk_size < 2 * -(-args.segment_size // args.chunk_size):
+        parser.error("--buffer-memory must hold two --segment-size, one for each input of a merge")
+
+    def on_sigterm(signum, frame):
+        raise Stop()
+
+    signal.signal(signal.SIGTERM, on_sigterm)
+    return args.handler(args)
@@ -0,0 +1,187 @@
+"""
+Extras stage.
+Saves a video's thumbnail, every caption track as SRT and a JSON metadata sidecar next to its
+media file. The small fetches run on a pool of their own while the media transfers, so a job is
+done as soon as its media is, whether or not its extras have finished.
+"""
+
+import datetime
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from ytdl.session import HttpSession, patch_pytubefix
+
+THUMBNAIL = "thumbnail"
+CAPTIONS = "captions"
+METADATA = "metadata"
+EXTRA_KINDS = (THUMBNAIL, CAPTIONS, METADATA)
+DEFAULT_WORKERS = 4
+METADATA_SUFFIX = ".info.json"
+
+
+def parse_extras(text):
+    """
+    Parse a comma separated list of extras such as "thumbnail,captions", or "all".
+    """
+    kinds = tuple(kind.strip().lower() for kind in text.split(",") if kind.strip())
+    if kinds == ("all",):
+        return EXTRA_KINDS
+    unknown = [kind for kind in kinds if kind not in EXTRA_KINDS]
+    if unknown:
+        raise ValueError(f"Unknown extras {', '.join(unknown)}, expected {', '.join(EXTRA_KINDS)} or all")
+    return kinds
+
+
+def write_file(path, data):
+    """
+    Write bytes or text to path through a temp file, so a half-written extra is never left behind.
+    """
+    temp_path = path + ".part"
+    with open(temp_path, "wb") as fh:
+        fh.write(data.encode("utf-8") if isinstance(data, str) else data)
+    os.replace(temp_path, path)
+
+
+def attribute(yt, name):
+    """
+    A property of the YouTube object, or None when pytubefix cannot extract it for this video.
+    """
+    try:
+        value = getattr(yt, name)
+    except Exception:
+        return None
+    return value.isoformat() if isinstance(value, (datetime.date, datetime.datetime)) else value
+
+
+class ExtrasFetcher:
+    """
+    Fetch the `kinds` of extras (see EXTRA_KINDS) of resolved videos on `max_workers` threads.
+    The live YouTube object of the details is reused; only details restored from the on-disk
+    manifest cache, which have none, are resolved once more here, off the download's path.
+    `on_done(path, error)` is called from a worker thread for every extra saved or failed.
+    """
+    def __init__(self, kinds=EXTRA_KINDS, max_workers=DEFAULT_WORKERS, session=None, on_done=None):
+        self.kinds = tuple(kinds)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="extras")
+        self.session = session or HttpSession()
+        self.on_done = on_done
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+        self.pending = 0
+        self.submitted = set()  # Base paths already queued, so a retried job does not fetch twice
+        self.closed = False
+
+    def submit(self, details, file_path):
+        """
+        Queue the extras of the video whose media is saved as file_path. Returns at once.
+        """
+        base = os.path.splitext(file_path)[0]
+        with self.lock:
+            if not self.kinds or base in self.submitted or self.closed:
+                return
+            self.submitted.add(base)
+        self.spawn(self.start, details, base)
+
+    def spawn(self, function, *args, path=None):
+        with self.lock:
+            self.pending += 1
+        try:
+            self.executor.submit(self.call, function, args, path)
+        except RuntimeError:
+            self.finished()  # Shut down in the meantime
+
+    def call(self, function, args, path):
+        try:
+            saved = function(*args)
+            if saved is not None and self.on_done:
+                self.on_done(saved, None)
+        except Exception as e:
+            if self.on_done:
+                self.on_done(path or args[-1], e)
+        finally:
+            self.finished()
+
+    def finished(self):
+        with self.lock:
+            self.pending -= 1
+            self.idle.notify_all()
+
+    def start(self, details, base):
+        """
+        Fan the video's extras out into one task each, captions one task per track.
+        """
+        yt = details.yt
+        if yt is None:
+            from pytubefix import YouTube
+
+            patch_pytubefix()
+            yt = YouTube(details.url)
+        if THUMBNAIL in self.kinds:
+            self.spawn(self.save_thumbnail, yt, base)
+        if METADATA in self.kinds:
+            self.spawn(self.save_metadata, yt, details, base, path=base + METADATA_SUFFIX)
+        if CAPTIONS in self.kinds:
+            for caption in yt.caption_tracks:
+                path = f"{base}.{caption.code}.srt"
+                self.spawn(self.save_caption, caption, path, path=path)
+
+    def save_thumbnail(self, yt, base):
+        url = yt.thumbnail_url
+        extension = os.path.splitext(urlsplit(url).path)[1] or ".jpg"
+        path = base + extension
+        if os.path.exists(path):
+            return None
+        with self.session.request("GET", url, {"User-Agent": "Mozilla/5.0"}) as response:
+            data = response.read()
+        if response.status != 200:
+            raise OSError(f"HTTP {response.status} for the thumbnail {url}")
+        write_file(path, data)
+        return path
+
+    def save_caption(self, caption, path):
+        if os.path.exists(path):
+            return None
+        write_file(path, caption.generate_srt_captions())
+        return path
+
+    def save_metadata(self, yt, details, base):
+        path = base + METADATA_SUFFIX
+        if os.path.exists(path):
+            return None
+        info = {
+            "id": details.video_id,
+            "url": details.url,
+            "title": details.title,
+            "author": attribute(yt, "author"),
+            "channel_id": attribute(yt, "channel_id"),
+            "channel_url": attribute(yt, "channel_url"),
+            "publish_date": attribute(yt, "publish_date"),
+            "length": attribute(yt, "length"),
+            "views": attribute(yt, "views"),
+            "keywords": attribute(yt, "keywords"),
+            "description": attribute(yt, "description"),
+            "thumbnail_url": attribute(yt, "thumbnail_url"),
+            "streams": {
+                "full": getattr(details.full_stream, "itag", None),
+                "video": getattr(details.video_stream, "itag", None),
+                "audio": getattr(details.audio_stream, "itag", None),
+            },
+            "fetched_at": time.time(),
+        }
+        write_file(path, json.dumps(info, ensure_ascii=False, indent=2))
+        return path
+
+    def wait_idle(self, timeout=None):
+        """
+        Block until every queued extra is saved or failed. Returns False if the timeout expired first.
+        """
+        with self.lock:
+            return self.idle.wait_for(lambda: not self.pending, timeout)
+
+    def shutdown(self, wait=False):
+        with self.lock:
+            self.closed = True
+        self.executor.shutdown(wait=wait, cancel_futures=not wait)
@@ -0,0 +1,194 @@
+"""
+Download history.
+A local SQLite index (WAL mode) of completed downloads, so "do we already have it?" is an indexed
+lookup instead of a re-resolve and re-transfer. Can be rebuilt from an existing output folder.
+"""
+
+import os
+import re
+import sqlite3
+import string
+import threading
+import time
+from ytdl.integrity import CHECKSUM_SUFFIX, read_sidecar
+from ytdl.metadata import AUDIO_TYPE, MERGED_TYPE
+from ytdl.naming import AUDIO_EXTENSIONS, DEFAULT_TEMPLATE
+
+DEFAULT_HISTORY_PATH = os.path.join(os.path.expanduser("~"), ".ytdl", "history.sqlite3")
+# itags of progressive (video + audio) streams, used to tell legacy files from video-only ones on import
+PROGRESSIVE_ITAGS = {5, 6, 17, 18, 22, 34, 35, 36, 37, 38, 43, 44, 45, 46, 59, 78, 82, 83, 84, 85}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS downloads (
+    video_id TEXT NOT NULL,
+    itag TEXT NOT NULL,
+    ext TEXT NOT NULL,
+    type TEXT NOT NULL,
+    title TEXT,
+    size INTEGER,
+    checksum TEXT,
+    path TEXT NOT NULL,
+    completed_at REAL NOT NULL,
+    PRIMARY KEY (video_id, itag, ext)
+);
+CREATE INDEX IF NOT EXISTS downloads_by_type ON downloads (video_id, type);
+CREATE INDEX IF NOT EXISTS downloads_by_path ON downloads (path);
+"""
+
+
+class HistoryEntry:
+    def __init__(self, video_id, itag, ext, type_key, title, size, checksum, path, completed_at):
+        self.video_id = video_id
+        self.itag = itag
+        self.ext = ext  # Of the file that was produced, e.g. the same audio itag saved as mp3 and as opus
+        self.type_key = type_key
+        self.title = title
+        self.size = size
+        self.checksum = checksum
+        self.path = path
+        self.completed_at = completed_at
+
+    def is_on_disk(self):
+        """
+        The file is still where it was saved, with the size it had when it completed.
+        """
+        try:
+            return self.size is None or os.path.getsize(self.path) == self.size
+        except OSError:
+            return False
+
+
+class DownloadHistory:
+    """
+    Thread-safe access to the history database; every thread gets its own connection.
+    """
+    def __init__(self, path=DEFAULT_HISTORY_PATH):
+        self.path = path
+        self.local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self.connection() as connection:
+            connection.executescript(SCHEMA)
+
+    def connection(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+        return connection
+
+    def record(self, video_id, itag, type_key, path, size=None, checksum=None, title=None):
+        if size is None and os.path.exists(path):
+            size = os.path.getsize(path)
+        with self.connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO downloads VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (video_id, str(itag), extension_of(path), type_key, title, size, checksum, os.path.abspath(path),
+                 time.time()),
+            )
+
+    def find(self, video_id, itag=None, type_key=None, ext=None):
+        """
+        Return the newest entry for a video by itag or by download type whose file is still on disk,
+        only files with extension `ext` when given. Entries whose file has gone are dropped on the way.
+        """
+        if itag is not None:
+            query, parameters = "SELECT * FROM downloads WHERE video_id = ? AND itag = ?", (video_id, str(itag))
+        else:
+            query, parameters = "SELECT * FROM downloads WHERE video_id = ? AND type = ?", (video_id, type_key)
+        if ext is not None:
+            query, parameters = query + " AND ext = ?", parameters + (ext,)
+        for row in self.connection().execute(query + " ORDER BY completed_at DESC", parameters).fetchall():
+            entry = HistoryEntry(*row)
+            if entry.is_on_disk():
+                return entry
+            self.forget(entry.video_id, entry.itag, entry.ext)
+        return None
+
+    def entries_for(self, video_id):
+        rows = self.connection().execute(
+            "SELECT * FROM downloads WHERE video_id = ? ORDER BY completed_at DESC", (video_id,)).fetchall()
+        return [HistoryEntry(*row) for row in rows]
+
+    def checksummed(self, directory=None):
+        """
+        Every entry with a checksum, optionally only those below directory.
+        """
+        query, parameters = "SELECT * FROM downloads WHERE checksum IS NOT NULL", ()
+        if directory is not None:
+            prefix = os.path.join(os.path.abspath(directory), "")
+            query, parameters = query + " AND substr(path, 1, ?) = ?", (len(prefix), prefix)
+        return [HistoryEntry(*row) for row in self.connection().execute(query + " ORDER BY path", parameters)]
+
+    def forget(self, video_id, itag, ext):
+        with self.connection() as connection:
+            connection.execute("DELETE FROM downloads WHERE video_id = ? AND itag = ? AND ext = ?",
+                               (video_id, str(itag), ext))
+
+    def import_folder(self, directory, template=DEFAULT_TEMPLATE):
+        """
+        Rebuild the index for a folder of files named with `template` (which must contain {id} and
+        {itag}). Entries pointing into the folder are replaced in one transaction, with the checksums
+        of files that have a .checksum sidecar. Returns the count.
+        """
+        pattern = template_pattern(template)
+        directory = os.path.abspath(directory)
+        rows = []
+        for entry in os.scandir(directory):
+            match = pattern.match(entry.name)
+            if not entry.is_file() or match is None or entry.name.endswith((".part", CHECKSUM_SUFFIX)):
+                continue
+            fields = match.groupdict()
+            stat = entry.stat()
+            checksum, size = read_sidecar(entry.path) or (None, None)
+            if size is not None and size != stat.st_size:
+                checksum = None  # The file changed after it was hashed, `verify DIR` reports it
+            rows.append((fields["id"], fields["itag"], extension_of(entry.name), infer_type(fields["itag"], fields.get("ext")),
+                         fields.get("title"), stat.st_size, checksum, entry.path, stat.st_mtime))
+
+        prefix = os.path.join(directory, "")
+        with self.connection() as connection:
+            connection.execute("DELETE FROM downloads WHERE substr(path, 1, ?) = ?", (len(prefix), prefix))
+            connection.executemany("INSERT OR REPLACE INTO downloads VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def close(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self.local.connection = None
+
+
+def extension_of(path):
+    return os.path.splitext(path)[1].lstrip(".").lower()
+
+
+def template_pattern(template):
+    """
+    Compile a naming template into a regex that extracts its fields from a file name.
+    """
+    field_patterns = {
+        "id": r"(?P<id>[\w-]{11})",
+        "itag": r"(?P<itag>\d+(?:\+\d+)?)",
+        "ext": r"(?P<ext>\w+)",
+        "title": r"(?P<title>.*)",
+    }
+    if "{id}" not in template or "{itag}" not in template:
+        raise ValueError("The template needs {id} and {itag} to rebuild the history")
+    pattern = ""
+    for literal, field, _, _ in string.Formatter().parse(template):
+        pattern += re.escape(literal)
+        if field is not None:
+            pattern += field_patterns.get(field, r".*?")
+    return re.compile(f"^{pattern}$")
+
+
+def infer_type(itag, extension=None):
+    if "+" in itag:
+        return MERGED_TYPE
+    if extension in AUDIO_EXTENSIONS.values() or extension == "webm" and int(itag) in range(249, 252):
+        return AUDIO_TYPE
+    return "legacy" if int(itag) in PROGRESSIVE_ITAGS else "mp4"
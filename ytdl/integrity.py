@@ -0,0 +1,241 @@
+"""
+Download integrity.
+Checksums are computed from the chunks as they are written, never by reading the file back. A file
+is hashed as a list of fixed-size blocks (the digest of the block digests), so the ranges the
+segmented engine writes in parallel and out of order are each hashed on their own, and a library
+can be verified again with every block of every file on its own core.
+"""
+
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_BLOCK_SIZE = 8 * 1024 * 1024  # Same as the segmented engine's default segment size
+READ_SIZE = 1024 * 1024
+CHECKSUM_SUFFIX = ".checksum"
+
+
+class IntegrityError(Exception):
+    pass
+
+
+def default_algorithm():
+    """
+    BLAKE3 when the blake3 package is installed, SHA-256 otherwise.
+    """
+    try:
+        import blake3  # noqa: F401
+    except ImportError:
+        return "sha256"
+    return "blake3"
+
+
+def new_hash(algorithm):
+    if algorithm == "blake3":
+        import blake3
+
+        return blake3.blake3()
+    import hashlib
+
+    return hashlib.new(algorithm)
+
+
+def parse_checksum(checksum):
+    """
+    Split "algorithm:block size:hex digest" into its parts.
+    """
+    try:
+        algorithm, block_size, digest = checksum.split(":")
+        return algorithm, int(block_size), digest
+    except (AttributeError, ValueError):
+        raise IntegrityError(f"Invalid checksum {checksum!r}")
+
+
+class Checksum:
+    """
+    Block-list digest of one file, fed while it is written. The chunks of a block must arrive in
+    order, but different blocks may be fed in any order and from several threads. `size` is the
+    size the manifest announced, or None when it is not known.
+    """
+    def __init__(self, size=None, block_size=DEFAULT_BLOCK_SIZE, algorithm=None):
+        self.size = size
+        self.block_size = block_size
+        self.algorithm = algorithm or default_algorithm()
+        self.lock = threading.Lock()
+        self.open_blocks = {}  # Block index -> [hash, bytes fed]
+        self.digests = {}  # Block index -> digest of the finished block
+        self.position = 0  # Where update() appends
+
+    def update(self, data):
+        """
+        Feed the next chunk of a file written front to back.
+        """
+        self.update_at(data, self.position)
+        self.position += len(data)
+
+    def update_at(self, data, offset):
+        """
+        Feed a chunk written at offset.
+        """
+        view = memoryview(data)
+        while view:
+            index, block_offset = divmod(offset, self.block_size)
+            piece = view[:self.block_size - block_offset]
+            with self.lock:
+                block = self.open_blocks.get(index)
+                if block is None:
+                    if index in self.digests:
+                        raise IntegrityError(f"Block {index} was written twice")
+                    block = self.open_blocks[index] = [new_hash(self.algorithm), 0]
+            if block[1] != block_offset:
+                raise IntegrityError(f"Block {index} was written out of order at byte {offset}")
+            block[0].update(piece)
+            block[1] += len(piece)
+            if block[1] == self.block_size or self.size is not None and offset + len(piece) == self.size:
+                self.close_block(index)
+            view, offset = view[len(piece):], offset + len(piece)
+
+    def close_block(self, index):
+        with self.lock:
+            block_hash, _ = self.open_blocks.pop(index)
+            self.digests[index] = block_hash.digest()
+
+    def block_digest(self, index):
+        return self.digests.get(index)
+
+    def restore(self, index, digest):
+        """
+        Take the digest of a block written by an earlier run, e.g. a resumed download.
+        """
+        with self.lock:
+            self.digests[index] = digest
+
+    def finish(self):
+        """
+        Check that every byte of the file was fed, then return its checksum string.
+        """
+        size = self.size
+        if size is None:
+            size = self.position
+            for index in list(self.open_blocks):
+                self.close_block(index)  # A file of unknown size ends with a partial block
+        if self.position and self.position != size:
+            raise IntegrityError(f"Size mismatch: wrote {self.position} bytes, expected {size}")
+        expected_blocks = -(-size // self.block_size)
+        if self.open_blocks or sorted(self.digests) != list(range(expected_blocks)):
+            complete = len(set(self.digests) & set(range(expected_blocks)))
+            raise IntegrityError(f"Size mismatch: only {complete} of {expected_blocks} blocks of a {size} byte file are complete")
+        return combine(self.algorithm, self.block_size, (self.digests[index] for index in range(expected_blocks)))
+
+
+def combine(algorithm, block_size, digests):
+    total = new_hash(algorithm)
+    for digest in digests:
+        total.update(digest)
+    return f"{algorithm}:{block_size}:{total.hexdigest()}"
+
+
+def hash_block(path, algorithm, block_size, index):
+    """
+    Digest of one block of a file on disk.
+    """
+    block_hash = new_hash(algorithm)
+    with open(path, "rb") as fh:
+        fh.seek(index * block_size)
+        remaining = block_size
+        while remaining > 0:
+            data = fh.read(min(READ_SIZE, remaining))
+            if not data:
+                break
+            block_hash.update(data)
+            remaining -= len(data)
+    return block_hash.digest()
+
+
+def checksum_file(path, block_size=DEFAULT_BLOCK_SIZE, algorithm=None, executor=None):
+    """
+    Checksum of a file that was not written by ytdl itself, e.g. ffmpeg's output. Blocks are hashed
+    on `executor` when one is given.
+    """
+    algorithm = algorithm or default_algorithm()
+    count = -(-os.path.getsize(path) // block_size)
+    if executor is None:
+        digests = [hash_block(path, algorithm, block_size, index) for index in range(count)]
+    else:
+        digests = executor.map(lambda index: hash_block(path, algorithm, block_size, index), range(count))
+    return combine(algorithm, block_size, digests)
+
+
+def sidecar_path_for(file_path):
+    return file_path + CHECKSUM_SUFFIX
+
+
+def write_sidecar(file_path, checksum):
+    """
+    Store the checksum and size next to the file as `<file>.checksum`.
+    """
+    temp_path = sidecar_path_for(file_path) + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as fh:
+        json.dump({"checksum": checksum, "size": os.path.getsize(file_path)}, fh)
+    os.replace(temp_path, sidecar_path_for(file_path))
+
+
+def read_sidecar(file_path):
+    """
+    Return (checksum, size) from the sidecar of file_path, or None when there is none.
+    """
+    try:
+        with open(sidecar_path_for(file_path), "r", encoding="utf-8") as fh:
+            data = json.load(fh)
+        return data["checksum"], data["size"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def find_sidecars(directory):
+    """
+    Yield (file path, checksum, size) for every file with a sidecar below directory.
+    """
+    for root, _, names in os.walk(directory):
+        for name in names:
+            if name.endswith(CHECKSUM_SUFFIX):
+                file_path = os.path.join(root, name[:-len(CHECKSUM_SUFFIX)])
+                stored = read_sidecar(file_path)
+                if stored is not None:
+                    yield (file_path, *stored)
+
+
+def verify_files(files, max_workers=None):
+    """
+    Check (path, checksum, size) triples against the files on disk and yield (path, error) for
+    each, in order; error is None for a good file. Sizes are checked first, then the blocks of all
+    files are hashed in parallel.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count() or 1, thread_name_prefix="verify") as executor:
+        pending = []
+        for path, checksum, size in files:
+            try:
+                algorithm, block_size, _ = parse_checksum(checksum)
+                actual_size = os.path.getsize(path)
+            except (IntegrityError, OSError) as e:
+                pending.append((path, checksum, str(e)))
+                continue
+            if size is not None and actual_size != size:
+                pending.append((path, checksum, f"size is {actual_size} bytes, expected {size}"))
+                continue
+            futures = [executor.submit(hash_block, path, algorithm, block_size, index)
+                       for index in range(-(-actual_size // block_size))]
+            pending.append((path, checksum, futures))
+
+        for path, checksum, result in pending:
+            if isinstance(result, str):
+                yield path, result
+                continue
+            try:
+                algorithm, block_size, _ = parse_checksum(checksum)
+                actual = combine(algorithm, block_size, (future.result() for future in result))
+            except OSError as e:
+                yield path, str(e)
+                continue
+            yield path, None if actual == checksum else "checksum mismatch"
@@ -0,0 +1,555 @@
+"""
+Download queue.
+Runs download jobs on a bounded worker pool, tracks each job through a small state machine
+and retries failed jobs with exponential backoff. Metadata for queued jobs is resolved ahead
+of time on a separate bounded pool, so titles show up while downloads are still waiting.
+"""
+
+import itertools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from ytdl.bandwidth import NORMAL
+from ytdl.integrity import Checksum, checksum_file, read_sidecar, write_sidecar
+from ytdl.metadata import AUDIO_TYPE, DOWNLOAD_TYPES, MERGED_TYPE, fetch_details, refresh_stream_url
+from ytdl.naming import AUDIO_EXTENSIONS, OutputNaming
+from ytdl.cache import CachedStream, known_filesize, video_id_from_url
+from ytdl.mux import StreamMuxer
+from ytdl.progress import TransferMetrics
+from ytdl.playlist import iter_video_urls
+from ytdl.resume import PART_SUFFIX, find_pending
+from ytdl.segmented import DownloadCancelled, SegmentedDownloader
+from ytdl.transcode import output_path_for
+
+# Job states
+QUEUED = "queued"
+RESOLVING = "resolving"
+DOWNLOADING = "downloading"
+PROCESSING = "processing"
+DONE = "done"
+FAILED = "failed"
+
+TRANSITIONS = {
+    QUEUED: {RESOLVING, FAILED},
+    RESOLVING: {DOWNLOADING, DONE, QUEUED, FAILED},  # Straight to done when the file already exists
+    DOWNLOADING: {PROCESSING, DONE, QUEUED, FAILED},
+    PROCESSING: {DONE, FAILED},
+    DONE: set(),
+    FAILED: set(),
+}
+ACTIVE_STATES = {QUEUED, RESOLVING, DOWNLOADING, PROCESSING}
+
+
+def dedupe_key(url, type_key):
+    """
+    Jobs for the same key are one download; a second submit returns the job already in flight.
+    The video ID stands for the URL, so youtu.be, shorts and watch links to one video are the same
+    download; only a URL without an ID is compared as is.
+    """
+    return video_id_from_url(url) or url, type_key
+
+
+class DownloadJob:
+    """
+    A single URL to download with one of the stream types ("legacy", "mp4", "mp3", "best").
+    `filename` is rendered from the manager's naming template once the video is resolved,
+    unless it is given up front (e.g. when resuming a .part file). `policy` (a
+    ytdl.policy.StreamPolicy) overrides which streams are picked, e.g. to cap resolution or size.
+    `priority` is its class in the bandwidth scheduler ("urgent", "normal" or "bulk").
+    """
+    _ids = itertools.count(1)
+
+    def __init__(self, url, type_key, filename=None, details=None, policy=None, priority=NORMAL):
+        self.id = next(self._ids)
+        self.url = url
+        self.type_key = type_key
+        self.policy = policy
+        self.priority = priority
+        self.filename = filename
+        self.details = details
+        self.resolve_future = None
+        self.metrics = None
+        self.state = QUEUED
+        self.attempts = 0
+        self.error = None
+        self.file_path = None
+        self.checksum = None  # "algorithm:block size:digest" of the finished file, see ytdl.integrity
+        self.skipped = False  # True when an earlier complete download was found
+        self.finished_title = None
+
+    @property
+    def title(self):
+        if self.details is not None:
+            return self.details.title
+        return self.finished_title or self.url
+
+    def release_details(self):
+        """
+        Drop the resolved details, and with them pytubefix's YouTube object, once the job is over.
+        """
+        if self.details is not None:
+            self.finished_title = self.details.title
+            self.details = None
+
+    def is_active(self):
+        return self.state in ACTIVE_STATES
+
+
+class DownloadManager:
+    """
+    Bounded download queue shared by the UI.
+
+    `on_update(job)` is called from worker threads every time a job changes state,
+    `on_progress(job)` at most every few hundred milliseconds while a job transfers (see
+    job.metrics), and `on_collection(url, count, error)` once a playlist or channel has been
+    fully expanded; UI callers must marshal all of them back to the Tk thread.
+    Finished jobs are not kept, only the totals returned by snapshot().
+
+    Every finished file gets a `<file>.checksum` sidecar, hashed while it was written.
+    With a `history` (ytdl.history.DownloadHistory) a video already downloaded in the requested
+    type is finished without being resolved, and every completed download is recorded in it.
+    `policy` is the stream policy of jobs submitted without one of their own. With a `bandwidth`
+    (ytdl.bandwidth.BandwidthScheduler) every transfer draws its chunks from it by job priority.
+    With `extras` (ytdl.extras.ExtrasFetcher) a job's thumbnail, captions and metadata sidecar are
+    queued there as its download starts; the job does not wait for them.
+    """
+    def __init__(self, max_workers=3, max_retries=3, backoff=2.0, cache=None, output_dir=None,
+                 on_update=None, max_resolvers=8, on_collection=None, segmented=None, muxer=None, transcoder=None, on_progress=None, naming=None,
+                 history=None, policy=None, bandwidth=None, extras=None):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="download")
+        self.resolve_executor = ThreadPoolExecutor(max_workers=max_resolvers, thread_name_prefix="resolve")
+        # Hashes and records transcoded files, off the process pool's result thread and the download queue
+        self.finish_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="finish")
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.cache = cache
+        self.output_dir = output_dir or os.getcwd()
+        self.on_update = on_update
+        self.on_collection = on_collection
+        self.on_progress = on_progress
+        self.segmented = segmented  # Optional SegmentedDownloader used instead of stream.download
+        # Merges share the segmented downloader's session and buffers; without one they get their own
+        self.muxer = muxer or StreamMuxer(segmented or SegmentedDownloader())
+        self.transcoder = transcoder  # Optional Transcoder turning audio downloads into real MP3/Opus/AAC
+        self.naming = naming or OutputNaming()
+        self.history = history
+        self.policy = policy
+        self.bandwidth = bandwidth
+        self.extras = extras
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+        self.expanding = 0  # Playlists and channels still being listed
+        self.active = {}  # dedupe_key() -> job still queued, resolving, downloading or processing
+        self.totals = {"done": 0, "failed": 0, "bytes_done": 0, "peak_rss": 0}
+        self.stream_jobs = {}  # id(stream) -> (job, checksum), routes pytubefix progress callbacks
+        self.timers = set()
+        self.closed = False
+
+    def submit(self, url, type_key, filename=None, details=None, policy=None, priority=NORMAL):
+        """
+        Queue a download. Clicking twice on the same video and type returns the job already in flight.
+        """
+        entry = self.find_in_history(url, type_key) if filename is None else None
+        key = dedupe_key(url, type_key)
+        with self.lock:
+            job = self.active.get(key)
+            if job is not None:
+                return job
+            job = DownloadJob(url, type_key, filename, details, policy or self.policy, priority)
+            if entry is not None:
+                job.file_path, job.skipped = entry.path, True
+            self.active[key] = job
+            if details is None and entry is None:
+                job.resolve_future = self.resolve_executor.submit(self.prefetch, job)
+        self.notify(job)
+        self.executor.submit(self.run, job)
+        return job
+
+    def submit_collection(self, url, type_key, policy=None, priority=NORMAL):
+        """
+        Expand a playlist or channel URL on a background thread and queue each video as soon as
+        its page is listed.
+        """
+        def expand():
+            count, error = 0, None
+            try:
+                try:
+                    for video_url in iter_video_urls(url):
+                        if self.closed:
+                            break
+                        self.submit(video_url, type_key, policy=policy, priority=priority)
+                        count += 1
+                except Exception as e:
+                    error = e
+                if self.on_collection:
+                    self.on_collection(url, count, error)
+            finally:
+                with self.lock:
+                    self.expanding -= 1
+                    self.idle.notify_all()
+
+        with self.lock:
+            self.expanding += 1
+        threading.Thread(target=expand, name="ingest", daemon=True).start()
+
+    def prefetch(self, job):
+        """
+        Resolve a queued job's metadata ahead of its download slot.
+        """
+        details = fetch_details(job.url, self.cache)
+        if job.details is None and job.is_active():
+            job.details = details
+            self.notify(job)
+        return details
+
+    def resolve(self, job):
+        future, job.resolve_future = job.resolve_future, None
+        if future is not None:
+            try:
+                return future.result()
+            except Exception:
+                pass  # Resolve again inline so the failure counts towards this attempt
+        return fetch_details(job.url, self.cache)
+
+    def run(self, job):
+        try:
+            self.set_state(job, RESOLVING)
+            if job.skipped:
+                self.set_state(job, DONE)
+                return
+            if job.details is None or not job.details.is_fresh():
+                job.details = self.resolve(job)
+            if job.policy is not None:
+                job.details = job.details.with_policy(job.policy)
+            if job.details.stream_for(job.type_key) is None or job.type_key == MERGED_TYPE and job.details.audio_stream is None:
+                raise LookupError(f"No {DOWNLOAD_TYPES[job.type_key]} stream matches the stream policy")
+
+            audio_format = self.audio_format()
+            if job.filename is None:
+                job.filename = self.naming.filename(job.details, job.type_key, audio_format)
+            existing = self.find_existing(job, audio_format)
+            if existing is not None:
+                job.file_path, job.skipped = existing, True
+                self.set_state(job, DONE)
+                return
+
+            job.metrics = TransferMetrics(on_report=lambda metrics: self.report_progress(job))
+            self.set_state(job, DOWNLOADING)
+            if self.extras is not None:
+                self.extras.submit(job.details, os.path.join(self.output_dir, job.filename))
+            if job.type_key == MERGED_TYPE:
+                job.file_path = self.merge_streams(job)
+            elif job.type_key == AUDIO_TYPE:
+                if self.download_audio(job):
+                    return  # Finished by the transcoder callback
+            else:
+                job.file_path = self.download_stream(job, job.details.stream_for(job.type_key))
+            self.set_state(job, DONE)
+        except Exception as e:
+            self.retry_or_fail(job, e)
+
+    def find_in_history(self, url, type_key):
+        """
+        Look a URL up in the history before anything is resolved. Returns the entry or None.
+        """
+        video_id = video_id_from_url(url)
+        if self.history is None or not video_id:
+            return None
+        audio_format = self.audio_format() if type_key == AUDIO_TYPE else None
+        # Without ffmpeg audio is kept in its container, whose extension is only known once resolved
+        return self.history.find(video_id, type_key=type_key, ext=AUDIO_EXTENSIONS[audio_format] if audio_format else None)
+
+    def find_existing(self, job, audio_format):
+        """
+        Find an earlier download of the resolved streams, in the history first and then in the output folder.
+        """
+        fields = self.naming.fields(job.details, job.type_key, audio_format)
+        if self.history is not None:
+            entry = self.history.find(job.details.video_id, itag=fields["itag"], ext=fields["ext"])
+            if entry is not None:
+                return entry.path
+        path = self.naming.find_existing(self.output_dir, job.details, job.type_key, audio_format)
+        if path is not None:
+            job.file_path = path
+            self.remember(job)  # Found on disk but missing from the history, e.g. downloaded elsewhere
+        return path
+
+    def remember(self, job):
+        if self.history is None or job.details is None or job.file_path is None:
+            return
+        try:
+            itag = self.naming.fields(job.details, job.type_key, self.audio_format())["itag"]
+            checksum = job.checksum or (read_sidecar(job.file_path) or (None,))[0]
+            self.history.record(job.details.video_id, itag, job.type_key, job.file_path, checksum=checksum,
+                                title=job.details.title)
+        except Exception:
+            pass  # The history only saves work later, a failed insert must not fail a finished download
+
+    def store_checksum(self, job):
+        if job.checksum is None or job.file_path is None:
+            return
+        try:
+            write_sidecar(job.file_path, job.checksum)
+        except OSError:
+            pass  # The file itself is complete and checked, only a later `verify` will miss it
+
+    def audio_format(self):
+        """
+        Target format of the mp3 type, or None when audio is saved as downloaded (no ffmpeg).
+        """
+        if self.transcoder is None or not self.transcoder.available():
+            return None
+        return self.transcoder.audio_format
+
+    def download_stream(self, job, stream, filename=None):
+        """
+        Save a stream with the segmented engine when one is configured. SABR streams are not plain
+        HTTP ranges and always go through pytubefix. Either way the data is hashed and its size
+        checked against the manifest as it is written, and job.checksum is set.
+        """
+        filename = filename or job.filename
+        job.metrics.add_total(stream.filesize)
+        if self.segmented is None or getattr(stream, "is_sabr", False):
+            checksum = Checksum(known_filesize(stream) or None)
+            file_path = self.download_with_pytubefix(job, stream, filename, checksum)
+            job.checksum = checksum.finish()
+            return file_path
+        checksum = self.segmented.new_checksum(stream.filesize)
+        file_path = self.segmented.download(
+            stream.url,
+            os.path.join(self.output_dir, filename),
+            stream.filesize,
+            video_id=job.details.video_id,
+            itag=stream.itag,
+            refresh_url=lambda: refresh_stream_url(job.url, stream.itag, self.cache),
+            extra={"url": job.url, "type_key": job.type_key, "filename": job.filename},
+            progress=job.metrics,
+            throttle=self.throttle_for(job),
+            checksum=checksum,
+        )
+        job.checksum = checksum.finish()
+        return file_path
+
+    def throttle_for(self, job):
+        if self.bandwidth is None:
+            return None
+        return self.bandwidth.throttle(job.priority)
+
+    def download_with_pytubefix(self, job, stream, filename, checksum):
+        """
+        Let pytubefix download the stream, with its on_progress callback feeding the job's metrics
+        and `checksum`. The data goes to a .part file that is renamed once its size checks out.
+        """
+        with self.lock:
+            self.stream_jobs[id(stream)] = job, checksum
+        if isinstance(stream, CachedStream):
+            stream.on_progress = self.on_stream_progress
+        elif job.details.yt is not None:
+            job.details.yt.register_on_progress_callback(self.on_stream_progress)
+        try:
+            part_path = stream.download(output_path=self.output_dir, filename=filename + PART_SUFFIX, skip_existing=False)
+            checksum.finish()  # Raises on a truncated transfer before the file gets its real name
+            file_path = os.path.join(self.output_dir, filename)
+            os.replace(part_path, file_path)
+            return file_path
+        finally:
+            with self.lock:
+                self.stream_jobs.pop(id(stream), None)
+
+    def on_stream_progress(self, stream, chunk, bytes_remaining):
+        with self.lock:
+            job, checksum = self.stream_jobs.get(id(stream), (None, None))
+        if job is not None:
+            if self.closed:
+                raise DownloadCancelled("Download cancelled")  # pytubefix stops and leaves its .part file
+            checksum.update(chunk)
+            job.metrics.add(len(chunk))
+            if self.bandwidth is not None:
+                # pytubefix reads in large chunks, so it is paced after each one instead of before
+                self.bandwidth.acquire(len(chunk), job.priority)
+
+    def report_progress(self, job):
+        if self.on_progress:
+            self.on_progress(job)
+
+    def download_audio(self, job):
+        """
+        Download the audio stream under its real container extension, then hand it to the transcoder.
+        Returns True when the job was handed off; without ffmpeg the untouched stream is kept as is
+        rather than being mislabelled as an .mp3.
+        """
+        stream = job.details.audio_stream
+        extension = "m4a" if stream.subtype == "mp4" else stream.subtype
+        base = os.path.splitext(job.filename)[0]
+        source_path = self.download_stream(job, stream, f"{base}.source.{extension}")
+
+        if self.transcoder is None or not self.transcoder.available():
+            job.file_path = os.path.join(self.output_dir, f"{base}.{extension}")
+            os.replace(source_path, job.file_path)
+            return False
+
+        job.checksum = None  # The checksum of the source, not of the transcoded file
+        output_path = output_path_for(os.path.join(self.output_dir, job.filename), self.transcoder.audio_format)
+        try:
+            future = self.transcoder.submit(source_path, output_path)
+        except Exception:
+            os.remove(source_path)  # Still downloading, so the job is retried or failed like any other error
+            raise
+        # Processing before the callback is attached, which runs right away when the future is already done
+        self.set_state(job, PROCESSING)
+        future.add_done_callback(lambda future: self.hand_off(self.transcoded, job, future, source_path))
+        return True
+
+    def hand_off(self, function, *args):
+        """
+        Run a done callback of the transcoder's process pool on the finish thread instead, so hashing
+        and the history insert do not hold up the pool's thread that delivers every other result.
+        """
+        try:
+            self.finish_executor.submit(function, *args)
+        except RuntimeError:
+            function(*args)  # Shut down in the meantime
+
+    def transcoded(self, job, future, source_path):
+        if future.cancelled() or future.exception() is not None:
+            job.error = "Cancelled" if future.cancelled() else future.exception()
+            try:
+                os.remove(source_path)  # A retry downloads the source again, so it would only be left behind
+            except OSError:
+                pass
+            self.set_state(job, FAILED)
+        else:
+            job.file_path = future.result()
+            try:
+                job.checksum = checksum_file(job.file_path)  # Written by ffmpeg, so hashed afterwards
+            except OSError as e:
+                job.error = e
+                self.set_state(job, FAILED)
+                return
+            self.set_state(job, DONE)
+
+    def merge_streams(self, job):
+        """
+        Fetch the best video and audio streams together and remux them into one file.
+        """
+        video, audio = job.details.video_stream, job.details.audio_stream
+        job.metrics.add_total(video.filesize + audio.filesize)
+        file_path = self.muxer.merge(
+            video, audio, os.path.join(self.output_dir, job.filename),
+            refresh_video=lambda: refresh_stream_url(job.url, video.itag, self.cache),
+            refresh_audio=lambda: refresh_stream_url(job.url, audio.itag, self.cache),
+            progress=job.metrics,
+            throttle=self.throttle_for(job),
+        )
+        # ffmpeg writes the output itself; the inputs were size checked on the way in, the output is hashed once it exists
+        job.checksum = checksum_file(file_path)
+        return file_path
+
+    def resume_pending(self):
+        """
+        Re-queue downloads that were interrupted by a crash or shutdown. Returns the new jobs.
+        """
+        jobs = []
+        for state in find_pending(self.output_dir):
+            extra = state.extra
+            if {"url", "type_key", "filename"} <= extra.keys():
+                jobs.append(self.submit(extra["url"], extra["type_key"], extra["filename"]))
+        return jobs
+
+    def retry_or_fail(self, job, error):
+        job.attempts += 1
+        job.error = error
+        if job.attempts > self.max_retries or self.closed:
+            self.set_state(job, FAILED)
+            return
+
+        # Signed URLs may be the cause of the failure, re-resolve on the next attempt
+        job.details = None
+        self.set_state(job, QUEUED)
+        delay = self.backoff * (2 ** (job.attempts - 1))
+        timer = threading.Timer(delay, self.resubmit, args=(job,))
+        timer.daemon = True
+        with self.lock:
+            self.timers.add(timer)
+        timer.start()
+
+    def resubmit(self, job):
+        with self.lock:
+            self.timers = {timer for timer in self.timers if timer.is_alive() and timer is not threading.current_thread()}
+            if self.closed:
+                return
+        self.executor.submit(self.run, job)
+
+    def set_state(self, job, state):
+        if state != job.state and state not in TRANSITIONS[job.state]:
+            raise ValueError(f"Invalid job transition {job.state} -> {state}")
+        if state in (PROCESSING, DONE) and job.metrics is not None and job.metrics.finished_at is None:
+            job.metrics.finish()
+        finishing = job.is_active() and state in (DONE, FAILED)
+        job.state = state
+        if state == DONE and not job.skipped:
+            self.store_checksum(job)
+            self.remember(job)
+        if finishing:
+            job.release_details()
+            self.forget(job)
+        self.notify(job)
+        if finishing:
+            with self.lock:
+                self.idle.notify_all()
+
+    def forget(self, job):
+        """
+        Take a finished job out of the queue, counting it towards the totals.
+        """
+        with self.lock:
+            key = dedupe_key(job.url, job.type_key)
+            if self.active.get(key) is job:
+                del self.active[key]
+            self.totals["done" if job.state == DONE else "failed"] += 1
+            if job.metrics is not None:
+                self.totals["bytes_done"] += job.metrics.bytes_done
+                self.totals["peak_rss"] = max(self.totals["peak_rss"], job.metrics.peak_rss or 0)
+
+    def snapshot(self):
+        """
+        Totals of the jobs finished so far: done and failed counts, bytes transferred and the peak RSS seen.
+        """
+        with self.lock:
+            return dict(self.totals, active=len(self.active))
+
+    def notify(self, job):
+        if self.on_update:
+            self.on_update(job)
+
+    def active_jobs(self):
+        with self.lock:
+            return list(self.active.values())
+
+    def wait_idle(self, timeout=None):
+        """
+        Block until every queued job has finished and no playlist is still being expanded.
+        Returns False if the timeout expired first.
+        """
+        def is_idle():
+            return not self.expanding and not self.active
+
+        with self.lock:
+            return self.idle.wait_for(is_idle, timeout)
+
+    def shutdown(self, wait=False):
+        """
+        Stop taking jobs. Unless `wait` is set, transfers in flight are cancelled at their next chunk
+        and keep what they have written for resume_pending().
+        """
+        with self.lock:
+            self.closed = True
+            for timer in self.timers:
+                timer.cancel()
+            self.timers.clear()
+        if not wait:
+            for downloader in {self.segmented, self.muxer.downloader} - {None}:
+                downloader.cancel()
+        self.resolve_executor.shutdown(wait=False, cancel_futures=True)
+        self.executor.shutdown(wait=wait, cancel_futures=True)
+        self.finish_executor.shutdown(wait=wait)
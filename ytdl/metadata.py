@@ -0,0 +1,196 @@
+"""
+Background metadata stage.
+Resolves a YouTube URL into a title and its selected streams on a worker pool,
+so network I/O never runs on the Tk event loop.
+"""
+
+import copy
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from ytdl.cache import ManifestCache, video_id_from_url
+from ytdl.policy import DEFAULT_POLICY, StreamIndex
+from ytdl.session import patch_pytubefix
+
+URL_PATTERNS = [
+    r'^https?://(?:www\.)?youtube\.com/watch\?v=[\w-]{11}$',
+    r'^https?://(?:www\.)?youtube\.com/shorts/[\w-]{11}$'
+]
+# Download type -> label shown to the user, file names come from ytdl.naming
+DOWNLOAD_TYPES = {
+    "legacy": "Legacy",
+    "mp4": "MP4",
+    "mp3": "MP3",
+    "best": "Best (merged)"
+}
+# Download type -> which of the picked streams it saves
+STREAM_TYPES = {
+    "legacy": "full_stream",
+    "mp4": "video_stream",
+    "mp3": "audio_stream",
+    "best": "video_stream",  # Merged with audio_stream, see ytdl.mux
+}
+MERGED_TYPE = "best"
+AUDIO_TYPE = "mp3"  # Transcoded after download, see ytdl.transcode
+
+
+def is_valid_youtube_url(url):
+    """
+    Check if a given URL is a valid YouTube video URL based on predefined patterns.
+    """
+    return any(re.match(pattern, url) for pattern in URL_PATTERNS)
+
+
+class VideoDetails:
+    """
+    Resolved details of a single video: its title, the full stream list and the three picked streams.
+    `yt` is the live YouTube object, or None when the details were restored from the on-disk cache.
+    """
+    def __init__(self, url, title, full_stream, video_stream, audio_stream, yt=None, streams=None):
+        self.url = url
+        self.video_id = video_id_from_url(url)
+        self.yt = yt
+        self.title = title
+        self.full_stream = full_stream
+        self.video_stream = video_stream
+        self.audio_stream = audio_stream
+        self.streams = streams if streams is not None else [s for s in self.as_tuple() if s is not None]
+        self.expires = ManifestCache.expiry_for(self)
+        self.index = None  # StreamIndex over self.streams, built on first use
+
+    def as_tuple(self):
+        return self.full_stream, self.video_stream, self.audio_stream
+
+    def stream_for(self, type_key):
+        return getattr(self, STREAM_TYPES[type_key])
+
+    def stream_index(self):
+        if self.index is None:
+            self.index = StreamIndex(self.streams)
+        return self.index
+
+    def with_policy(self, policy):
+        """
+        Copy of these details with the streams picked by `policy` (a ytdl.policy.StreamPolicy).
+        """
+        details = VideoDetails(self.url, self.title, *self.stream_index().select(policy), yt=self.yt, streams=self.streams)
+        details.index = self.index
+        return details
+
+    def is_fresh(self):
+        """
+        True while the signed stream URLs are still safe to download from.
+        """
+        return self.expires > time.time()
+
+
+def select_streams(streams, policy=DEFAULT_POLICY):
+    """
+    Pick the legacy (progressive), best video-only and best audio-only streams allowed by policy.
+    By default that is the highest resolution and the highest bitrate. Returns (index, picks).
+    """
+    index = StreamIndex(streams)
+    return index, index.select(policy)
+
+
+def fetch_details(url, cache=None):
+    """
+    Resolve a URL synchronously. Blocks on network I/O, so only call it from a worker thread.
+    A fresh entry in `cache` is returned without any network round-trip.
+    """
+    video_id = video_id_from_url(url)
+    if cache is not None and video_id:
+        details = cache.get(video_id)
+        if details is not None:
+            if details.url != url:
+                # Same video reached through another URL form (e.g. shorts/ vs watch?v=)
+                details = copy.copy(details)
+                details.url = url
+            return details
+
+    # Imported here so the desktop app can draw its window before pytubefix is loaded
+    from pytubefix import YouTube
+
+    patch_pytubefix()
+
+    yt = YouTube(url)
+    index, picks = select_streams(yt.streams)
+    details = VideoDetails(url, yt.title, *picks, yt=yt, streams=index.streams)
+    details.index = index
+    if cache is not None and video_id:
+        cache.put(details)
+    return details
+
+
+def refresh_stream_url(url, itag, cache=None):
+    """
+    Re-resolve url, bypassing the cache, and return the new signed URL of the stream with this itag.
+    """
+    video_id = video_id_from_url(url)
+    if cache is not None and video_id:
+        cache.invalidate(video_id)
+    details = fetch_details(url, cache)
+    for stream in details.streams:
+        if stream.itag == itag:
+            return stream.url
+    raise LookupError(f"Stream {itag} is no longer offered for {url}")
+
+
+class MetadataResolver:
+    """
+    Resolves URLs on a small thread pool and drops results that are no longer wanted.
+
+    Every call to resolve() supersedes the previous one: a lookup that has not started yet
+    is cancelled, and a lookup that is already running has its result discarded. Callbacks
+    are invoked on the worker thread; callers that touch widgets must marshal back to the
+    UI thread themselves (e.g. through app.after).
+    """
+    def __init__(self, max_workers=2, cache=None):
+        self.cache = cache if cache is not None else ManifestCache()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="metadata")
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.future = None
+
+    def resolve(self, url, on_done, on_error):
+        """
+        Start a background lookup for url and cancel any lookup still in flight.
+        """
+        with self.lock:
+            self.generation += 1
+            generation = self.generation
+            if self.future is not None:
+                self.future.cancel()
+            self.future = self.executor.submit(fetch_details, url, self.cache)
+            future = self.future
+
+        def finished(future):
+            if future.cancelled() or not self.is_current(generation):
+                return
+            error = future.exception()
+            if error is not None:
+                on_error(url, error)
+            else:
+                on_done(future.result())
+
+        future.add_done_callback(finished)
+        return generation
+
+    def cancel(self):
+        """
+        Invalidate the current lookup, e.g. because the URL in the entry field changed.
+        """
+        with self.lock:
+            self.generation += 1
+            if self.future is not None:
+                self.future.cancel()
+                self.future = None
+
+    def is_current(self, generation):
+        with self.lock:
+            return generation == self.generation
+
+    def shutdown(self):
+        self.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
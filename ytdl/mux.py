@@ -0,0 +1,167 @@
+"""
+Best (merged) mode.
+Downloads the highest quality video-only and audio-only DASH streams at the same time and remuxes
+them into one MP4 with ffmpeg (-c copy, no re-encoding). On POSIX both streams are fed to ffmpeg
+through pipes while they download, so the merge overlaps the transfer instead of being a second
+pass over the files.
+"""
+
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from ytdl.resume import part_path_for, state_path_for
+
+FFMPEG_ENV = "YTDL_FFMPEG"
+
+
+class MuxError(Exception):
+    pass
+
+
+def find_ffmpeg():
+    """
+    Locate the ffmpeg binary, preferring the YTDL_FFMPEG environment variable over PATH.
+    """
+    ffmpeg = os.environ.get(FFMPEG_ENV) or shutil.which("ffmpeg")
+    if not ffmpeg:
+        raise MuxError("ffmpeg was not found, install it or set YTDL_FFMPEG")
+    return ffmpeg
+
+
+def can_pipe_inputs():
+    """
+    A second input pipe is handed to ffmpeg with pass_fds, which only exists on POSIX.
+    """
+    return os.name == "posix"
+
+
+class StreamMuxer:
+    """
+    Merge a video-only and an audio-only stream into a single MP4 without re-encoding.
+    Both streams are fetched by `downloader` (a ytdl.segmented.SegmentedDownloader), so they share
+    its session and buffer pool with every other transfer.
+    """
+    def __init__(self, downloader, ffmpeg=None):
+        self.downloader = downloader
+        self.ffmpeg = ffmpeg
+
+    def merge(self, video_stream, audio_stream, file_path, refresh_video=None, refresh_audio=None, progress=None,
+              throttle=None):
+        """
+        Download both streams concurrently and write the merged result to file_path.
+        The output appears at file_path only once ffmpeg finished successfully.
+        `progress` receives the bytes of both streams, and both draw from `throttle`.
+        """
+        ffmpeg = self.ffmpeg or find_ffmpeg()
+        temp_path = file_path + ".part"
+        try:
+            if can_pipe_inputs():
+                self.merge_piped(ffmpeg, video_stream, audio_stream, temp_path, refresh_video, refresh_audio, progress, throttle)
+            else:
+                self.merge_from_files(ffmpeg, video_stream, audio_stream, temp_path, refresh_video, refresh_audio, progress, throttle)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        os.replace(temp_path, file_path)
+        return file_path
+
+    def command(self, ffmpeg, video_input, audio_input, output_path):
+        return [
+            ffmpeg, "-y", "-loglevel", "error",
+            "-i", video_input, "-i", audio_input,
+            "-map", "0:v:0", "-map", "1:a:0",
+            "-c", "copy", "-f", "mp4", output_path,
+        ]
+
+    def merge_piped(self, ffmpeg, video_stream, audio_stream, output_path, refresh_video, refresh_audio, progress=None,
+                    throttle=None):
+        audio_read, audio_write = os.pipe()
+        with tempfile.TemporaryFile() as stderr:
+            try:
+                process = subprocess.Popen(
+                    self.command(ffmpeg, "pipe:0", f"pipe:{audio_read}", output_path),
+                    stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=stderr, pass_fds=(audio_read,),
+                )
+            except BaseException:
+                os.close(audio_write)
+                raise
+            finally:
+                os.close(audio_read)
+
+            errors = []
+            feeders = [
+                threading.Thread(target=self.feed, args=(video_stream, refresh_video, process.stdin, errors, progress, throttle), daemon=True),
+                threading.Thread(target=self.feed, args=(audio_stream, refresh_audio, os.fdopen(audio_write, "wb"), errors, progress, throttle), daemon=True),
+            ]
+            # ffmpeg reads the inputs in turn, so neither may wait for buffers the other one holds
+            self.downloader.reserve_streams(len(feeders))
+            try:
+                for feeder in feeders:
+                    feeder.start()
+                for feeder in feeders:
+                    feeder.join()
+            finally:
+                self.downloader.release_streams(len(feeders))
+            returncode = process.wait()
+
+            if errors:
+                raise errors[0]
+            if returncode != 0:
+                stderr.seek(0)
+                raise MuxError(f"ffmpeg failed ({returncode}): {stderr.read().decode(errors='replace').strip()}")
+
+    def feed(self, stream, refresh_url, pipe, errors, progress=None, throttle=None):
+        """
+        Stream one input into its ffmpeg pipe. A closed pipe means ffmpeg gave up; its exit code explains why.
+        """
+        try:
+            with pipe:
+                for chunk in self.downloader.iter_chunks(stream.url, stream.filesize, refresh_url, progress, throttle,
+                                                         reserved=True):
+                    pipe.write(chunk)
+        except BrokenPipeError:
+            pass
+        except Exception as e:
+            errors.append(e)
+
+    def merge_from_files(self, ffmpeg, video_stream, audio_stream, output_path, refresh_video, refresh_audio, progress=None,
+                         throttle=None):
+        """
+        Fallback without pipe support: fetch both streams concurrently to temp files, then remux.
+        """
+        directory = os.path.dirname(output_path) or "."
+        video_path = os.path.join(directory, f".{os.path.basename(output_path)}.video")
+        audio_path = os.path.join(directory, f".{os.path.basename(output_path)}.audio")
+        errors = []
+
+        def fetch(stream, path, refresh_url):
+            try:
+                self.downloader.download(stream.url, path, stream.filesize, refresh_url=refresh_url, progress=progress,
+                                         throttle=throttle)
+            except Exception as e:
+                errors.append(e)
+
+        fetchers = [
+            threading.Thread(target=fetch, args=(video_stream, video_path, refresh_video), daemon=True),
+            threading.Thread(target=fetch, args=(audio_stream, audio_path, refresh_audio), daemon=True),
+        ]
+        try:
+            for fetcher in fetchers:
+                fetcher.start()
+            for fetcher in fetchers:
+                fetcher.join()
+            if errors:
+                raise errors[0]
+            result = subprocess.run(self.command(ffmpeg, video_path, audio_path, output_path),
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            if result.returncode != 0:
+                raise MuxError(f"ffmpeg failed ({result.returncode}): {result.stderr.decode(errors='replace').strip()}")
+        finally:
+            # A failed fetch leaves its .part file and sidecar behind; these inputs are never resumed
+            for path in (video_path, audio_path):
+                for leftover in (path, part_path_for(path), state_path_for(path)):
+                    if os.path.exists(leftover):
+                        os.remove(leftover)
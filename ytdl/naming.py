@@ -0,0 +1,109 @@
+"""
+Output naming.
+Renders file names from a template such as "{title}-{id}-{itag}.{ext}", sanitized for every
+platform, and finds an already downloaded file of the same video and stream so it is not fetched again.
+"""
+
+import glob
+import os
+import re
+from ytdl.cache import known_filesize
+from ytdl.metadata import AUDIO_TYPE, MERGED_TYPE
+
+DEFAULT_TEMPLATE = "{title}-{id}-{itag}.{ext}"
+MAX_NAME_LENGTH = 200
+MAX_TITLE_LENGTH = 120  # Long titles are cut before rendering so the ID and itag always survive
+INVALID_CHARACTERS = r'[<>:"/\\|?*\x00-\x1f]'
+RESERVED_NAMES = {"CON", "PRN", "AUX", "NUL"} | {f"COM{i}" for i in range(1, 10)} | {f"LPT{i}" for i in range(1, 10)}
+AUDIO_EXTENSIONS = {"mp3": "mp3", "opus": "opus", "aac": "m4a"}
+
+
+def sanitize(name):
+    """
+    Make name safe as a file name on Windows, macOS and Linux.
+    """
+    name = re.sub(INVALID_CHARACTERS, "_", name)
+    name = re.sub(r"\s+", " ", name).strip(" .")
+    if name.split(".")[0].upper() in RESERVED_NAMES:
+        name = f"_{name}"
+    return name or "_"
+
+
+def stream_extension(stream):
+    # pytubefix reports audio-only mp4 as "mp4", but it is an m4a file
+    if stream.subtype == "mp4" and not getattr(stream, "includes_video_track", True):
+        return "m4a"
+    return stream.subtype
+
+
+class OutputNaming:
+    """
+    Turns resolved details and a download type into an output file name.
+    `audio_format` is the transcoder's target for the mp3 type, or None when audio is kept as downloaded.
+    """
+    def __init__(self, template=DEFAULT_TEMPLATE):
+        self.template = template
+
+    def fields(self, details, type_key, audio_format=None):
+        stream = details.stream_for(type_key)
+        itag, extension = str(stream.itag), stream_extension(stream)
+        if type_key == MERGED_TYPE:
+            itag, extension = f"{details.video_stream.itag}+{details.audio_stream.itag}", "mp4"
+        elif type_key == AUDIO_TYPE and audio_format:
+            extension = AUDIO_EXTENSIONS[audio_format]
+        return {
+            "title": sanitize(details.title or "")[:MAX_TITLE_LENGTH],
+            "id": details.video_id,
+            "itag": itag,
+            "ext": extension,
+            "type": type_key,
+            "resolution": getattr(stream, "resolution", None) or "",
+            "abr": getattr(stream, "abr", None) or "",
+        }
+
+    def filename(self, details, type_key, audio_format=None):
+        fields = self.fields(details, type_key, audio_format)
+        extension = fields["ext"]
+        stem = self.template.format(**{key: sanitize(str(value)) for key, value in fields.items()})
+        if stem.endswith(f".{extension}"):
+            stem = stem[:-len(extension) - 1]
+        return f"{sanitize(stem)[:MAX_NAME_LENGTH]}.{extension}"
+
+    def find_existing(self, directory, details, type_key, audio_format=None):
+        """
+        Return the path of a complete earlier download of the same video ID and itag, or None.
+        Titles may change between runs, so when the template has both {id} and {itag} the title
+        part is matched with a wildcard.
+        """
+        fields = self.fields(details, type_key, audio_format)
+        if "{id}" in self.template and "{itag}" in self.template:
+            pattern_fields = {key: glob.escape(sanitize(str(value))) for key, value in fields.items()}
+            pattern_fields["title"] = "*"
+            candidates = glob.glob(os.path.join(glob.escape(directory), self.template.format(**pattern_fields)))
+        else:
+            candidates = [os.path.join(directory, self.filename(details, type_key, audio_format))]
+
+        # Only a stream saved as-is has a size we can check against the manifest
+        expected_size = None
+        if type_key not in (MERGED_TYPE, AUDIO_TYPE):
+            expected_size = known_filesize(details.stream_for(type_key)) or None
+        for path in candidates:
+            if self.is_complete(path, expected_size):
+                return path
+        return None
+
+    @staticmethod
+    def is_complete(path, expected_size=None):
+        """
+        Without a size from the manifest (merged and transcoded files), the size recorded in the
+        file's .checksum sidecar is checked instead, when there is one.
+        """
+        from ytdl.integrity import read_sidecar
+        from ytdl.resume import state_path_for
+
+        if not os.path.isfile(path) or os.path.exists(state_path_for(path)):
+            return False
+        if not expected_size:
+            expected_size = (read_sidecar(path) or (None, None))[1]
+        size = os.path.getsize(path)
+        return size == expected_size if expected_size else size > 0
@@ -0,0 +1,49 @@
+"""
+Playlist and channel ingestion.
+Expands a playlist or channel URL lazily into single-video watch URLs, one page at a time.
+"""
+
+import re
+from ytdl.session import patch_pytubefix
+
+PLAYLIST_PATTERNS = [
+    r'^https?://(?:www\.)?youtube\.com/playlist\?list=[\w-]+$',
+    r'^https?://(?:www\.)?youtube\.com/watch\?v=[\w-]{11}&list=[\w-]+(?:&.*)?$',
+]
+CHANNEL_PATTERNS = [
+    r'^https?://(?:www\.)?youtube\.com/@[\w.-]+(?:/(?:videos|shorts|streams))?/?$',
+    r'^https?://(?:www\.)?youtube\.com/(?:channel|c|user)/[\w.-]+(?:/(?:videos|shorts|streams))?/?$',
+]
+
+
+def is_playlist_url(url):
+    return any(re.match(pattern, url) for pattern in PLAYLIST_PATTERNS)
+
+
+def is_channel_url(url):
+    return any(re.match(pattern, url) for pattern in CHANNEL_PATTERNS)
+
+
+def is_collection_url(url):
+    """
+    Check if a URL points at a playlist or a channel's uploads rather than a single video.
+    """
+    return is_playlist_url(url) or is_channel_url(url)
+
+
+def iter_video_urls(url):
+    """
+    Yield the watch URLs of a playlist or channel as YouTube pages them in, without
+    waiting for the full listing. Duplicates (e.g. a video listed twice) are skipped.
+    """
+    from pytubefix import Channel, Playlist
+
+    patch_pytubefix()
+
+    collection = Channel(url) if is_channel_url(url) else Playlist(url)
+    seen = set()
+    for video_url in collection.url_generator():
+        if video_url in seen:
+            continue
+        seen.add(video_url)
+        yield video_url
@@ -0,0 +1,194 @@
+"""
+Stream selection policies.
+Ranks a video's streams once by resolution, fps, codec, bitrate and size, then answers policies
+such as "<=1080p, prefer av1, cap 2GB" with a single pass over the ranked list.
+"""
+
+import re
+from bisect import bisect_left
+from ytdl.cache import known_filesize
+
+# Codec string prefix -> family name used in policies
+CODEC_FAMILIES = (
+    ("av01", "av1"),
+    ("vp09", "vp9"),
+    ("vp9", "vp9"),
+    ("avc1", "h264"),
+    ("mp4a", "aac"),
+    ("opus", "opus"),
+)
+SIZE_UNITS = {"": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3, "t": 1024 ** 4}
+# Containers a policy may ask for; m4a is what audio-only mp4 is saved as
+CONTAINERS = {"mp4": "mp4", "m4a": "mp4", "webm": "webm", "3gp": "3gpp", "3gpp": "3gpp"}
+
+PROGRESSIVE = "progressive"
+VIDEO = "video"
+AUDIO = "audio"
+# Container of each kind without a subtype rule: pytubefix's highest-resolution picks are mp4 only
+DEFAULT_SUBTYPES = {PROGRESSIVE: "mp4", VIDEO: "mp4", AUDIO: None}
+
+
+def codec_family(codec):
+    codec = (codec or "").lower()
+    for prefix, family in CODEC_FAMILIES:
+        if codec.startswith(prefix):
+            return family
+    return codec
+
+
+def parse_height(resolution):
+    match = re.match(r"(\d+)p", resolution or "")
+    return int(match.group(1)) if match else 0
+
+
+def parse_bitrate(stream):
+    """
+    Bitrate in bits per second. Streams restored from the cache may only list `abr` ("160kbps"),
+    and some streams list neither.
+    """
+    bitrate = getattr(stream, "bitrate", None)
+    if bitrate:
+        return int(bitrate)
+    match = re.match(r"(\d+)kbps", getattr(stream, "abr", None) or "")
+    return int(match.group(1)) * 1000 if match else 0
+
+
+def parse_size(text):
+    """
+    Parse a size such as "2GB", "500M" or "1048576" into bytes.
+    """
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([kmgt]?)i?b?\s*", text.lower())
+    if match is None:
+        raise ValueError(f"Invalid size: {text!r}")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2)])
+
+
+class RankedStream:
+    """
+    A stream with the attributes it is ranked by, parsed once.
+    """
+    def __init__(self, stream):
+        self.stream = stream
+        self.height = parse_height(getattr(stream, "resolution", None))
+        self.fps = getattr(stream, "fps", None) or 0
+        self.bitrate = parse_bitrate(stream)
+        self.filesize = known_filesize(stream)
+        self.subtype = getattr(stream, "subtype", None)
+        has_video = getattr(stream, "includes_video_track", False)
+        self.codec = codec_family(getattr(stream, "video_codec" if has_video else "audio_codec", None))
+        if getattr(stream, "is_progressive", False):
+            self.kind = PROGRESSIVE
+        else:
+            self.kind = VIDEO if has_video else AUDIO
+
+    def sort_key(self):
+        return self.height, self.fps, self.bitrate, self.filesize
+
+
+class StreamPolicy:
+    """
+    Limits and preferences for picking a stream. Every limit is optional.
+
+    `max_height` and `max_fps` cap the video quality, `max_filesize` caps the download size in bytes
+    (video and audio together for merged downloads), `prefer_codecs` lists codec families in order
+    of preference ("av1", "vp9", "h264", "opus", "aac") and `subtype` restricts the container.
+    Without a `subtype` video is picked from mp4 streams and audio from any container.
+    A preferred codec wins over fps and bitrate, never over resolution.
+    """
+    def __init__(self, max_height=None, max_fps=None, max_filesize=None, prefer_codecs=(), subtype=None):
+        self.max_height = max_height
+        self.max_fps = max_fps
+        self.max_filesize = max_filesize
+        self.prefer_codecs = tuple(prefer_codecs)
+        self.subtype = subtype
+
+    @classmethod
+    def parse(cls, text):
+        """
+        Build a policy from comma separated rules, e.g. "<=1080p, <=30fps, prefer av1 vp9, cap 2GB, mp4".
+        Raises ValueError for a rule it does not know.
+        """
+        policy = cls()
+        for rule in filter(None, (rule.strip().lower().replace("≤", "<=") for rule in (text or "").split(","))):
+            if re.fullmatch(r"(<=)?\s*\d+p", rule):
+                policy.max_height = parse_height(rule.lstrip("<= "))
+            elif re.fullmatch(r"(<=)?\s*\d+\s*fps", rule):
+                policy.max_fps = int(re.search(r"\d+", rule).group())
+            elif rule.startswith("prefer"):
+                policy.prefer_codecs = tuple(re.split(r"[\s=]+", rule)[1:])
+            elif rule.startswith("cap"):
+                policy.max_filesize = parse_size(rule[3:].lstrip(" ="))
+            elif rule in CONTAINERS:
+                policy.subtype = CONTAINERS[rule]
+            else:
+                raise ValueError(f"Unknown stream policy rule: {rule!r}")
+        return policy
+
+    def allows(self, ranked, max_filesize=None):
+        max_filesize = max_filesize if max_filesize is not None else self.max_filesize
+        if self.max_height and ranked.height > self.max_height:
+            return False
+        if self.max_fps and ranked.fps > self.max_fps:
+            return False
+        subtype = self.subtype or DEFAULT_SUBTYPES[ranked.kind]
+        if subtype and ranked.subtype != subtype:
+            return False
+        # A size missing from the manifest cannot be checked, such streams are not ruled out
+        return not (max_filesize and ranked.filesize and ranked.filesize > max_filesize)
+
+    def codec_rank(self, ranked):
+        if ranked.codec in self.prefer_codecs:
+            return self.prefer_codecs.index(ranked.codec)
+        return len(self.prefer_codecs)
+
+
+DEFAULT_POLICY = StreamPolicy()
+
+
+class StreamIndex:
+    """
+    A video's streams split into progressive, video-only and audio-only lists, each sorted once from
+    best to worst. A height cap is answered with a binary search into the sorted list.
+    """
+    def __init__(self, streams):
+        self.streams = list(streams)
+        self.ranked = {PROGRESSIVE: [], VIDEO: [], AUDIO: []}
+        for stream in self.streams:
+            ranked = RankedStream(stream)
+            self.ranked[ranked.kind].append(ranked)
+        for entries in self.ranked.values():
+            entries.sort(key=RankedStream.sort_key, reverse=True)
+        # Negated heights, ascending, for bisect
+        self.heights = {kind: [-ranked.height for ranked in entries] for kind, entries in self.ranked.items()}
+
+    def best(self, kind, policy=DEFAULT_POLICY, max_filesize=None):
+        """
+        Return the best stream of `kind` allowed by `policy`, or None.
+        """
+        entries = self.ranked[kind]
+        start = bisect_left(self.heights[kind], -policy.max_height) if policy.max_height and kind != AUDIO else 0
+        tier = best = best_rank = None
+        for ranked in entries[start:]:
+            # Resolution comes first: stop once the list drops below the height of the best pick so far
+            height = ranked.height if kind != AUDIO else 0
+            if tier is not None and height < tier:
+                break
+            if not policy.allows(ranked, max_filesize):
+                continue
+            rank = policy.codec_rank(ranked)
+            if best is None or rank < best_rank:
+                tier, best, best_rank = height, ranked, rank
+                if rank == 0:
+                    break
+        return best.stream if best is not None else None
+
+    def select(self, policy=DEFAULT_POLICY):
+        """
+        Pick the (progressive, video-only, audio-only) streams. The audio pick is made first so the
+        video pick fits the size cap together with it.
+        """
+        audio_stream = self.best(AUDIO, policy)
+        max_filesize = policy.max_filesize
+        if max_filesize and audio_stream is not None:
+            max_filesize = max(max_filesize - known_filesize(audio_stream), 1)
+        return self.best(PROGRESSIVE, policy), self.best(VIDEO, policy, max_filesize), audio_stream
@@ -0,0 +1,179 @@
+"""
+Transfer instrumentation.
+Per-job byte counters with a moving-average throughput, ETA, time-to-first-byte and peak memory,
+plus the formatting helpers the UI uses to display them.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+
+THROUGHPUT_WINDOW = 5.0  # Seconds of samples the moving average covers
+REPORT_INTERVAL = 0.25  # Minimum seconds between two progress reports of the same job
+
+
+def current_rss():
+    """
+    Resident set size of this process in bytes, or None where it cannot be read. Linux reads
+    /proc; elsewhere psutil is used when it is installed. getrusage() is no substitute, its
+    ru_maxrss only ever grows, so every job would report the peak of the whole run.
+    """
+    try:
+        with open("/proc/self/statm", "rb") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None  # Reported as unknown
+    return psutil.Process().memory_info().rss
+
+
+class TransferMetrics:
+    """
+    Thread-safe progress of one job. Fed by every transfer path (pytubefix callbacks, the segmented
+    engine, the muxer) through add(); bytes restored from a resumed .part file go through skip() so
+    they count towards progress but not towards throughput.
+
+    `on_report(metrics)` is called from the transferring thread at most every REPORT_INTERVAL seconds,
+    which is also how often `peak_rss` samples the process's resident memory. Jobs run side by side
+    in one process, so it is the peak of the whole process while this job was running.
+    """
+    def __init__(self, total_bytes=None, window=THROUGHPUT_WINDOW, on_report=None):
+        self.total_bytes = total_bytes
+        self.on_report = on_report
+        self.window = window
+        self.lock = threading.Lock()
+        self.started_at = time.monotonic()
+        self.first_byte_at = None
+        self.finished_at = None
+        self.bytes_done = 0
+        self.samples = deque([(self.started_at, 0)])  # (timestamp, bytes transferred so far)
+        self.transferred = 0
+        self.last_report = 0.0
+        self.peak_rss = current_rss()
+
+    def set_total(self, total_bytes):
+        with self.lock:
+            self.total_bytes = total_bytes
+
+    def add_total(self, total_bytes):
+        if not total_bytes:
+            return
+        with self.lock:
+            self.total_bytes = (self.total_bytes or 0) + total_bytes
+
+    def add(self, nbytes):
+        now = time.monotonic()
+        with self.lock:
+            if self.first_byte_at is None:
+                self.first_byte_at = now
+            self.bytes_done += nbytes
+            self.transferred += nbytes
+            self.samples.append((now, self.transferred))
+            while len(self.samples) > 2 and self.samples[1][0] < now - self.window:
+                self.samples.popleft()
+        if self.should_report():
+            self.sample_memory()
+            if self.on_report is not None:
+                self.on_report(self)
+
+    def skip(self, nbytes):
+        with self.lock:
+            self.bytes_done += nbytes
+
+    def finish(self):
+        self.sample_memory()
+        with self.lock:
+            self.finished_at = time.monotonic()
+
+    def sample_memory(self):
+        rss = current_rss()
+        if rss is not None:
+            with self.lock:
+                self.peak_rss = max(self.peak_rss or 0, rss)
+
+    @property
+    def throughput(self):
+        """
+        Bytes per second averaged over the last `window` seconds.
+        """
+        with self.lock:
+            (first_time, first_bytes), (last_time, last_bytes) = self.samples[0], self.samples[-1]
+            end = self.finished_at or time.monotonic()
+        elapsed = max(end, last_time) - first_time
+        return (last_bytes - first_bytes) / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta(self):
+        """
+        Seconds left at the current throughput, or None when unknown.
+        """
+        throughput = self.throughput
+        if not self.total_bytes or throughput <= 0:
+            return None
+        return max(self.total_bytes - self.bytes_done, 0) / throughput
+
+    @property
+    def ttfb(self):
+        if self.first_byte_at is None:
+            return None
+        return self.first_byte_at - self.started_at
+
+    @property
+    def fraction(self):
+        if not self.total_bytes:
+            return None
+        return min(self.bytes_done / self.total_bytes, 1.0)
+
+    def should_report(self, interval=REPORT_INTERVAL):
+        """
+        True at most once per interval, so chunk-level events cannot flood the listeners.
+        """
+        now = time.monotonic()
+        with self.lock:
+            if now - self.last_report < interval:
+                return False
+            self.last_report = now
+            return True
+
+    def snapshot(self):
+        return {
+            "bytes_done": self.bytes_done,
+            "total_bytes": self.total_bytes,
+            "throughput": self.throughput,
+            "eta": self.eta,
+            "ttfb": self.ttfb,
+            "peak_rss": self.peak_rss,
+        }
+
+
+def format_bytes(nbytes):
+    for unit in ("B", "KB", "MB", "GB"):
+        if nbytes < 1024 or unit == "GB":
+            return f"{nbytes:.0f} {unit}" if unit == "B" else f"{nbytes:.1f} {unit}"
+        nbytes /= 1024
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return "--:--"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+
+def describe(metrics):
+    """
+    One-line summary for the job list, e.g. "42% · 3.1 MB/s · ETA 1:05".
+    """
+    parts = []
+    if metrics.fraction is not None:
+        parts.append(f"{metrics.fraction:.0%}")
+    else:
+        parts.append(format_bytes(metrics.bytes_done))
+    parts.append(f"{format_bytes(metrics.throughput)}/s")
+    parts.append(f"ETA {format_eta(metrics.eta)}")
+    return " · ".join(parts)
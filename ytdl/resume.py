@@ -0,0 +1,142 @@
+"""
+Resumable download state.
+A download in progress lives in `<file>.part`, next to a `<file>.part.json` sidecar that records
+which byte ranges are already on disk, so an interrupted transfer can continue where it stopped.
+"""
+
+import glob
+import json
+import os
+import threading
+
+PART_SUFFIX = ".part"
+STATE_SUFFIX = ".part.json"
+
+
+def part_path_for(file_path):
+    return file_path + PART_SUFFIX
+
+
+def state_path_for(file_path):
+    return file_path + STATE_SUFFIX
+
+
+class ResumeState:
+    """
+    Completed byte ranges of one stream, persisted as JSON after every finished segment, with the
+    checksum digest of each range ("algorithm:hex") when one was computed. `extra` holds whatever the caller needs to re-queue the job after a restart (URL, type...).
+    """
+    def __init__(self, file_path, video_id, itag, filesize, segment_size, completed=None, extra=None, digests=None):
+        self.file_path = file_path
+        self.video_id = video_id
+        self.itag = itag
+        self.filesize = filesize
+        self.segment_size = segment_size
+        self.completed = set(completed or [])  # Start offsets of finished segments
+        self.extra = extra or {}
+        self.digests = {int(start): digest for start, digest in (digests or {}).items()}
+        self.lock = threading.Lock()
+
+    @property
+    def part_path(self):
+        return part_path_for(self.file_path)
+
+    @property
+    def state_path(self):
+        return state_path_for(self.file_path)
+
+    @classmethod
+    def load(cls, file_path):
+        """
+        Read the sidecar of file_path, or return None when there is none or it is unreadable.
+        """
+        try:
+            with open(state_path_for(file_path), "r", encoding="utf-8") as fh:
+                data = json.load(fh)
+            return cls(file_path, data["video_id"], data["itag"], data["filesize"], data["segment_size"],
+                       data["completed"], data.get("extra"), data.get("digests"))
+        except (OSError, ValueError, KeyError):
+            return None
+
+    @classmethod
+    def resume_or_create(cls, file_path, video_id, itag, filesize, segment_size, extra=None):
+        """
+        Continue a previous transfer of the same stream if its state still checks out,
+        otherwise start a fresh one and drop any stale partial data.
+        """
+        state = cls.load(file_path)
+        if state is not None and state.matches(video_id, itag, filesize, segment_size) and state.part_is_valid():
+            state.extra.update(extra or {})
+            return state
+        state = cls(file_path, video_id, itag, filesize, segment_size, extra=extra)
+        state.discard()
+        return state
+
+    def matches(self, video_id, itag, filesize, segment_size):
+        return (self.video_id, self.itag, self.filesize, self.segment_size) == (video_id, itag, filesize, segment_size)
+
+    def part_is_valid(self):
+        """
+        The .part file is preallocated, so anything but the expected size means it was tampered with or truncated.
+        """
+        try:
+            return os.path.getsize(self.part_path) == self.filesize
+        except OSError:
+            return False
+
+    def pending(self, ranges):
+        with self.lock:
+            return [(start, end) for start, end in ranges if start not in self.completed]
+
+    def mark_done(self, start, digest=None):
+        with self.lock:
+            self.completed.add(start)
+            if digest is not None:
+                self.digests[start] = digest
+            self.save()
+
+    def save(self):
+        temp_path = self.state_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as fh:
+            json.dump({
+                "video_id": self.video_id,
+                "itag": self.itag,
+                "filesize": self.filesize,
+                "segment_size": self.segment_size,
+                "completed": sorted(self.completed),
+                "extra": self.extra,
+                "digests": {str(start): digest for start, digest in self.digests.items()},
+            }, fh)
+        os.replace(temp_path, self.state_path)
+
+    def finish(self):
+        """
+        Move the completed .part file into place and remove the sidecar.
+        """
+        os.replace(self.part_path, self.file_path)
+        self.remove_sidecar()
+
+    def discard(self):
+        for path in (self.part_path, self.state_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def remove_sidecar(self):
+        try:
+            os.remove(self.state_path)
+        except FileNotFoundError:
+            pass
+
+
+def find_pending(directory):
+    """
+    Return the ResumeState of every interrupted download in directory.
+    """
+    states = []
+    for state_path in glob.glob(os.path.join(glob.escape(directory), "*" + STATE_SUFFIX)):
+        state = ResumeState.load(state_path[:-len(STATE_SUFFIX)])
+        if state is not None:
+            states.append(state)
+    return states
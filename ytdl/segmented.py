@@ -0,0 +1,362 @@
+"""
+Segmented downloader.
+Splits a stream into byte ranges and fetches them over several keep-alive connections of the
+shared HTTP session (ytdl.session), writing each range straight into its place in a preallocated file. Finished ranges are
+recorded in a sidecar file so an interrupted download resumes instead of starting over.
+Reads go into buffers borrowed from a bounded pool (ytdl.buffers), never into fresh allocations.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from ytdl.buffers import DEFAULT_CHUNK_SIZE, BufferPool
+from ytdl.cache import url_expiry
+from ytdl.integrity import Checksum, hash_block
+from ytdl.resume import ResumeState
+from ytdl.session import HttpSession
+
+DEFAULT_CONNECTIONS = 4
+DEFAULT_SEGMENT_SIZE = 8 * 1024 * 1024  # Stay below the ~10MB ranges googlevideo serves unthrottled
+USER_AGENT = "Mozilla/5.0"
+
+
+class SegmentError(Exception):
+    pass
+
+
+class ExpiredUrlError(SegmentError):
+    """
+    The signed URL was rejected (403/410), usually because it expired.
+    """
+
+
+class DownloadCancelled(Exception):
+    """
+    The downloader was cancelled while the transfer ran; finished segments stay on disk to resume from.
+    """
+
+
+class UrlSource:
+    """
+    The current signed URL of a stream, shared by all segment workers.
+    `refresh()` asks the metadata layer for a new URL once, however many workers hit the expiry.
+    """
+    def __init__(self, url, refresh_url=None):
+        self.url = url
+        self.refresh_url = refresh_url
+        self.lock = threading.Lock()
+
+    def get(self):
+        with self.lock:
+            expiry = url_expiry(self.url)
+            url = self.url
+        if expiry is not None and expiry <= time.time():
+            url = self.refresh(url)
+        return url
+
+    def refresh(self, stale_url):
+        with self.lock:
+            if self.url == stale_url and self.refresh_url is not None:
+                self.url = self.refresh_url()
+            return self.url
+
+
+def split_ranges(filesize, segment_size):
+    """
+    Split [0, filesize) into inclusive (start, end) byte ranges of at most segment_size bytes.
+    """
+    return [(start, min(start + segment_size, filesize) - 1) for start in range(0, filesize, segment_size)]
+
+
+class PositionalFile:
+    """
+    Preallocated output file that accepts writes at arbitrary offsets from many threads.
+    Uses os.pwrite where available and falls back to seek + write under a lock (Windows).
+    """
+    def __init__(self, path, size):
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o644)
+        os.ftruncate(self.fd, size)
+        self.lock = threading.Lock()
+
+    def write_at(self, data, offset):
+        if hasattr(os, "pwrite"):
+            while data:
+                written = os.pwrite(self.fd, data, offset)
+                data, offset = data[written:], offset + written
+        else:
+            with self.lock:
+                os.lseek(self.fd, offset, os.SEEK_SET)
+                while data:
+                    data = data[os.write(self.fd, data):]
+
+    def close(self):
+        os.close(self.fd)
+
+
+class SegmentedDownloader:
+    """
+    Download a URL over `connections` parallel Range requests of `segment_size` bytes each.
+    Every segment is retried up to `max_retries` times, resuming from the last byte written.
+    Connections come from `session` (a ytdl.session.HttpSession), shared with other downloaders
+    and the metadata resolver when the caller passes the same one. Data is read `buffers.buffer_size`
+    bytes at a time into buffers from `buffers` (a ytdl.buffers.BufferPool), by default a pool of
+    `chunk_size` buffers without a budget. `cancel()` stops every transfer at its next chunk.
+    """
+    def __init__(self, connections=DEFAULT_CONNECTIONS, segment_size=DEFAULT_SEGMENT_SIZE, max_retries=3,
+                 backoff=1.0, timeout=30, session=None, chunk_size=DEFAULT_CHUNK_SIZE, buffers=None):
+        self.connections = connections
+        self.segment_size = segment_size
+        self.buffers = buffers or BufferPool(chunk_size)
+        if self.buffers.max_buffers is not None and 2 * self.segment_buffers() > self.buffers.max_buffers:
+            raise ValueError("The buffer budget must hold two segments, one for each input of a merge")
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.session = session or HttpSession(timeout=timeout)
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        """
+        Make every running and later transfer raise DownloadCancelled, e.g. on shutdown.
+        """
+        self.cancelled.set()
+
+    def download(self, url, file_path, filesize=None, video_id=None, itag=None, refresh_url=None, extra=None,
+                 progress=None, throttle=None, checksum=None):
+        """
+        Download url into file_path and return file_path. `filesize` is probed when not given.
+
+        Data goes to `<file_path>.part` first and is renamed once complete. If a previous attempt
+        for the same video ID, itag and size left a valid .part file, only the missing ranges are
+        fetched. `refresh_url()` is called for a new signed URL when the current one has expired.
+        `progress` (a ytdl.progress.TransferMetrics) is fed every chunk as it is written, and
+        `throttle(nbytes)` (see ytdl.bandwidth) is called before every chunk is read. `checksum` (see
+        new_checksum()) hashes every chunk as it is written and is checked before the file is renamed.
+        """
+        source = UrlSource(url, refresh_url)
+        if not filesize:
+            filesize = self.probe_size(source.get())
+
+        state = ResumeState.resume_or_create(file_path, video_id, itag, filesize, self.segment_size, extra)
+        state.save()
+        if checksum is not None:
+            checksum.size = filesize
+            self.restore_checksum(checksum, state)
+        pending = state.pending(split_ranges(filesize, self.segment_size))
+        if progress is not None:
+            progress.skip(filesize - sum(end - start + 1 for start, end in pending))
+
+        output = PositionalFile(state.part_path, filesize)
+        try:
+            with ThreadPoolExecutor(max_workers=self.connections, thread_name_prefix="segment") as executor:
+                futures = [executor.submit(self.fetch_and_record, source, output, state, start, end, progress, throttle,
+                                           checksum)
+                           for start, end in pending]
+                for future in futures:
+                    future.result()
+        finally:
+            output.close()
+        if checksum is not None:
+            checksum.finish()  # Raises on a size mismatch, leaving the .part file to resume from
+        state.finish()
+        return file_path
+
+    def new_checksum(self, filesize=None):
+        """
+        A ytdl.integrity.Checksum whose blocks line up with this downloader's segments.
+        """
+        return Checksum(filesize, self.segment_size)
+
+    def restore_checksum(self, checksum, state):
+        """
+        Feed the digests of segments finished by an earlier run. Only segments without a usable
+        recorded digest are read back from the .part file.
+        """
+        if checksum.block_size != self.segment_size:
+            raise ValueError("The checksum blocks must match the segment size")
+        for start in state.completed:
+            algorithm, _, digest = state.digests.get(start, "").partition(":")
+            if algorithm == checksum.algorithm:
+                digest = bytes.fromhex(digest)
+            else:
+                digest = hash_block(state.part_path, checksum.algorithm, checksum.block_size, start // self.segment_size)
+            checksum.restore(start // self.segment_size, digest)
+
+    def iter_chunks(self, url, filesize=None, refresh_url=None, progress=None, throttle=None, reserved=False):
+        """
+        Yield the stream in order as memoryviews of pool buffers, while the next segments are already
+        being fetched in parallel. A view is only valid until the next one is requested.
+
+        Every stream reserves one segment's buffers of the pool (see reserve_streams(); `reserved`
+        when the caller already did), so the segment it waits for can always be fetched. The up to
+        `connections - 1` segments fetched ahead only take buffers nobody else is waiting for, which
+        keeps a stream whose consumer is blocked on another stream from starving that other stream.
+        """
+        source = UrlSource(url, refresh_url)
+        if not filesize:
+            filesize = self.probe_size(source.get())
+
+        if not reserved:
+            self.reserve_streams(1)
+        ranges = deque(split_ranges(filesize, self.segment_size))
+        executor = ThreadPoolExecutor(max_workers=self.connections, thread_name_prefix="segment")
+        in_flight = deque()  # (future, buffers, from reservation) in stream order
+        reservation_lent = False
+        try:
+            while ranges or in_flight:
+                while ranges and len(in_flight) < self.connections:
+                    start, end = ranges[0]
+                    count = -(-(end - start + 1) // self.buffers.buffer_size)
+                    from_reservation = not reservation_lent
+                    buffers = self.buffers.acquire(count, block=False, reserved=from_reservation)
+                    if buffers is None:
+                        break
+                    reservation_lent = reservation_lent or from_reservation
+                    ranges.popleft()
+                    in_flight.append((executor.submit(self.fetch_into, source, buffers, start, end, progress, throttle),
+                                      buffers, from_reservation))
+                future, buffers, from_reservation = in_flight[0]
+                try:
+                    remaining = future.result()
+                    for buffer in buffers:
+                        view = memoryview(buffer)[:remaining]
+                        remaining -= len(view)
+                        yield view
+                finally:
+                    in_flight.popleft()
+                    self.buffers.release(buffers, from_reservation)
+                    reservation_lent = reservation_lent and not from_reservation
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+            for future, buffers, from_reservation in in_flight:
+                self.buffers.release(buffers, from_reservation)  # Cancelled or finished by now
+            if not reserved:
+                self.release_streams(1)
+
+    def segment_buffers(self):
+        return -(-self.segment_size // self.buffers.buffer_size)
+
+    def reserve_streams(self, streams):
+        """
+        Reserve one segment's buffers for each of `streams` iter_chunks() calls that are consumed
+        together, e.g. the video and audio input of one merge, waiting until all of them fit.
+        """
+        self.buffers.reserve(streams * self.segment_buffers())
+
+    def release_streams(self, streams):
+        self.buffers.unreserve(streams * self.segment_buffers())
+
+    def probe_size(self, url):
+        """
+        Ask for the first byte and read the size from the headers. Only a 206 body (that one byte) is
+        read, keeping the connection; a server ignoring the Range header is hung up on instead of
+        sending the whole file.
+        """
+        response = self.request(url, "bytes=0-0")
+        content_range = response.getheader("Content-Range", "")
+        content_length = response.getheader("Content-Length")
+        if response.status == 206:
+            response.read()
+        else:
+            response.close()
+        if response.status == 206 and "/" in content_range and content_range.rsplit("/", 1)[1].isdigit():
+            return int(content_range.rsplit("/", 1)[1])
+        if response.status == 200 and content_length:
+            return int(content_length)
+        raise SegmentError(f"Could not determine size of {url}")
+
+    def fetch_and_record(self, source, output, state, start, end, progress=None, throttle=None, checksum=None):
+        if checksum is None:
+            write = output.write_at
+        else:
+            def write(chunk, offset):
+                output.write_at(chunk, offset)
+                checksum.update_at(chunk, offset)
+
+        # One buffer per segment, reused for every read and given back before anything else is awaited
+        buffer, = self.buffers.acquire()
+        try:
+            view = memoryview(buffer)
+            self.fetch_segment(source, write, start, end, progress, throttle, lambda offset, size: view[:size])
+        finally:
+            self.buffers.release([buffer])
+        digest = checksum.block_digest(start // self.segment_size) if checksum is not None else None
+        state.mark_done(start, f"{checksum.algorithm}:{digest.hex()}" if digest is not None else None)
+
+    def fetch_into(self, source, buffers, start, end, progress=None, throttle=None):
+        """
+        Read bytes start..end (inclusive) straight into consecutive pool buffers. Returns the length.
+        """
+        size = self.buffers.buffer_size
+
+        def view_for(offset, length):
+            index, buffer_offset = divmod(offset - start, size)
+            return memoryview(buffers[index])[buffer_offset:buffer_offset + min(length, size - buffer_offset)]
+
+        self.fetch_segment(source, lambda chunk, offset: None, start, end, progress, throttle, view_for)
+        return end - start + 1
+
+    def fetch_segment(self, source, write, start, end, progress=None, throttle=None, view_for=None):
+        """
+        Fetch bytes start..end (inclusive) and hand every chunk to write(chunk, offset). Each chunk is
+        read into view_for(offset, size), a writable memoryview of at most size bytes; without it
+        into a fresh bytes object.
+        """
+        import http.client
+
+        offset = start
+        attempts = 0
+        while offset <= end:
+            self.check_cancelled()
+            url = source.get()
+            response = None
+            try:
+                response = self.request(url, f"bytes={offset}-{end}")
+                if response.status != 206:
+                    raise SegmentError(f"Expected 206 for bytes {offset}-{end}, got {response.status}")
+                while offset <= end:
+                    self.check_cancelled()
+                    size = min(self.buffers.buffer_size, end - offset + 1)
+                    if throttle is not None:
+                        throttle(size)
+                    if view_for is None:
+                        chunk = response.read(size)
+                    else:
+                        view = view_for(offset, size)
+                        chunk = view[:response.readinto(view)]
+                    if not chunk:
+                        raise SegmentError(f"Connection closed at byte {offset} of {start}-{end}")
+                    write(chunk, offset)
+                    offset += len(chunk)
+                    if progress is not None:
+                        progress.add(len(chunk))
+            except (OSError, http.client.HTTPException, SegmentError) as e:
+                attempts += 1
+                if attempts > self.max_retries:
+                    raise SegmentError(f"Segment {start}-{end} failed after {attempts} attempts: {e}") from e
+                if isinstance(e, ExpiredUrlError):
+                    source.refresh(url)
+                else:
+                    self.cancelled.wait(self.backoff * (2 ** (attempts - 1)))
+            finally:
+                if response is not None:
+                    response.close()  # Back to the session if the body was read to the end, otherwise closed
+
+    def check_cancelled(self):
+        if self.cancelled.is_set():
+            raise DownloadCancelled("Download cancelled")
+
+    def request(self, url, byte_range):
+        """
+        Issue a GET with a Range header on a pooled connection; the session follows redirects.
+        """
+        response = self.session.request("GET", url, {"Range": byte_range, "User-Agent": USER_AGENT})
+        if response.status in (403, 410):
+            response.close()
+            raise ExpiredUrlError(f"HTTP {response.status} for {byte_range}")
+        if response.status >= 400:
+            response.close()
+            raise SegmentError(f"HTTP {response.status} for {byte_range}")
+        return response
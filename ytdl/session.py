@@ -0,0 +1,350 @@
+"""
+Shared HTTP session.
+One thread-safe pool of keep-alive connections used by the metadata resolver (through pytubefix)
+and by the download engine, with a cap on connections per host and counters that show how often
+a connection was reused instead of paying for a new TCP and TLS handshake.
+"""
+
+import io
+import json
+import socket
+import sys
+import threading
+from urllib.parse import urljoin, urlsplit
+
+DEFAULT_MAX_PER_HOST = 16
+DEFAULT_TIMEOUT = 30
+MAX_REDIRECTS = 5
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+# Errors that mean a kept-alive connection was closed by the server while it sat idle
+STALE_ERRORS = (ConnectionResetError, BrokenPipeError, ConnectionAbortedError)
+
+
+class SessionStats:
+    """
+    Request and connection counters, overall and per host.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hosts = {}
+
+    def count(self, host, **counters):
+        with self.lock:
+            totals = self.hosts.setdefault(host, {"requests": 0, "opened": 0, "reused": 0, "stale": 0})
+            for name, value in counters.items():
+                totals[name] += value
+
+    def snapshot(self):
+        """
+        Counters as a dict; `reuse_ratio` is the share of requests sent on an existing connection.
+        """
+        with self.lock:
+            hosts = {host: dict(totals) for host, totals in self.hosts.items()}
+        totals = {name: sum(host[name] for host in hosts.values()) for name in ("requests", "opened", "reused", "stale")}
+        totals["reuse_ratio"] = totals["reused"] / totals["requests"] if totals["requests"] else 0.0
+        totals["hosts"] = hosts
+        return totals
+
+
+class SessionResponse:
+    """
+    A response on a pooled connection. The connection goes back to the pool once the body has been
+    read to the end, and is closed instead if the response is closed or dropped before that.
+    Offers the parts of http.client.HTTPResponse and urllib's response that callers use.
+    """
+    def __init__(self, session, key, connection, response, url):
+        self.session = session
+        self.key = key
+        self.connection = connection
+        self.response = response
+        self.url = url
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = response.msg
+        if response.length == 0:
+            response.read()  # HEAD, 204 and 304 carry no body; free the connection right away
+            self.release()
+
+    def getheader(self, name, default=None):
+        return self.response.getheader(name, default)
+
+    def info(self):
+        return self.headers
+
+    def geturl(self):
+        return self.url
+
+    def read(self, amt=None):
+        data = self.response.read(amt)
+        if self.response.isclosed():
+            self.release()
+        return data
+
+    def readinto(self, buffer):
+        count = self.response.readinto(buffer)
+        if self.response.isclosed():
+            self.release()
+        return count
+
+    def close(self):
+        self.release()
+
+    def release(self):
+        connection, self.connection = self.connection, None
+        if connection is None:
+            return
+        reusable = self.response.isclosed() and not self.response.will_close
+        if not reusable:
+            connection.close()
+        self.session.release(self.key, connection if reusable else None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __del__(self):
+        self.release()
+
+
+class HttpSession:
+    """
+    Keep-alive connections shared by all threads, at most `max_per_host` open per scheme and host at a
+    time; further requests to that host wait for a free connection. With `http2=True` requests go over
+    HTTP/2 through httpx when it is installed with h2 support, and over HTTP/1.1 otherwise.
+    """
+    def __init__(self, max_per_host=DEFAULT_MAX_PER_HOST, timeout=DEFAULT_TIMEOUT, http2=False):
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.idle = {}  # (scheme, netloc) -> idle connections
+        self.slots = {}  # (scheme, netloc) -> semaphore of max_per_host
+        self.stats = SessionStats()
+        self.http2 = Http2Client(timeout) if http2 and Http2Client.available() else None
+
+    def request(self, method, url, headers=None, body=None, timeout=None):
+        """
+        Send a request and return a SessionResponse, following redirects. Read the body to the end or
+        close the response to give the connection back.
+        """
+        if self.http2 is not None:
+            return self.http2.request(method, url, headers, body, timeout, self.stats)
+        for _ in range(MAX_REDIRECTS + 1):
+            response = self.send(method, url, headers or {}, body, timeout)
+            if response.status not in REDIRECT_STATUSES:
+                return response
+            response.read()
+            url = urljoin(url, response.getheader("Location"))
+            if response.status == 303 or response.status in (301, 302) and method == "POST":
+                method, body = "GET", None
+        raise OSError(f"Too many redirects for {url}")
+
+    def send(self, method, url, headers, body, timeout):
+        import http.client  # Deferred with ssl so importing the engine stays cheap at startup
+
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        self.slot(key).acquire()
+        connection = None
+        try:
+            connection, reused = self.connection(key)
+            while True:
+                try:
+                    if timeout is not None and timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                        connection.timeout = timeout
+                        if connection.sock is not None:
+                            connection.sock.settimeout(timeout)
+                    connection.request(method, path, body=body, headers=headers)
+                    response = connection.getresponse()
+                    break
+                except (http.client.RemoteDisconnected, *STALE_ERRORS):
+                    connection.close()
+                    if not reused:
+                        raise
+                    # The server dropped the idle connection; retry once on a fresh one
+                    self.stats.count(parts.netloc, stale=1)
+                    connection, reused = self.new_connection(key), False
+        except BaseException:
+            if connection is not None:
+                connection.close()
+            self.slot(key).release()
+            raise
+        self.stats.count(parts.netloc, requests=1)
+        return SessionResponse(self, key, connection, response, url)
+
+    def slot(self, key):
+        with self.lock:
+            slot = self.slots.get(key)
+            if slot is None:
+                slot = self.slots[key] = threading.BoundedSemaphore(self.max_per_host)
+            return slot
+
+    def connection(self, key):
+        """
+        Return (connection, reused) for key, preferring the most recently returned idle connection.
+        """
+        with self.lock:
+            idle = self.idle.get(key)
+            if idle:
+                self.stats.count(key[1], reused=1)
+                return idle.pop(), True
+        return self.new_connection(key), False
+
+    def new_connection(self, key):
+        import http.client
+
+        scheme, netloc = key
+        cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        self.stats.count(netloc, opened=1)
+        return cls(netloc, timeout=self.timeout)
+
+    def release(self, key, connection=None):
+        """
+        Give a connection slot back, with the connection to keep alive or None if it was closed.
+        """
+        if connection is not None:
+            with self.lock:
+                self.idle.setdefault(key, []).append(connection)
+        self.slot(key).release()
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+        if self.http2 is not None:
+            self.http2.close()
+
+
+class Http2Response:
+    """
+    An httpx streaming response behind the same interface as SessionResponse.
+    """
+    def __init__(self, response):
+        self.response = response
+        self.status = response.status_code
+        self.reason = response.reason_phrase
+        self.headers = response.headers
+        self.url = str(response.url)
+        self.chunks = response.iter_raw()
+        self.buffer = b""
+
+    def getheader(self, name, default=None):
+        return self.headers.get(name, default)
+
+    def info(self):
+        return self.headers
+
+    def geturl(self):
+        return self.url
+
+    def read(self, amt=None):
+        while amt is None or len(self.buffer) < amt:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                self.close()
+                break
+            self.buffer += chunk
+        data, self.buffer = (self.buffer, b"") if amt is None else (self.buffer[:amt], self.buffer[amt:])
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        self.response.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class Http2Client:
+    """
+    HTTP/2 through httpx, which multiplexes every request to a host over a single connection.
+    httpx does not say when it opens one, so the first request to an origin counts as opening its
+    connection and every later one as reusing it; a connection httpx silently reopens is missed.
+    """
+    def __init__(self, timeout):
+        import httpx
+
+        self.client = httpx.Client(http2=True, timeout=timeout, follow_redirects=True)
+        self.lock = threading.Lock()
+        self.origins = set()
+
+    @staticmethod
+    def available():
+        try:
+            import h2  # noqa: F401
+            import httpx  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def request(self, method, url, headers, body, timeout, stats):
+        request = self.client.build_request(method, url, headers=headers, content=body,
+                                            timeout=timeout if isinstance(timeout, (int, float)) else self.client.timeout)
+        response = self.client.send(request, stream=True)
+        parts = urlsplit(url)
+        with self.lock:
+            opened = (parts.scheme, parts.netloc) not in self.origins
+            self.origins.add((parts.scheme, parts.netloc))
+        stats.count(parts.netloc, requests=1, opened=int(opened), reused=int(not opened))
+        return Http2Response(response)
+
+    def close(self):
+        self.client.close()
+
+
+# Session used for pytubefix's requests once route_pytubefix() has been called
+pytubefix_session = None
+
+
+def route_pytubefix(session):
+    """
+    Send pytubefix's requests (metadata, captions, its own stream downloads) through session.
+    pytubefix is patched right away if it is loaded already, or else by patch_pytubefix() when
+    ytdl first imports it, so calling this at startup does not load pytubefix.
+    """
+    global pytubefix_session
+    pytubefix_session = session
+    if "pytubefix.request" in sys.modules:
+        patch_pytubefix()
+
+
+def patch_pytubefix():
+    """
+    Replace pytubefix.request._execute_request (urlopen) with a call into the routed session.
+    """
+    session = pytubefix_session
+    if session is None:
+        return
+    from pytubefix import request
+
+    if getattr(request._execute_request, "session", None) is session:
+        return
+
+    def execute_request(url, method=None, headers=None, data=None, timeout=socket._GLOBAL_DEFAULT_TIMEOUT):
+        from urllib.error import HTTPError
+
+        base_headers = {"User-Agent": "Mozilla/5.0", "accept-language": "en-US,en"}
+        base_headers.update(headers or {})
+        if data and not isinstance(data, bytes):
+            data = json.dumps(data).encode("utf-8")
+        if not url.lower().startswith("http"):
+            raise ValueError("Invalid URL")
+        response = session.request(method or ("POST" if data else "GET"), url, base_headers, data, timeout)
+        if response.status >= 400:
+            body = response.read()
+            raise HTTPError(url, response.status, response.reason, response.headers, io.BytesIO(body))
+        return response
+
+    execute_request.session = session
+    request._execute_request = execute_request
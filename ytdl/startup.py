@@ -0,0 +1,122 @@
+"""
+Cold start instrumentation.
+With --startup-report on the command line (or YTDL_STARTUP_REPORT=1) every import is timed and a
+report of the slowest modules and the time-to-first-frame is printed once the window is up.
+Also prewarms heavy modules on a background thread so the first lookup does not pay for them.
+"""
+
+import importlib.abc
+import os
+import sys
+import threading
+import time
+
+REPORT_FLAG = "--startup-report"
+REPORT_ENV = "YTDL_STARTUP_REPORT"
+REPORT_TOP = 15
+
+started_at = None
+marks = []  # (label, seconds since start)
+import_times = {}  # module name -> inclusive import seconds
+enabled = False
+
+
+class TimingLoader:
+    """
+    Wraps a module loader and records how long executing the module took, including its own imports.
+    """
+    def __init__(self, loader):
+        self.loader = loader
+
+    def __getattr__(self, name):
+        return getattr(self.loader, name)
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        begin = time.perf_counter()
+        try:
+            self.loader.exec_module(module)
+        finally:
+            import_times[module.__name__] = time.perf_counter() - begin
+
+
+class TimingFinder(importlib.abc.MetaPathFinder):
+    """
+    Meta path hook that delegates to the regular finders and wraps the loader they return.
+    """
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = TimingLoader(spec.loader)
+                return spec
+        return None
+
+
+def begin():
+    """
+    Call first thing in a script. Installs the import timer when the report was requested.
+    """
+    global started_at, enabled
+    started_at = time.perf_counter()
+    enabled = REPORT_FLAG in sys.argv or os.environ.get(REPORT_ENV) == "1"
+    if REPORT_FLAG in sys.argv:
+        sys.argv.remove(REPORT_FLAG)
+    if enabled:
+        sys.meta_path.insert(0, TimingFinder())
+
+
+def mark(label):
+    if started_at is not None:
+        marks.append((label, time.perf_counter() - started_at))
+
+
+def first_frame(app, prewarm_modules=(), then=None):
+    """
+    Record time-to-first-frame once Tk has drawn the window, print the report if enabled and only
+    then start prewarming, so background imports never compete with the first paint.
+    `then()` runs on the Tk thread right after, for other work that should wait for the window.
+    """
+    def drawn():
+        mark("first frame")
+        if enabled:
+            print_report()
+        if prewarm_modules:
+            prewarm(prewarm_modules)
+        if then is not None:
+            then()
+
+    app.after_idle(drawn)
+
+
+def prewarm(modules):
+    """
+    Import modules on a daemon thread so the UI thread never waits for them.
+    """
+    def run():
+        for name in modules:
+            begin_import = time.perf_counter()
+            try:
+                __import__(name)
+            except ImportError:
+                continue
+            if enabled:
+                print(f"[startup] prewarmed {name} in {(time.perf_counter() - begin_import) * 1000:.0f} ms",
+                      file=sys.stderr, flush=True)
+
+    threading.Thread(target=run, name="prewarm", daemon=True).start()
+
+
+def print_report(stream=None):
+    stream = stream or sys.stderr
+    print("[startup] slowest imports (inclusive):", file=stream)
+    for name, seconds in sorted(import_times.items(), key=lambda item: item[1], reverse=True)[:REPORT_TOP]:
+        print(f"[startup]   {seconds * 1000:8.1f} ms  {name}", file=stream)
+    for label, seconds in marks:
+        print(f"[startup] {label}: {seconds * 1000:.0f} ms", file=stream)
+    stream.flush()
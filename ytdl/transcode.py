@@ -0,0 +1,82 @@
+"""
+Audio post-processing.
+Transcodes downloaded audio-only streams (webm/opus or mp4a) into real MP3, Opus or AAC files.
+Each conversion runs ffmpeg from a worker of a process pool sized to the CPU count, so a batch of
+audio extractions scales across cores without holding up download workers or the Tk loop.
+"""
+
+import os
+import subprocess
+import threading
+from ytdl.mux import MuxError, find_ffmpeg
+
+# Target format -> (ffmpeg encoder, file extension)
+AUDIO_FORMATS = {
+    "mp3": ("libmp3lame", "mp3"),
+    "opus": ("libopus", "opus"),
+    "aac": ("aac", "m4a"),
+}
+DEFAULT_BITRATE = "192k"
+
+
+def output_path_for(file_path, audio_format):
+    """
+    Give file_path the extension of the target format, e.g. audio.mp3 -> audio.opus.
+    """
+    return f"{os.path.splitext(file_path)[0]}.{AUDIO_FORMATS[audio_format][1]}"
+
+
+def transcode_file(source_path, output_path, audio_format="mp3", bitrate=DEFAULT_BITRATE, ffmpeg=None, keep_source=False):
+    """
+    Convert source_path to output_path with ffmpeg. Runs inside a pool worker, so it only takes
+    picklable arguments. The output is written to a temp file and renamed once complete.
+    """
+    encoder, extension = AUDIO_FORMATS[audio_format]
+    temp_path = output_path + ".part"
+    command = [
+        ffmpeg or find_ffmpeg(), "-y", "-loglevel", "error", "-i", source_path,
+        "-vn", "-c:a", encoder, "-b:a", bitrate, "-threads", "1",
+        "-f", "ipod" if extension == "m4a" else extension, temp_path,
+    ]
+    result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise MuxError(f"ffmpeg failed ({result.returncode}): {result.stderr.decode(errors='replace').strip()}")
+    os.replace(temp_path, output_path)
+    if not keep_source:
+        os.remove(source_path)
+    return output_path
+
+
+class Transcoder:
+    """
+    Process pool running transcode_file. submit() returns a concurrent.futures.Future.
+    """
+    def __init__(self, audio_format="mp3", bitrate=DEFAULT_BITRATE, max_workers=None):
+        self.audio_format = audio_format
+        self.bitrate = bitrate
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.executor = None
+        self.lock = threading.Lock()
+
+    def available(self):
+        try:
+            find_ffmpeg()
+            return True
+        except MuxError:
+            return False
+
+    def submit(self, source_path, output_path):
+        # Start the worker processes on first use, not at app startup
+        with self.lock:
+            if self.executor is None:
+                from concurrent.futures import ProcessPoolExecutor
+
+                self.executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self.executor.submit(transcode_file, source_path, output_path, self.audio_format, self.bitrate, find_ffmpeg())
+
+    def shutdown(self):
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=False, cancel_futures=True)